@@ -1,6 +1,9 @@
 # ecg_app/admin.py
 from django.contrib import admin
-from .models import ECGRecord, UserProfile
+from .models import ECGRecord, UserProfile, CachedPrediction, TrainingSession, UserECGStats
 
 admin.site.register(ECGRecord)
-admin.site.register(UserProfile)
\ No newline at end of file
+admin.site.register(UserProfile)
+admin.site.register(CachedPrediction)
+admin.site.register(TrainingSession)
+admin.site.register(UserECGStats)
\ No newline at end of file
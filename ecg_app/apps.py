@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 class EcgAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'ecg_app'
\ No newline at end of file
+    name = 'ecg_app'
+    
+    def ready(self):
+        # Connects the signal handlers that maintain UserECGStats
+        from . import stats  # noqa: F401
\ No newline at end of file
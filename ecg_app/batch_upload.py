@@ -0,0 +1,110 @@
+# batch_upload.py
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .forms import validate_ecg_file
+from .inference_queue import apply_prediction, inference_queue
+from .ml_model import ecg_model
+from .models import ECGRecord
+from .prediction_cache import hash_upload, prediction_cache
+from .stats import count_created_records
+
+logger = logging.getLogger(__name__)
+
+
+def process_batch_upload(user, files, notes='', chunk_size=None):
+    """Analyse many uploaded ECG files in bounded-size chunks.
+
+    Each chunk is validated, answered from the prediction cache where it can
+    be, its remaining files run through the served model as one batch, and
+    stored with a single bulk insert. Returns one outcome dict per
+    file, in upload order.
+    """
+    chunk_size = chunk_size or settings.ML_CONFIG.get('BATCH_UPLOAD_CHUNK_SIZE', 32)
+    outcomes = []
+    for start in range(0, len(files), chunk_size):
+        outcomes.extend(_process_chunk(user, files[start:start + chunk_size], notes))
+    return outcomes
+
+
+def summarize_outcomes(outcomes):
+    summary = {'total': len(outcomes), 'completed': 0, 'pending': 0, 'failed': 0, 'rejected': 0}
+    for outcome in outcomes:
+        summary[outcome['status']] += 1
+    return summary
+
+
+def _process_chunk(user, files, notes):
+    outcomes = [None] * len(files)
+
+    valid = []
+    for idx, uploaded_file in enumerate(files):
+        try:
+            validate_ecg_file(uploaded_file)
+            valid.append(idx)
+        except ValidationError as e:
+            outcomes[idx] = {'filename': uploaded_file.name, 'status': 'rejected', 'error': ' '.join(e.messages)}
+
+    if not valid:
+        return outcomes
+
+    hashes = {idx: hash_upload(files[idx]) for idx in valid}
+    # idx -> prediction, or the error of an unreadable image; files left out are queued
+    predictions = {}
+    try:
+        if not ecg_model.load_model():
+            raise ValueError("Model could not be loaded")
+        model_version = ecg_model.model_version
+
+        # Re-uploads of already analysed scans are answered from the cache
+        cached = prediction_cache.get_many([hashes[idx] for idx in valid], model_version)
+        for idx in valid:
+            if hashes[idx] in cached:
+                predictions[idx] = cached[hashes[idx]]
+        misses = [idx for idx in valid if idx not in predictions]
+        if misses:
+            results = ecg_model.predict_batch([files[idx] for idx in misses])
+            for idx, result in zip(misses, results):
+                predictions[idx] = result
+                if not isinstance(result, Exception):
+                    prediction_cache.set(hashes[idx], model_version, result)
+    except Exception as e:
+        # Model unavailable: store the files and let the inference workers retry them
+        queued = len(valid) - len(predictions)
+        logger.warning(f"Batch prediction unavailable, queueing {queued} ECGs: {str(e)}")
+
+    records = []
+    for idx in valid:
+        uploaded_file = files[idx]
+        if isinstance(predictions.get(idx), Exception):
+            outcomes[idx] = {'filename': uploaded_file.name, 'status': 'failed', 'error': 'Could not read image'}
+            continue
+
+        record = ECGRecord(user=user, notes=notes, content_hash=hashes[idx])
+        record.image.save(uploaded_file.name, uploaded_file, save=False)
+        if idx in predictions:
+            apply_prediction(record, predictions[idx])
+        else:
+            record.status = 'pending'
+        records.append((idx, record))
+
+    with transaction.atomic():
+        ECGRecord.objects.bulk_create([record for _, record in records])
+        # bulk_create sends no post_save: count the new records in the same transaction
+        count_created_records([record for _, record in records])
+
+    for idx, record in records:
+        if record.status == 'pending':
+            inference_queue.submit(record.id)
+        outcomes[idx] = {
+            'filename': files[idx].name,
+            'status': record.status,
+            'record_id': record.id,
+            'predicted_category': record.predicted_category or None,
+            'confidence': record.confidence,
+        }
+
+    return outcomes
@@ -0,0 +1,121 @@
+# batching.py
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collects concurrent requests and serves them with a single batched call.
+
+    ``batch_fn`` receives a list of items and must return a list of the same
+    length. An entry may be an Exception instance, which is raised only for
+    the caller that submitted the matching item. With ``num_threads`` > 1
+    several batches can be in flight at once, e.g. one per inference process.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=10, name='ecg-batcher', num_threads=1):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0, max_wait_ms) / 1000.0
+        self.name = name
+        self.num_threads = max(1, int(num_threads))
+        self.requests = queue.Queue()
+        self.threads = []
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        # Counters for monitoring
+        self.batches_run = 0
+        self.items_served = 0
+
+    @property
+    def is_running(self):
+        return any(thread.is_alive() for thread in self.threads)
+
+    def start(self):
+        with self._lock:
+            if not self.is_running:
+                self.threads = [
+                    threading.Thread(target=self._run, name=f'{self.name}-{i}', daemon=True)
+                    for i in range(self.num_threads)
+                ]
+                for thread in self.threads:
+                    thread.start()
+
+    def submit(self, item):
+        """Queue an item and return a Future for its result"""
+        if not self.is_running:
+            self.start()
+        future = Future()
+        self.requests.put((item, future))
+        return future
+
+    def predict(self, item, timeout=None):
+        """Submit an item and block until its result is ready"""
+        return self.submit(item).result(timeout=timeout)
+
+    def predict_many(self, items, timeout=None):
+        """Submit several items at once and wait for all of them.
+
+        Returns one result per item; a failed item gets its Exception
+        instead of raising, so one bad item does not hide the others.
+        """
+        futures = [self.submit(item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(timeout=timeout))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def stats(self):
+        return {
+            'batches_run': self.batches_run,
+            'items_served': self.items_served,
+            'avg_batch_size': self.items_served / self.batches_run if self.batches_run else 0.0,
+            'queued': self.requests.qsize(),
+        }
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the wait expires"""
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"Batch function returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                logger.error(f"Batched call failed: {str(e)}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+            with self._stats_lock:
+                self.batches_run += 1
+                self.items_served += len(items)
@@ -0,0 +1,259 @@
+# dataset_cache.py
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .preprocessing import ECGPreprocessor, preprocessor, preprocessor_for
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+SHARD_PATTERN = 'shard-{:05d}.npy'
+
+
+class CachedImages:
+    """Decoded images selected from the cache shards, in a caller-given order.
+
+    Batches are read straight out of the memory-mapped shards: a run of
+    consecutive rows in one shard is returned as a view, without a copy.
+    """
+
+    def __init__(self, shards, locations, labels, paths, missing=None):
+        self.shards = shards
+        self.locations = locations
+        self.labels = labels
+        self.paths = paths
+        # (index, path) pairs of requested images that are not in the cache
+        self.missing = missing or []
+
+    def __len__(self):
+        return len(self.paths)
+
+    def get_batch(self, indices):
+        """Batch of the given positions; a view when they are contiguous in one shard"""
+        indices = np.asarray(indices)
+        if not len(indices):
+            shard = next(iter(self.shards.values()))
+            return np.empty((0,) + shard.shape[1:], dtype=shard.dtype)
+        locations = self.locations[indices]
+        shard_id, first_row = locations[0]
+        if ((locations[:, 0] == shard_id).all()
+                and (locations[:, 1] == np.arange(first_row, first_row + len(indices))).all()):
+            return self.shards[shard_id][first_row:first_row + len(indices)]
+        shard = self.shards[shard_id]
+        batch = np.empty((len(indices),) + shard.shape[1:], dtype=shard.dtype)
+        for i, (shard_id, row) in enumerate(locations):
+            batch[i] = self.shards[shard_id][row]
+        return batch
+
+    def iter_batches(self, batch_size=32):
+        """Yield ``(uint8 batch, labels)`` in order, splitting batches at shard boundaries"""
+        start = 0
+        while start < len(self):
+            stop = min(start + batch_size, len(self))
+            shard_id, row = self.locations[start]
+            # Stop the batch where the run of consecutive rows ends, so it stays a view
+            run = self.locations[start:stop]
+            contiguous = (run[:, 0] == shard_id) & (run[:, 1] == row + np.arange(len(run)))
+            if not contiguous.all():
+                stop = start + max(1, int(np.argmin(contiguous)))
+            yield self.get_batch(np.arange(start, stop)), self.labels[start:stop]
+            start = stop
+
+
+class DatasetCache:
+    """Decoded, resized uint8 images stored in memory-mapped .npy shards.
+
+    An index maps every source path to its shard row together with the
+    file's size and mtime, so a refresh only decodes new or changed files.
+    Subclasses store other per-image arrays by overriding ``row_shape``,
+    ``dtype``, ``cache_key`` and ``_fill_shard``.
+    """
+
+    dtype = np.uint8
+
+    def __init__(self, cache_dir=None, image_size=None, shard_size=None):
+        config = settings.ML_CONFIG
+        self.cache_dir = Path(cache_dir or config.get('DATASET_CACHE_DIR', settings.BASE_DIR / 'dataset_cache'))
+        self.preprocessor = ECGPreprocessor(image_size) if image_size else preprocessor
+        self.shard_size = shard_size or config.get('DATASET_CACHE_SHARD_SIZE', 1024)
+        self._lock = threading.Lock()
+        self._shards = {}
+
+    @property
+    def row_shape(self):
+        return self.preprocessor.input_shape
+
+    @property
+    def cache_key(self):
+        """Identifies how rows are computed; an index with another key is discarded"""
+        return None
+
+    @property
+    def index_path(self):
+        return self.cache_dir / INDEX_FILE
+
+    def shard_path(self, shard_id):
+        return self.cache_dir / SHARD_PATTERN.format(shard_id)
+
+    def _empty_index(self):
+        return {'row_shape': list(self.row_shape), 'key': self.cache_key, 'next_shard': 0, 'entries': {}}
+
+    def load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return self._empty_index()
+        if index.get('row_shape') != list(self.row_shape) or index.get('key') != self.cache_key:
+            # Cached at another resolution or by another model: start over
+            return self._empty_index()
+        return index
+
+    def _save_index(self, index):
+        tmp_path = self.index_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self, paths, labels, workers=None, rebuild=False):
+        """Bring the cache up to date with the given files.
+
+        Only files that are new or whose size/mtime changed are decoded;
+        unreadable files are remembered too, so they are not retried until
+        they change.
+        Entries of deleted files are dropped and shards without live rows
+        are removed. Returns counts of added, updated, unchanged, removed
+        and failed files.
+        """
+        with self._lock:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            index = self._empty_index() if rebuild else self.load_index()
+            entries = index['entries']
+            stats = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+
+            todo = []
+            for path, label in zip(paths, labels):
+                path = os.path.abspath(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    stats['failed'] += 1
+                    continue
+                entry = entries.get(path)
+                if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                    entry['label'] = label
+                    stats['unchanged'] += 1
+                    continue
+                stats['updated' if entry else 'added'] += 1
+                todo.append((path, label, stat))
+
+            for path in [path for path in entries if not os.path.exists(path)]:
+                del entries[path]
+                stats['removed'] += 1
+
+            for start in range(0, len(todo), self.shard_size):
+                stats['failed'] += self._write_shard(index, todo[start:start + self.shard_size], workers)
+
+            self._save_index(index)
+            self._remove_unused_shards(index)
+            self._shards = {}
+
+        logger.info(f"Dataset cache refreshed: {stats}")
+        return stats
+
+    def _write_shard(self, index, items, workers):
+        """Fill a new shard for items and point their index entries at it"""
+        shard_id = index['next_shard']
+        index['next_shard'] += 1
+        shard = np.lib.format.open_memmap(
+            self.shard_path(shard_id), mode='w+', dtype=self.dtype,
+            shape=(len(items),) + tuple(self.row_shape)
+        )
+        decoded = self._fill_shard([item[0] for item in items], shard, workers)
+        shard.flush()
+        del shard
+
+        failed = 0
+        for row, ((path, label, stat), ok) in enumerate(zip(items, decoded)):
+            failed += not ok
+            index['entries'][path] = {
+                'shard': shard_id if ok else None,
+                'row': row,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'label': label,
+            }
+        return failed
+
+    def _fill_shard(self, paths, shard, workers):
+        """Write one row per path into ``shard``; returns a success flag per path"""
+        def decode(row):
+            try:
+                self.preprocessor.decode_into(paths[row], shard[row])
+                return True
+            except Exception as e:
+                logger.warning(f"Skipping {paths[row]}: {str(e)}")
+                return False
+
+        # OpenCV releases the GIL while decoding and resizing
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            return list(executor.map(decode, range(len(paths))))
+
+    def _remove_unused_shards(self, index):
+        live = {entry['shard'] for entry in index['entries'].values() if entry['shard'] is not None}
+        for shard_file in self.cache_dir.glob('shard-*.npy'):
+            if int(shard_file.stem.split('-')[1]) not in live:
+                shard_file.unlink()
+
+    def _shard(self, shard_id):
+        if shard_id not in self._shards:
+            self._shards[shard_id] = np.load(self.shard_path(shard_id), mmap_mode='r')
+        return self._shards[shard_id]
+
+    def select(self, paths, labels=None):
+        """Look up cached images for ``paths``; uncached ones are listed in ``missing``"""
+        entries = self.load_index()['entries']
+        found, locations, found_labels, missing = [], [], [], []
+        for idx, path in enumerate(paths):
+            entry = entries.get(os.path.abspath(path))
+            if entry is None or entry['shard'] is None:
+                missing.append((idx, path))
+                continue
+            found.append(path)
+            locations.append((entry['shard'], entry['row']))
+            found_labels.append(labels[idx] if labels is not None else entry['label'])
+
+        with self._lock:
+            shards = {shard_id: self._shard(shard_id) for shard_id in {loc[0] for loc in locations}}
+        return CachedImages(
+            shards,
+            np.asarray(locations, dtype=np.int64).reshape(-1, 2),
+            found_labels,
+            found,
+            missing,
+        )
+
+
+# Shared instance
+dataset_cache = DatasetCache()
+
+_sized_caches = {}
+
+
+def dataset_cache_for(input_shape):
+    """Shared cache for a model input shape; other resolutions get their own subdirectory"""
+    engine = preprocessor_for(input_shape)
+    if engine is preprocessor:
+        return dataset_cache
+    width, height = engine.image_size
+    if (width, height) not in _sized_caches:
+        _sized_caches[(width, height)] = DatasetCache(
+            dataset_cache.cache_dir / f'{width}x{height}', image_size=(width, height))
+    return _sized_caches[(width, height)]
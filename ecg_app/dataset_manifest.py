@@ -0,0 +1,202 @@
+# dataset_manifest.py
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+from .datasets import scan_dataset_files
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def inspect_image(path):
+    """Integrity record of one image file: size, mtime, content hash, dimensions and whether it decodes"""
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    record = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'width': None,
+        'height': None,
+        'decodes': False,
+        'error': None,
+    }
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED) if data else None
+    if img is None:
+        record['error'] = 'Could not decode image' if data else 'Empty file'
+    else:
+        record['height'], record['width'] = img.shape[:2]
+        record['decodes'] = True
+    return record
+
+
+class DatasetManifest:
+    """Per-file integrity index of a dataset directory, kept in one JSON file.
+
+    Entries are keyed by path relative to the dataset root and hold the
+    class label, byte size, mtime, SHA-256, image dimensions and whether the
+    file decodes. refresh() only inspects new or changed files.
+    """
+
+    def __init__(self, dataset_path=None, manifest_path=None):
+        config = settings.ML_CONFIG
+        self.dataset_path = Path(os.path.abspath(dataset_path or config['DATASET_PATH']))
+        if manifest_path is None:
+            if self.dataset_path == Path(os.path.abspath(config['DATASET_PATH'])):
+                manifest_path = config.get('DATASET_MANIFEST_PATH', settings.BASE_DIR / 'dataset_manifest.json')
+            else:
+                manifest_path = self.dataset_path / 'manifest.json'
+        self.manifest_path = Path(manifest_path)
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return self.manifest_path.exists()
+
+    def load(self):
+        """The manifest contents, or an empty manifest if it is missing, unreadable or for another directory"""
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return self._empty()
+        if manifest.get('version') != MANIFEST_VERSION or manifest.get('dataset_path') != str(self.dataset_path):
+            return self._empty()
+        return manifest
+
+    def _empty(self):
+        return {'version': MANIFEST_VERSION, 'dataset_path': str(self.dataset_path), 'updated_at': None, 'entries': {}}
+
+    def _save(self, manifest):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def refresh(self, workers=None, rebuild=False):
+        """Scan the class folders and inspect new or changed files in parallel.
+
+        Returns counts of added, updated, unchanged, removed and corrupt files.
+        """
+        with self._lock:
+            manifest = self._empty() if rebuild else self.load()
+            entries = manifest['entries']
+            stats = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'corrupt': 0}
+
+            paths, labels = scan_dataset_files(self.dataset_path)
+            current = {}
+            todo = []
+            for path, label in zip(paths, labels):
+                key = os.path.relpath(path, self.dataset_path)
+                current[key] = label
+                entry = entries.get(key)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                    entry['label'] = label
+                    stats['unchanged'] += 1
+                    continue
+                stats['updated' if entry else 'added'] += 1
+                todo.append(key)
+
+            for key in [key for key in entries if key not in current]:
+                del entries[key]
+                stats['removed'] += 1
+
+            def inspect(key):
+                try:
+                    return key, inspect_image(self.dataset_path / key)
+                except OSError:
+                    return key, None
+
+            # Hashing and OpenCV decoding both release the GIL
+            with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+                for key, record in executor.map(inspect, todo):
+                    if record is None:
+                        entries.pop(key, None)
+                        continue
+                    record['label'] = current[key]
+                    entries[key] = record
+
+            stats['corrupt'] = sum(not entry['decodes'] for entry in entries.values())
+            manifest['updated_at'] = datetime.now().isoformat(timespec='seconds')
+            self._save(manifest)
+
+        logger.info(f"Dataset manifest refreshed: {stats}")
+        return stats
+
+    def files(self):
+        """Paths and labels of the indexed files that decode, in class-folder order"""
+        entries = self.load()['entries']
+        folder_order = {folder: idx for idx, folder in enumerate(settings.ML_CONFIG['DATASET_FOLDERS'])}
+
+        def order(key):
+            folder, _, name = key.partition(os.sep)
+            return folder_order.get(folder, len(folder_order)), name
+
+        paths, labels = [], []
+        for key in sorted(entries, key=order):
+            entry = entries[key]
+            if entry['decodes']:
+                paths.append(str(self.dataset_path / key))
+                labels.append(entry['label'])
+        return paths, labels
+
+    def check(self):
+        """Whether the dataset can be trained on, and a list of issues found in the manifest.
+
+        Missing or empty class folders make the dataset not ready; files that
+        do not decode and identical images filed under different classes are
+        reported without blocking training (they are left out / kept as is).
+        """
+        config = settings.ML_CONFIG
+        issues = []
+        if not self.dataset_path.is_dir():
+            return False, [f"Dataset directory not found: {self.dataset_path}"]
+        if not self.exists():
+            return False, [f"Dataset is not indexed yet: run the index_dataset command ({self.manifest_path})"]
+
+        entries = self.load()['entries']
+        ready = True
+        readable = {}
+        for entry in entries.values():
+            if entry['decodes']:
+                readable[entry['label']] = readable.get(entry['label'], 0) + 1
+        for folder in config['DATASET_FOLDERS']:
+            label = config['FOLDER_TO_CLASS'][folder]
+            if not (self.dataset_path / folder).is_dir():
+                issues.append(f"Class folder missing: {folder}")
+                ready = False
+            elif not readable.get(label):
+                issues.append(f"No readable images for class '{label}' in {folder}")
+                ready = False
+
+        corrupt = sorted(key for key, entry in entries.items() if not entry['decodes'])
+        if corrupt:
+            issues.append(f"{len(corrupt)} files do not decode and will be skipped, e.g. {corrupt[0]}")
+
+        labels_by_hash = {}
+        for key, entry in entries.items():
+            labels_by_hash.setdefault(entry['sha256'], set()).add(entry['label'])
+        conflicting = sum(len(labels) > 1 for labels in labels_by_hash.values())
+        if conflicting:
+            issues.append(f"{conflicting} identical images are filed under more than one class")
+
+        return ready, issues
+
+
+dataset_manifest = DatasetManifest()
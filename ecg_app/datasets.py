@@ -0,0 +1,149 @@
+# datasets.py
+import os
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .preprocessing import ECGPreprocessor, preprocessor
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff'}
+
+
+def list_dataset_files(dataset_path=None):
+    """Image paths and class labels of the dataset.
+
+    Read from the dataset manifest (index_dataset) when one covers the
+    directory, leaving out files that do not decode; otherwise the class
+    folders are walked.
+    """
+    from .dataset_manifest import DatasetManifest
+
+    manifest = DatasetManifest(dataset_path)
+    if manifest.exists():
+        paths, labels = manifest.files()
+        if paths:
+            return paths, labels
+    return scan_dataset_files(dataset_path)
+
+
+def scan_dataset_files(dataset_path=None):
+    """Image paths and class labels found in the configured class folders"""
+    config = settings.ML_CONFIG
+    root = Path(dataset_path or config['DATASET_PATH'])
+
+    paths = []
+    labels = []
+    for folder in config['DATASET_FOLDERS']:
+        folder_path = root / folder
+        if not folder_path.is_dir():
+            continue
+        label = config['FOLDER_TO_CLASS'][folder]
+        for entry in sorted(os.scandir(folder_path), key=lambda e: e.name):
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(entry.path)
+                labels.append(label)
+    return paths, labels
+
+
+def split_dataset(paths, labels, val_fraction=None, test_fraction=None, seed=42):
+    """Stratified train/validation/test split of file paths.
+
+    Returns ``X_train, X_val, X_test, y_train, y_val, y_test`` as lists.
+    """
+    config = settings.ML_CONFIG
+    val_fraction = config.get('VALIDATION_SPLIT', 0.15) if val_fraction is None else val_fraction
+    test_fraction = config.get('TEST_SPLIT', 0.15) if test_fraction is None else test_fraction
+
+    rng = np.random.default_rng(seed)
+    labels_array = np.asarray(labels)
+    splits = {'train': [], 'val': [], 'test': []}
+    for label in sorted(set(labels)):
+        indices = rng.permutation(np.flatnonzero(labels_array == label))
+        n_test = int(round(len(indices) * test_fraction))
+        n_val = int(round(len(indices) * val_fraction))
+        splits['test'].extend(indices[:n_test])
+        splits['val'].extend(indices[n_test:n_test + n_val])
+        splits['train'].extend(indices[n_test + n_val:])
+
+    result = []
+    for name in ('train', 'val', 'test'):
+        result.append([paths[i] for i in splits[name]])
+    for name in ('train', 'val', 'test'):
+        result.append([labels[i] for i in splits[name]])
+    return tuple(result)
+
+
+def build_dataset(paths, labels, class_names, batch_size=32, shuffle=False, seed=None,
+                  image_size=None, shuffle_buffer=None):
+    """Stream (image, one-hot label) batches from disk with tf.data.
+
+    Only file paths are held in memory: images are decoded in parallel by the
+    shared ECGPreprocessor, so training sees exactly the tensors serving does,
+    then batched, normalized to float32 and prefetched.
+    """
+    import tensorflow as tf
+
+    engine = ECGPreprocessor(image_size) if image_size else preprocessor
+    input_shape = engine.input_shape
+    num_classes = len(class_names)
+    label_ids = np.asarray([class_names.index(label) for label in labels], dtype=np.int32)
+
+    def decode(path):
+        image = np.empty(input_shape, dtype=np.uint8)
+        return engine.decode_into(path.decode(), image)
+
+    def load(path, label_id):
+        image = tf.numpy_function(decode, [path], tf.uint8)
+        image.set_shape(input_shape)
+        return image, tf.one_hot(label_id, num_classes)
+
+    def normalize(images, one_hot):
+        # Same float32 scaling as ECGPreprocessor.normalize
+        return tf.cast(images, tf.float32) * np.float32(1.0 / 255.0), one_hot
+
+    dataset = tf.data.Dataset.from_tensor_slices((list(map(str, paths)), label_ids))
+    if shuffle:
+        # Shuffling paths is cheap, so the buffer can cover the whole dataset
+        buffer_size = shuffle_buffer or settings.ML_CONFIG.get('SHUFFLE_BUFFER', 10000)
+        dataset = dataset.shuffle(min(len(paths), buffer_size) or 1, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+    dataset = dataset.ignore_errors(log_warning=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(normalize, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def build_cached_dataset(images, class_names, batch_size=32, shuffle=False, seed=None):
+    """Stream (features, one-hot label) batches out of DatasetCache shards.
+
+    ``images`` is a CachedImages selection. Batches are gathered from the
+    memory-mapped shards and cast to float32 on the fly, skipping decode
+    entirely; uint8 images are also normalized to [0, 1].
+    """
+    import tensorflow as tf
+
+    first_shard = next(iter(images.shards.values()), None)
+    input_shape = first_shard.shape[1:] if first_shard is not None else (0, 0, 3)
+    dtype = first_shard.dtype if first_shard is not None else np.dtype(np.uint8)
+    scale = np.float32(1.0 / 255.0) if dtype == np.uint8 else np.float32(1.0)
+    num_classes = len(class_names)
+    label_ids = np.asarray([class_names.index(label) for label in images.labels], dtype=np.int32)
+
+    def gather(indices):
+        # Sorted reads keep the memory-mapped pages sequential
+        indices = np.sort(indices)
+        return np.ascontiguousarray(images.get_batch(indices)), label_ids[indices]
+
+    def load(indices):
+        batch, batch_labels = tf.numpy_function(gather, [indices], [tf.as_dtype(dtype), tf.int32])
+        batch.set_shape((None,) + tuple(input_shape))
+        batch_labels.set_shape((None,))
+        return tf.cast(batch, tf.float32) * scale, tf.one_hot(batch_labels, num_classes)
+
+    dataset = tf.data.Dataset.from_tensor_slices(np.arange(len(images), dtype=np.int64))
+    if shuffle:
+        dataset = dataset.shuffle(len(images) or 1, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,102 @@
+# embedding_cache.py
+import hashlib
+import logging
+import shutil
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .dataset_cache import DatasetCache
+from .preprocessing import ECGPreprocessor
+
+logger = logging.getLogger(__name__)
+
+
+def split_model(model):
+    """Split a Sequential CNN at its Flatten layer into (backbone layers, head layers)"""
+    import tensorflow as tf
+
+    for idx, layer in enumerate(model.layers):
+        if isinstance(layer, tf.keras.layers.Flatten):
+            return model.layers[:idx + 1], model.layers[idx + 1:]
+    raise ValueError("Model has no Flatten layer to split the backbone from the head at")
+
+
+def build_backbone(model):
+    """Frozen feature extractor: the model's layers up to and including Flatten"""
+    import tensorflow as tf
+
+    backbone_layers, _ = split_model(model)
+    backbone = tf.keras.Sequential(
+        [tf.keras.layers.Input(shape=model.input_shape[1:])] + backbone_layers,
+        name='backbone'
+    )
+    backbone.trainable = False
+    return backbone
+
+
+def backbone_fingerprint(backbone):
+    """Hash of the backbone's architecture and weights, used to key its embeddings"""
+    digest = hashlib.sha256()
+    for layer in backbone.layers:
+        digest.update(type(layer).__name__.encode())
+        for weights in layer.get_weights():
+            digest.update(str(weights.shape).encode())
+            digest.update(np.ascontiguousarray(weights).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class EmbeddingCache(DatasetCache):
+    """Frozen-backbone features of the dataset images, as float16 shards.
+
+    Rows are keyed by source path, size and mtime like DatasetCache, and the
+    whole cache lives in a directory named after the backbone fingerprint,
+    so changing the backbone weights starts a fresh cache.
+    """
+
+    dtype = np.float16
+
+    def __init__(self, backbone, cache_dir=None, batch_size=32):
+        self.backbone = backbone
+        self.fingerprint = backbone_fingerprint(backbone)
+        self.root = Path(cache_dir or settings.ML_CONFIG.get(
+            'EMBEDDING_CACHE_DIR', settings.BASE_DIR / 'embedding_cache'))
+        self.batch_size = batch_size
+        height, width = backbone.input_shape[1:3]
+        super().__init__(self.root / self.fingerprint)
+        if self.preprocessor.input_shape != (height, width, 3):
+            self.preprocessor = ECGPreprocessor((width, height))
+
+    @property
+    def row_shape(self):
+        return tuple(self.backbone.output_shape[1:])
+
+    @property
+    def cache_key(self):
+        return self.fingerprint
+
+    def refresh(self, paths, labels, workers=None, rebuild=False):
+        """Compute embeddings of new or changed images; drops caches of other backbones"""
+        if self.root.is_dir():
+            for other in self.root.iterdir():
+                if other.is_dir() and other.name != self.fingerprint:
+                    shutil.rmtree(other, ignore_errors=True)
+        return super().refresh(paths, labels, workers=workers, rebuild=rebuild)
+
+    def _fill_shard(self, paths, shard, workers):
+        ok = [False] * len(paths)
+        buffer = np.empty((self.batch_size,) + self.preprocessor.input_shape, dtype=np.float32)
+        for start in range(0, len(paths), self.batch_size):
+            chunk = paths[start:start + self.batch_size]
+            batch, failed = self.preprocessor.preprocess_batch(chunk, out=buffer, skip_errors=True)
+            failed_indices = {idx for idx, _ in failed}
+            for idx, error in failed:
+                logger.warning(f"Skipping {chunk[idx]}: {error}")
+            if not len(batch):
+                continue
+            rows = [start + idx for idx in range(len(chunk)) if idx not in failed_indices]
+            shard[rows] = self.backbone(batch, training=False).numpy().astype(np.float16)
+            for row in rows:
+                ok[row] = True
+        return ok
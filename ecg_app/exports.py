@@ -0,0 +1,146 @@
+# exports.py
+# Streaming exports of a user's ECG history: rows are read from the database in
+# chunks and encoded chunk by chunk, so memory stays bounded for any history size
+import csv
+import importlib.util
+import io
+import itertools
+import json
+import os
+import zlib
+from collections import namedtuple
+
+EXPORT_CHUNK_SIZE = 2000
+# Columns read from ECGRecord, in export order ('image' is exported as the file name)
+EXPORT_FIELDS = ('id', 'upload_date', 'image', 'predicted_category', 'confidence', 'status', 'notes')
+EXPORT_COLUMNS = ('id', 'upload_date', 'filename', 'predicted_category', 'confidence', 'status', 'notes')
+CSV_HEADER = ['ID', 'Date', 'Filename', 'Prediction', 'Confidence', 'Status', 'Notes']
+
+ExportFormat = namedtuple('ExportFormat', 'content_type extension writer')
+
+
+def parquet_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def export_rows(records, chunk_size=EXPORT_CHUNK_SIZE):
+    """Export tuples of ``records`` (ordered by the caller), fetched ``chunk_size`` rows at a time"""
+    rows = records.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    for record_id, upload_date, image, category, confidence, status, notes in rows:
+        yield record_id, upload_date, os.path.basename(image), category, confidence, status, notes or ''
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, size)):
+        yield batch
+
+
+def csv_chunks(rows, chunk_size=EXPORT_CHUNK_SIZE, compress=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for batch in _batches(rows, chunk_size):
+        writer.writerows(
+            [record_id, upload_date.strftime('%Y-%m-%d %H:%M:%S'), filename, category,
+             f"{confidence}%" if confidence is not None else "", status, notes]
+            for record_id, upload_date, filename, category, confidence, status, notes in batch
+        )
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header of an empty export
+        yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunks(rows, chunk_size=EXPORT_CHUNK_SIZE, compress=False):
+    """One JSON object per line"""
+    for batch in _batches(rows, chunk_size):
+        lines = []
+        for row in batch:
+            values = dict(zip(EXPORT_COLUMNS, row))
+            values['upload_date'] = values['upload_date'].isoformat()
+            lines.append(json.dumps(values))
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _ChunkSink:
+    """Write-only file object whose written bytes are handed over by drain()"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_chunks(rows, chunk_size=EXPORT_CHUNK_SIZE, compress=False):
+    """A Parquet file with one row group per chunk; ``compress`` selects gzip column compression"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('upload_date', pa.timestamp('us', tz='UTC')),
+        ('filename', pa.string()),
+        ('predicted_category', pa.string()),
+        ('confidence', pa.float64()),
+        ('status', pa.string()),
+        ('notes', pa.string()),
+    ])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression='gzip' if compress else 'snappy') as writer:
+        for batch in _batches(rows, chunk_size):
+            columns = list(zip(*batch))
+            writer.write_table(pa.table(dict(zip(EXPORT_COLUMNS, columns)), schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+EXPORT_FORMATS = {
+    'csv': ExportFormat('text/csv', 'csv', csv_chunks),
+    'ndjson': ExportFormat('application/x-ndjson', 'ndjson', ndjson_chunks),
+    'parquet': ExportFormat('application/vnd.apache.parquet', 'parquet', parquet_chunks),
+}
+
+
+def stream_export(records, export_format='csv', compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """Encode ``records`` lazily: returns ``(byte chunk iterator, content type, file name)``.
+
+    ``compress`` gzips CSV and NDJSON output; Parquet compresses its
+    columns with gzip instead and stays a plain .parquet file.
+    """
+    spec = EXPORT_FORMATS[export_format]
+    chunks = spec.writer(export_rows(records, chunk_size), chunk_size, compress)
+    filename = f'ecg_history.{spec.extension}'
+    if compress and export_format != 'parquet':
+        return gzip_chunks(chunks), 'application/gzip', filename + '.gz'
+    return chunks, spec.content_type, filename
@@ -1,9 +1,25 @@
 # forms.py - CORRECTED with 'image' field
+import os
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 from .models import ECGRecord
 
+MAX_ECG_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+VALID_ECG_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.pdf']
+
+def validate_ecg_file(image):
+    """Check size and extension of an uploaded ECG file"""
+    # Check file size (10MB limit)
+    if image.size > MAX_ECG_FILE_SIZE:
+        raise forms.ValidationError(f'File size must be under {MAX_ECG_FILE_SIZE/1024/1024}MB')
+    
+    # Check file extension
+    ext = os.path.splitext(image.name)[1].lower()
+    if ext not in VALID_ECG_EXTENSIONS:
+        raise forms.ValidationError(f'Unsupported file format. Supported formats: {", ".join(VALID_ECG_EXTENSIONS)}')
+    return image
+
 class UserRegisterForm(UserCreationForm):
     email = forms.EmailField(
         required=True,
@@ -98,16 +114,51 @@ class ECGUploadForm(forms.ModelForm):
     def clean_image(self):
         image = self.cleaned_data.get('image')
         if image:
-            # Check file size (10MB limit)
-            max_size = 10 * 1024 * 1024  # 10MB
-            if image.size > max_size:
-                raise forms.ValidationError(f'File size must be under {max_size/1024/1024}MB')
-            
-            # Check file extension
-            valid_extensions = ['.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.pdf']
-            import os
-            ext = os.path.splitext(image.name)[1].lower()
-            if ext not in valid_extensions:
-                raise forms.ValidationError(f'Unsupported file format. Supported formats: {", ".join(valid_extensions)}')
+            validate_ecg_file(image)
         
-        return image
\ No newline at end of file
+        return image
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+class MultipleFileField(forms.FileField):
+    """File field that returns a list of uploaded files.
+    
+    Files are not validated individually here so that one bad file does not
+    reject the whole batch; the view reports problems per file.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput())
+        super().__init__(*args, **kwargs)
+    
+    def clean(self, data, initial=None):
+        files = [f for f in (data if isinstance(data, (list, tuple)) else [data]) if f]
+        if self.required and not files:
+            raise forms.ValidationError(self.error_messages['required'], code='required')
+        return files
+
+class ECGBatchUploadForm(forms.Form):
+    images = MultipleFileField(
+        widget=MultipleFileInput(attrs={
+            'class': 'form-control',
+            'accept': 'image/*',
+        })
+    )
+    notes = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={
+            'class': 'form-control',
+            'rows': 3,
+            'placeholder': 'Optional notes applied to every ECG in this batch...'
+        })
+    )
+    
+    def __init__(self, *args, max_files=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_files = max_files
+    
+    def clean_images(self):
+        images = self.cleaned_data.get('images', [])
+        if self.max_files and len(images) > self.max_files:
+            raise forms.ValidationError(f'Please upload at most {self.max_files} files at once')
+        return images
\ No newline at end of file
@@ -0,0 +1,120 @@
+# history.py
+import base64
+from datetime import timedelta
+
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import ECGRecord
+from .stats import day_start, get_user_stats
+
+HISTORY_PAGE_SIZE = 10
+MAX_HISTORY_PAGE_SIZE = 100
+FILTER_PARAMS = ('status', 'category', 'start_date', 'end_date')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def parse_day(value):
+    """A YYYY-MM-DD query parameter as a date, None if missing or invalid"""
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+def active_filters(params):
+    """The history filters set in a request's query parameters"""
+    return {key: params[key] for key in FILTER_PARAMS if params.get(key) and params[key] != 'all'}
+
+
+def filter_history(user, params):
+    """A user's records narrowed by the status, category and date range filters of the history page"""
+    records = ECGRecord.objects.filter(user=user)
+    if params.get('status', 'all') != 'all':
+        records = records.filter(status=params['status'])
+    if params.get('category', 'all') != 'all':
+        records = records.filter(predicted_category=params['category'])
+
+    # Ranges on upload_date rather than upload_date__date, so the indexes apply
+    start_date = parse_day(params.get('start_date'))
+    end_date = parse_day(params.get('end_date'))
+    if start_date:
+        records = records.filter(upload_date__gte=day_start(start_date))
+    if end_date:
+        records = records.filter(upload_date__lt=day_start(end_date + timedelta(days=1)))
+    return records
+
+
+def encode_cursor(record):
+    """Opaque cursor pointing just past ``record`` in newest-first order"""
+    value = f'{record.upload_date.isoformat()}|{record.pk}'
+    return base64.urlsafe_b64encode(value.encode()).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """The ``(upload_date, id)`` key of a cursor; raises InvalidCursor"""
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        upload_date, record_id = value.rsplit('|', 1)
+        upload_date = parse_datetime(upload_date)
+        record_id = int(record_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    if upload_date is None:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    return upload_date, record_id
+
+
+def history_page(records, cursor=None, size=HISTORY_PAGE_SIZE):
+    """One page of ``records`` newest first, and the cursor of the next page (None on the last).
+
+    Keyset pagination on (upload_date, id): a page reads the index from
+    where the previous one stopped, so every page costs the same however
+    deep it is, and no COUNT is needed to know whether more follow.
+    """
+    records = records.order_by('-upload_date', '-id')
+    if cursor:
+        upload_date, record_id = decode_cursor(cursor)
+        # The plain range lets the index seek; the OR only breaks timestamp ties
+        records = records.filter(upload_date__lte=upload_date).filter(
+            Q(upload_date__lt=upload_date) | Q(id__lt=record_id))
+    page = list(records[:size + 1])
+    if len(page) > size:
+        return page[:size], encode_cursor(page[size - 1])
+    return page, None
+
+
+def history_stats(user, records):
+    """Header statistics of the history page: the filtered count and the user's counters"""
+    stats = get_user_stats(user, activity_days=0)
+    return {
+        'total_records': records.count(),
+        'completed_count': stats['by_status']['completed'],
+        'processing_count': stats['by_status']['processing'],
+        'failed_count': stats['by_status']['failed'],
+        'avg_confidence': stats['avg_confidence'],
+        'category_counts': stats['by_category'],
+        'most_common_category': stats['most_common_category'],
+        'this_month_count': stats['this_month'],
+    }
+
+
+def record_json(record):
+    return {
+        'id': record.id,
+        'upload_date': record.upload_date,
+        'status': record.status,
+        'predicted_category': record.predicted_category,
+        'confidence': record.confidence,
+        'probabilities': {
+            'normal': record.normal_prob,
+            'abnormal': record.abnormal_prob,
+            'mi': record.mi_prob,
+            'post_mi': record.post_mi_prob,
+        },
+        'result_url': reverse('ecg_result', args=[record.id]),
+    }
@@ -0,0 +1,191 @@
+# inference_backends.py
+import logging
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# File extension used by each backend, next to the Keras .h5 model
+BACKEND_EXTENSIONS = {
+    'keras': '.h5',
+    'tflite': '.tflite',
+    'onnx': '.onnx',
+}
+
+
+def backend_model_path(model_path, backend):
+    """Path of the exported model file for a backend"""
+    if backend == 'keras':
+        return str(model_path)
+    return os.path.splitext(str(model_path))[0] + BACKEND_EXTENSIONS[backend]
+
+
+class KerasBackend:
+    """Serves the Keras model directly (needs the full TensorFlow stack)"""
+    name = 'keras'
+
+    def __init__(self, model_path=None, model=None):
+        if model is None:
+            from tensorflow.keras.models import load_model
+            model = load_model(str(model_path), compile=False)
+        self.model = model
+
+    @property
+    def input_shape(self):
+        return tuple(self.model.input_shape[1:])
+
+    def predict(self, batch):
+        # Calling the model directly avoids predict()'s per-call setup for small batches
+        if len(batch) <= 32:
+            return self.model(batch, training=False).numpy()
+        return self.model.predict(batch, verbose=0)
+
+
+class TFLiteBackend:
+    """Serves a TensorFlow Lite export, preferring the small tflite_runtime package"""
+    name = 'tflite'
+
+    def __init__(self, model_path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self.interpreter = Interpreter(
+            model_path=str(model_path),
+            num_threads=settings.ML_CONFIG.get('INFERENCE_THREADS') or os.cpu_count(),
+        )
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self.batch_size = int(self.input_detail['shape'][0])
+        # The interpreter holds mutable tensor state and is not thread-safe
+        self._lock = threading.Lock()
+
+    @property
+    def input_shape(self):
+        return tuple(int(dim) for dim in self.input_detail['shape'][1:])
+
+    def _resize(self, batch_size):
+        index = self.input_detail['index']
+        shape = [batch_size] + list(self.input_shape)
+        self.interpreter.resize_tensor_input(index, shape)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self.batch_size = batch_size
+
+    def predict(self, batch):
+        with self._lock:
+            if len(batch) != self.batch_size:
+                self._resize(len(batch))
+
+            dtype = self.input_detail['dtype']
+            if dtype != np.float32:
+                # Fully integer-quantized model: quantize the normalized input
+                scale, zero_point = self.input_detail['quantization']
+                batch = np.round(batch / scale + zero_point).astype(dtype)
+
+            self.interpreter.set_tensor(self.input_detail['index'], batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output_detail['index'])
+
+            if output.dtype != np.float32:
+                scale, zero_point = self.output_detail['quantization']
+                output = (output.astype(np.float32) - zero_point) * scale
+            return output
+
+
+class ONNXBackend:
+    """Serves an ONNX export with ONNX Runtime on the CPU"""
+    name = 'onnx'
+
+    def __init__(self, model_path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        threads = settings.ML_CONFIG.get('INFERENCE_THREADS')
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            str(model_path), sess_options=options, providers=['CPUExecutionProvider']
+        )
+        self.input = self.session.get_inputs()[0]
+
+    @property
+    def input_shape(self):
+        return tuple(self.input.shape[1:])
+
+    def predict(self, batch):
+        return self.session.run(None, {self.input.name: batch})[0]
+
+
+BACKENDS = {
+    'keras': KerasBackend,
+    'tflite': TFLiteBackend,
+    'onnx': ONNXBackend,
+}
+
+
+_keras_hashes = {}
+
+
+def _keras_file_sha256(model_path):
+    """SHA-256 of the Keras model file, recomputed only when its size or mtime changes"""
+    from .ml_model import file_sha256
+
+    stat = os.stat(model_path)
+    key = (str(model_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _keras_hashes:
+        _keras_hashes.clear()
+        _keras_hashes[key] = file_sha256(model_path)
+    return _keras_hashes[key]
+
+
+def export_is_current(model_path, backend):
+    """Whether the backend's export was made from the Keras model now at ``model_path``"""
+    from .ml_model import read_model_metadata
+
+    export = ((read_model_metadata(model_path) or {}).get('exports') or {}).get(backend) or {}
+    try:
+        return bool(export.get('keras_file_sha256')) and export['keras_file_sha256'] == _keras_file_sha256(model_path)
+    except OSError:
+        return False
+
+
+def resolve_backend(model_path, backend=None, warn=True):
+    """The backend that will actually serve a Keras model path, and the file it loads.
+
+    Falls back to Keras when the lightweight export has not been created yet,
+    or was made from an older .h5 (e.g. before a retrain or promotion).
+    """
+    backend = backend or settings.ML_CONFIG.get('INFERENCE_BACKEND', 'keras')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    if backend == 'keras':
+        return backend, str(model_path)
+
+    path = backend_model_path(model_path, backend)
+    if not os.path.exists(path):
+        if warn:
+            logger.warning(f"{path} not found, falling back to the Keras backend")
+        return 'keras', str(model_path)
+    if os.path.exists(model_path) and not export_is_current(model_path, backend):
+        if warn:
+            logger.warning(f"{path} was not exported from the current {model_path}, falling back to the "
+                       f"Keras backend; re-run export_ecg_model")
+        return 'keras', str(model_path)
+    return backend, path
+
+
+def load_backend(model_path, backend=None):
+    """Load the inference backend resolve_backend() picks for a Keras model path"""
+    backend, path = resolve_backend(model_path, backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model file not found: {path}")
+
+    logger.info(f"Loading {backend} inference backend from {path}")
+    return BACKENDS[backend](path)
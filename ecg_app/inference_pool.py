@@ -0,0 +1,303 @@
+# inference_pool.py
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from .preprocessing import preprocessor_for
+
+logger = logging.getLogger(__name__)
+
+
+def limit_cpu_threads(threads):
+    """Cap the math-library thread pools of this process.
+
+    Must run before TensorFlow/ONNX Runtime is imported, so that worker
+    processes together do not oversubscribe the cores.
+    """
+    for name in ('OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[name] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+
+
+def _worker_main(model_path, backend, threads, conn):
+    """Entry point of an inference process: owns one copy of the model"""
+    limit_cpu_threads(threads)
+
+    import django
+    django.setup()
+    from django.conf import settings
+    from .inference_backends import load_backend
+
+    settings.ML_CONFIG['INFERENCE_THREADS'] = threads
+    try:
+        model = load_backend(model_path, backend)
+        model.predict(np.zeros((1,) + preprocessor_for(model.input_shape).input_shape, dtype=np.float32))
+    except Exception as e:
+        conn.send(('error', None, f"Could not load model: {str(e)}"))
+        return
+    conn.send(('ready', None, None))
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        task_id, shm_name, shape = task
+        shm = batch = None
+        try:
+            shm = shared_memory.SharedMemory(name=shm_name)
+            # View the caller's batch in place; nothing is copied or pickled
+            batch = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            probabilities = np.asarray(model.predict(batch), dtype=np.float32)
+            conn.send(('result', task_id, probabilities))
+        except Exception as e:
+            conn.send(('failed', task_id, str(e)))
+        finally:
+            # The buffer can only be released once no array views it any more
+            batch = None
+            if shm is not None:
+                shm.close()
+
+
+class _Worker:
+    """An inference process, the pipe it is fed through and the tasks it holds"""
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.ready = False
+        self.reported = False
+        self.tasks = set()
+
+
+class ProcessInferencePool:
+    """Inference worker processes fed through shared-memory input batches.
+
+    The web process decodes images straight into a shared-memory buffer and
+    sends only its name and shape to a worker; workers send back the small
+    probability matrix. Each worker has its own pipe, so the pool knows
+    which tasks a worker held when it dies: those fail, the worker is
+    replaced, and callers fail fast once no worker is left.
+    """
+
+    # Seconds the dispatcher waits for a message before checking on the workers
+    poll_interval = 1.0
+
+    def __init__(self, model_path, num_workers=None, backend=None, timeout=60, input_shape=None):
+        self.model_path = str(model_path)
+        self.backend = backend
+        # Input shape of the model, from its metadata; decides the resize done here
+        self.preprocessor = preprocessor_for(input_shape)
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+        self.timeout = timeout
+
+        self.context = multiprocessing.get_context('spawn')
+        # One slot per worker; None once a worker that never loaded its model is dropped
+        self.workers = []
+        self.pending = {}
+        self.ready_workers = 0
+        self.errors = []
+        self._ready = threading.Event()
+        self._task_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._dispatcher = None
+
+    @property
+    def is_running(self):
+        """True while every worker process is alive"""
+        return bool(self.workers) and all(
+            worker is not None and worker.process.is_alive() for worker in self.workers)
+
+    def _spawn(self, slot):
+        conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=_worker_main,
+            args=(self.model_path, self.backend, self.threads_per_worker, child_conn),
+            name=f'ecg-inference-process-{slot}',
+            daemon=True,
+        )
+        process.start()
+        # Only the worker keeps its end open, so its death reads as EOF here
+        child_conn.close()
+        return _Worker(process, conn)
+
+    def start(self):
+        if self.workers:
+            return
+        if self._dispatcher is not None:
+            # The dispatcher of a stopped pool exits within one poll interval
+            self._dispatcher.join()
+        with self._lock:
+            if self.workers:
+                return
+            self.ready_workers = 0
+            self.errors = []
+            self._ready.clear()
+            self.workers = [self._spawn(slot) for slot in range(self.num_workers)]
+            self._dispatcher = threading.Thread(target=self._dispatch, name='ecg-inference-dispatch', daemon=True)
+            self._dispatcher.start()
+            logger.info(f"Started {self.num_workers} inference processes "
+                        f"({self.threads_per_worker} threads each)")
+
+    def wait_until_ready(self, timeout=None):
+        """Block until every worker has loaded its model. Returns False on timeout or error."""
+        return self._ready.wait(timeout) and not self.errors
+
+    def stop(self):
+        with self._lock:
+            workers = [worker for worker in self.workers if worker is not None]
+            self.workers = []
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout=5)
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        for worker in workers:
+            worker.conn.close()
+
+    def predict(self, images):
+        """Preprocess images into shared memory and run them on a worker process.
+
+        Returns ``(probabilities, failed)``: one probability row per readable
+        image in input order, plus ``(index, error)`` pairs for unreadable ones.
+        """
+        if not self.workers and not self.errors:
+            self.start()
+        if not self.workers:
+            raise RuntimeError(f"No inference process left: {'; '.join(self.errors)}")
+
+        shape = (len(images),) + self.preprocessor.input_shape
+        shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 4))
+        buffer = batch = None
+        try:
+            buffer = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            batch, failed = self.preprocessor.preprocess_batch(images, out=buffer, skip_errors=True)
+            count = len(batch)
+            buffer = batch = None
+            if not count:
+                return np.empty((0, 0), dtype=np.float32), failed
+
+            future = Future()
+            task_id = next(self._task_ids)
+            with self._lock:
+                workers = [worker for worker in self.workers if worker is not None]
+                if not workers:
+                    raise RuntimeError("No inference process left")
+                # The least busy worker that has loaded its model, if any has yet
+                worker = min(workers, key=lambda worker: (not worker.ready, len(worker.tasks)))
+                self.pending[task_id] = future
+                worker.tasks.add(task_id)
+                worker.conn.send((task_id, shm.name, (count,) + self.preprocessor.input_shape))
+            try:
+                return future.result(timeout=self.timeout), failed
+            finally:
+                with self._lock:
+                    self.pending.pop(task_id, None)
+                    worker.tasks.discard(task_id)
+        finally:
+            buffer = batch = None
+            shm.close()
+            shm.unlink()
+
+    def _dispatch(self):
+        """Route worker messages back to the waiting callers, and watch for dead workers"""
+        while True:
+            with self._lock:
+                workers = [worker for worker in self.workers if worker is not None]
+            if not workers:
+                break
+            wait([worker.conn for worker in workers] + [worker.process.sentinel for worker in workers],
+                 timeout=self.poll_interval)
+            for worker in workers:
+                self._receive(worker)
+            self._check_workers()
+
+    def _receive(self, worker):
+        try:
+            while worker.conn.poll():
+                self._handle(worker, *worker.conn.recv())
+        except (EOFError, OSError):
+            # The worker has exited; _check_workers deals with it
+            pass
+
+    def _handle(self, worker, kind, task_id, payload):
+        with self._lock:
+            if kind in ('ready', 'error'):
+                if kind == 'error':
+                    logger.error(f"Inference process {worker.process.pid}: {payload}")
+                    self.errors.append(payload)
+                worker.ready = kind == 'ready'
+                worker.reported = True
+                self.ready_workers += 1
+                if self.ready_workers >= self.num_workers:
+                    self._ready.set()
+                return
+            worker.tasks.discard(task_id)
+            future = self.pending.get(task_id)
+        if future is None or future.done():
+            return
+        if kind == 'result':
+            future.set_result(payload)
+        else:
+            future.set_exception(RuntimeError(payload))
+
+    def _check_workers(self):
+        """Fail the tasks of dead workers and replace the ones that had loaded their model.
+
+        A worker that died while loading would only die again, so its slot
+        is dropped; once no worker is left every pending task fails.
+        """
+        for slot, worker in enumerate(list(self.workers)):
+            if worker is None or worker.process.is_alive():
+                continue
+            # Whatever it sent before exiting is still in the pipe
+            self._receive(worker)
+            with self._lock:
+                if slot >= len(self.workers) or self.workers[slot] is not worker:
+                    # Stopped meanwhile
+                    continue
+                error = f"Inference process {worker.process.pid} exited with code {worker.process.exitcode}"
+                for task_id in worker.tasks:
+                    self._fail(task_id, error)
+                worker.tasks.clear()
+                worker.conn.close()
+
+                if worker.ready:
+                    logger.error(f"{error}, restarting it")
+                    # Counted again once the replacement has loaded its model
+                    self.ready_workers -= 1
+                    self.workers[slot] = self._spawn(slot)
+                    continue
+                if not worker.reported:
+                    logger.error(f"{error} while loading the model")
+                    self.errors.append(f"{error} while loading the model")
+                    self.ready_workers += 1
+                    if self.ready_workers >= self.num_workers:
+                        self._ready.set()
+                self.workers[slot] = None
+
+                if not any(self.workers):
+                    logger.error("No inference process left")
+                    self.workers = []
+                    for task_id in list(self.pending):
+                        self._fail(task_id, "No inference process left")
+                    self._ready.set()
+
+    def _fail(self, task_id, error):
+        future = self.pending.get(task_id)
+        if future is not None and not future.done():
+            future.set_exception(RuntimeError(error))
@@ -0,0 +1,150 @@
+# inference_queue.py
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .ml_model import ecg_model
+from .models import ECGRecord
+from .prediction_cache import prediction_cache
+from .stats import apply_record_changes, record_state
+
+logger = logging.getLogger(__name__)
+
+
+def apply_prediction(record, result):
+    """Copy a prediction result onto an ECGRecord (does not save)"""
+    probabilities = result.get('all_probabilities', {})
+    record.predicted_category = result['predicted_class']
+    record.confidence = result['confidence'] * 100
+    record.normal_prob = probabilities.get('normal', 0.0)
+    record.abnormal_prob = probabilities.get('abnormal', 0.0)
+    record.mi_prob = probabilities.get('mi', 0.0)
+    record.post_mi_prob = probabilities.get('post_mi', 0.0)
+    record.status = 'completed'
+    record.processed_date = timezone.now()
+    return record
+
+
+class InferenceQueue:
+    """Runs ECG predictions on local worker threads outside the request cycle"""
+
+    def __init__(self, num_workers=None, max_size=None, batch_size=None):
+        config = settings.ML_CONFIG
+        self.num_workers = num_workers or config.get('INFERENCE_WORKERS', 2)
+        self.max_size = max_size if max_size is not None else config.get('INFERENCE_QUEUE_SIZE', 256)
+        # Records a worker takes off the queue and predicts together
+        self.batch_size = batch_size or config.get('BATCH_MAX_SIZE', 16)
+        self.jobs = queue.Queue(maxsize=self.max_size)
+        self.workers = []
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self):
+        return any(worker.is_alive() for worker in self.workers)
+
+    def start(self):
+        """Start the worker threads and pick up records left pending"""
+        with self._lock:
+            if self.is_running:
+                return
+            self.workers = [
+                threading.Thread(target=self._worker_loop, name=f'ecg-inference-{i}', daemon=True)
+                for i in range(self.num_workers)
+            ]
+            for worker in self.workers:
+                worker.start()
+            logger.info(f"Started {self.num_workers} inference workers")
+        self.requeue_pending()
+
+    def submit(self, record_id):
+        """Enqueue a record for prediction. Returns False if the queue is full."""
+        if not self.is_running:
+            self.start()
+        try:
+            self.jobs.put_nowait(record_id)
+            return True
+        except queue.Full:
+            logger.warning(f"Inference queue full, rejecting ECG #{record_id}")
+            return False
+
+    def requeue_pending(self):
+        """Enqueue records that were left pending, e.g. by a restarted worker"""
+        pending_ids = ECGRecord.objects.filter(status='pending').values_list('id', flat=True)
+        for record_id in pending_ids:
+            try:
+                self.jobs.put_nowait(record_id)
+            except queue.Full:
+                break
+
+    def _worker_loop(self):
+        while True:
+            record_ids = self._next_batch()
+            try:
+                self.process_batch(record_ids)
+            except Exception:
+                logger.exception(f"Inference job for ECGs {record_ids} crashed")
+            finally:
+                close_old_connections()
+                for _ in record_ids:
+                    self.jobs.task_done()
+
+    def _next_batch(self):
+        """Block for one record id, then take whatever else is queued, up to batch_size"""
+        record_ids = [self.jobs.get()]
+        while len(record_ids) < self.batch_size:
+            try:
+                record_ids.append(self.jobs.get_nowait())
+            except queue.Empty:
+                break
+        return record_ids
+
+    def _claim(self, record_id):
+        """Move a pending record to processing; None if another worker got it first"""
+        # Claim the record atomically so that several workers never process it twice
+        with transaction.atomic():
+            claimed = ECGRecord.objects.filter(id=record_id, status='pending').update(status='processing')
+            if not claimed:
+                return None
+            record = ECGRecord.objects.get(id=record_id)
+            # The claim bypasses save(): move the record between the status counters here
+            claimed_state = record_state(record)
+            apply_record_changes([(claimed_state._replace(status='pending'), claimed_state)])
+        return record
+
+    def process(self, record_id):
+        """Run the model for a single record"""
+        self.process_batch([record_id])
+
+    def process_batch(self, record_ids):
+        """Run the model for several records, submitted to it together"""
+        records = [record for record in map(self._claim, record_ids) if record is not None]
+        if not records:
+            return
+
+        model_version = ecg_model.model_version
+        try:
+            results = ecg_model.predict_many([record.image.path for record in records])
+        except Exception as e:
+            results = [e] * len(records)
+        for record, result in zip(records, results):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                if not result:
+                    raise ValueError('Model returned no prediction')
+                apply_prediction(record, result)
+                prediction_cache.set(record.content_hash, model_version, result)
+            except Exception as e:
+                logger.error(f"Prediction failed for ECG #{record.id}: {str(e)}")
+                record.status = 'failed'
+                record.error_message = str(e) or e.__class__.__name__
+                record.processed_date = timezone.now()
+            record.save()
+
+
+# Global queue instance
+inference_queue = InferenceQueue()
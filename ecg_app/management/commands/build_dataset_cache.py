@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from ecg_app.dataset_cache import dataset_cache
+from ecg_app.datasets import list_dataset_files
+
+class Command(BaseCommand):
+    help = 'Decode the ECG dataset into the memory-mapped dataset cache (only new or changed files)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset-path',
+            default=None,
+            help='Dataset directory (defaults to ML_CONFIG DATASET_PATH)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Decode threads (defaults to the CPU count)'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Discard the existing cache and decode every file again'
+        )
+    
+    def handle(self, *args, **options):
+        paths, labels = list_dataset_files(options['dataset_path'])
+        if not paths:
+            raise CommandError('No images found in the dataset directory')
+        
+        self.stdout.write(f"Refreshing dataset cache in {dataset_cache.cache_dir} for {len(paths)} images...")
+        stats = dataset_cache.refresh(paths, labels, workers=options['workers'], rebuild=options['rebuild'])
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {stats['added']}, updated {stats['updated']}, unchanged {stats['unchanged']}, "
+            f"removed {stats['removed']}, failed {stats['failed']}"
+        ))
@@ -0,0 +1,83 @@
+import json
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+# Imports everything a web worker needs to serve a page, then reports which
+# heavy modules ended up loaded. Runs in a fresh interpreter so nothing is cached.
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'modules': sorted(sys.modules)}}))
+"""
+
+class Command(BaseCommand):
+    help = 'Check that the web process starts within its import-time budget without loading ML libraries'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-seconds',
+            type=float,
+            default=settings.WEB_IMPORT_BUDGET['MAX_SECONDS'],
+            help='Maximum time allowed to set up Django and import the URLconf'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Number of slowest imports to list'
+        )
+    
+    def handle(self, *args, **options):
+        probe = PROBE.format(settings_module=settings.SETTINGS_MODULE)
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', probe],
+            capture_output=True, text=True
+        )
+        wall_time = time.perf_counter() - start
+        
+        if result.returncode != 0:
+            raise CommandError(f"Import probe failed:\n{result.stderr[-2000:]}")
+        
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        
+        # -X importtime writes "import time: self [us] | cumulative | imported package"
+        timings = []
+        for line in result.stderr.splitlines():
+            parts = line.split('|')
+            if len(parts) == 3 and parts[1].strip().isdigit():
+                timings.append((int(parts[1]), parts[2].rstrip()))
+        
+        self.stdout.write(f"Setup + URLconf import: {report['seconds']:.3f}s (process wall time {wall_time:.3f}s)")
+        self.stdout.write(f"Slowest imports (cumulative):")
+        for cumulative, name in sorted(timings, reverse=True)[:options['top']]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f} ms  {name.strip()}")
+        
+        loaded = set(report['modules'])
+        forbidden = [
+            name for name in settings.WEB_IMPORT_BUDGET['FORBIDDEN_MODULES']
+            if name in loaded
+        ]
+        
+        problems = []
+        if forbidden:
+            problems.append(f"heavy modules imported by the web process: {', '.join(forbidden)}")
+        if report['seconds'] > options['max_seconds']:
+            problems.append(f"import time {report['seconds']:.3f}s exceeds budget of {options['max_seconds']:.3f}s")
+        
+        if problems:
+            raise CommandError('Import budget exceeded: ' + '; '.join(problems))
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Within budget ({report['seconds']:.3f}s <= {options['max_seconds']:.3f}s)"
+        ))
@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand, CommandError
+from ecg_app.datasets import list_dataset_files
+from ecg_app.ml_model import ECGModelTrainer
+from ecg_app.test_model import ECGModelTester
+
+class Command(BaseCommand):
+    help = 'Evaluate the trained ECG model and write a self-contained HTML report (runs headless)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset-path',
+            default=None,
+            help='Dataset directory (defaults to ML_CONFIG DATASET_PATH)'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Evaluate every image instead of the held-out test split'
+        )
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Report file (defaults to a timestamped file in ML_CONFIG REPORT_DIR)'
+        )
+        parser.add_argument(
+            '--use-cache',
+            action='store_true',
+            help='Read decoded images from the dataset cache, refreshing it first'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=64,
+            help='Images decoded and predicted per chunk'
+        )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=None,
+            help='Sample predictions shown in the report (defaults to ML_CONFIG REPORT_SAMPLES)'
+        )
+        parser.add_argument(
+            '--parallel',
+            type=int,
+            default=None,
+            help='Render the report figures in this many processes'
+        )
+    
+    def handle(self, *args, **options):
+        if options['all']:
+            X_test, y_test = list_dataset_files(options['dataset_path'])
+        else:
+            trainer = ECGModelTrainer(dataset_path=options['dataset_path'], use_cache=False)
+            try:
+                _, _, X_test, _, _, y_test = trainer.prepare_data()
+            except ValueError as e:
+                raise CommandError(str(e))
+        if not X_test:
+            raise CommandError('No images found in the dataset directory')
+        
+        tester = ECGModelTester()
+        if not tester.load_model():
+            raise CommandError('Could not load the trained model')
+        
+        self.stdout.write(f"Evaluating {len(X_test)} images...")
+        report = tester.generate_performance_report(
+            X_test,
+            y_test,
+            output_path=options['output'],
+            use_cache=options['use_cache'],
+            batch_size=options['batch_size'],
+            max_samples=options['samples'],
+            parallel=options['parallel']
+        )
+        if report is None:
+            raise CommandError('None of the images could be evaluated')
+        
+        for entry in report['skipped']:
+            self.stdout.write(self.style.WARNING(f"Skipped {entry['path']}: {entry['error']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Accuracy {report['overall_accuracy']:.4f} on {report['num_test_samples']} images; "
+            f"report written to {report['output_path']}"
+        ))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from ecg_app.model_export import export_model
+
+class Command(BaseCommand):
+    help = 'Export the Keras ECG model to a lightweight CPU inference runtime'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=['tflite', 'onnx'],
+            default='tflite',
+            help='Runtime to export for'
+        )
+        parser.add_argument(
+            '--quantize',
+            choices=['none', 'float16', 'int8'],
+            default='none',
+            help='Weight quantization to apply'
+        )
+        parser.add_argument(
+            '--model',
+            default=str(settings.ML_CONFIG['MODEL_PATH']),
+            help='Path of the Keras .h5 model to export'
+        )
+        parser.add_argument(
+            '--samples-dir',
+            default=str(settings.ML_CONFIG['DATASET_PATH']),
+            help='Images used for int8 calibration and the parity check'
+        )
+        parser.add_argument(
+            '--num-samples',
+            type=int,
+            default=64,
+            help='Number of sample images to use'
+        )
+    
+    def handle(self, *args, **options):
+        quantize = None if options['quantize'] == 'none' else options['quantize']
+        self.stdout.write(self.style.SUCCESS(
+            f"Exporting {options['model']} to {options['format']} (quantization: {options['quantize']})..."
+        ))
+        
+        try:
+            export_info = export_model(
+                options['model'],
+                options['format'],
+                quantize=quantize,
+                sample_dir=options['samples_dir'],
+                num_samples=options['num_samples'],
+            )
+        except Exception as e:
+            raise CommandError(f"Export failed: {str(e)}")
+        
+        parity = export_info['parity']
+        self.stdout.write(self.style.SUCCESS(f"\nExported model: {export_info['path']}"))
+        self.stdout.write(f"Size: {export_info['file_size'] / 1024 / 1024:.2f} MB")
+        self.stdout.write(f"Parity on {parity['samples']} {parity['sample_source']} samples:")
+        self.stdout.write(f"  Top-1 agreement: {parity['top1_agreement']:.2%}")
+        self.stdout.write(f"  Max probability delta: {parity['max_prob_delta']:.5f}")
+        self.stdout.write(f"  Mean probability delta: {parity['mean_prob_delta']:.5f}")
+        
+        if parity['top1_agreement'] < 0.99:
+            self.stdout.write(self.style.WARNING(
+                "Top-1 agreement is below 99%; check the export before serving it"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Set ML_CONFIG['INFERENCE_BACKEND'] = '{options['format']}' to serve this export"
+            ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from ecg_app.dataset_manifest import DatasetManifest
+
+class Command(BaseCommand):
+    help = 'Index the ECG dataset into the manifest: size, hash, dimensions and decodability of every file'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset-path',
+            default=None,
+            help='Dataset directory (defaults to ML_CONFIG DATASET_PATH)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Inspection threads (defaults to the CPU count)'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Discard the existing manifest and inspect every file again'
+        )
+    
+    def handle(self, *args, **options):
+        manifest = DatasetManifest(options['dataset_path'])
+        if not manifest.dataset_path.is_dir():
+            raise CommandError(f"Dataset directory not found: {manifest.dataset_path}")
+        
+        self.stdout.write(f"Indexing {manifest.dataset_path} into {manifest.manifest_path}...")
+        stats = manifest.refresh(workers=options['workers'], rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {stats['added']}, updated {stats['updated']}, unchanged {stats['unchanged']}, "
+            f"removed {stats['removed']}, corrupt {stats['corrupt']}"
+        ))
+        
+        ready, issues = manifest.check()
+        for issue in issues:
+            self.stdout.write(self.style.WARNING(issue))
+        if ready:
+            self.stdout.write(self.style.SUCCESS('Dataset is ready for training'))
+        else:
+            self.stdout.write(self.style.ERROR('Dataset is not ready for training'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from ecg_app.stats import check_user_stats, rebuild_all_user_stats
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user ECG counters (UserECGStats) from the ECG records, or check them'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only compare the stored counters with recomputed ones; exit with an error on differences'
+        )
+    
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = check_user_stats()
+            for user_id, field, stored, expected in mismatches:
+                if field is None:
+                    self.stdout.write(self.style.WARNING(f"User {user_id}: no counters row"))
+                else:
+                    self.stdout.write(self.style.WARNING(
+                        f"User {user_id}: {field} is {stored}, expected {expected}"
+                    ))
+            if mismatches:
+                raise CommandError(
+                    f"{len(mismatches)} counter differences found; run rebuild_user_stats to fix them"
+                )
+            self.stdout.write(self.style.SUCCESS('User stats are consistent'))
+            return
+        
+        count = rebuild_all_user_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ECG stats of {count} users"))
@@ -0,0 +1,144 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from ecg_app.ml_model import ARCHITECTURES
+from ecg_app.sweep import grid_trials, random_trials, run_sweep
+from ecg_app.training_jobs import TrainingInProgress
+
+def parse_list(value, cast):
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+class Command(BaseCommand):
+    help = 'Search ECG model hyperparameters with parallel training trials and promote the best model'
+    
+    def add_arguments(self, parser):
+        space = settings.ML_CONFIG.get('SWEEP_SPACE', {})
+        parser.add_argument(
+            '--search',
+            choices=['grid', 'random'],
+            default='grid',
+            help='Try every combination, or a random subset of them'
+        )
+        parser.add_argument(
+            '--trials',
+            type=int,
+            default=8,
+            help='Number of combinations to try with --search random'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed for --search random'
+        )
+        parser.add_argument(
+            '--epochs',
+            type=int,
+            default=20,
+            help='Maximum epochs per trial (early stopping applies)'
+        )
+        parser.add_argument(
+            '--learning-rates',
+            default=','.join(map(str, space.get('learning_rate', [1e-3]))),
+            help='Comma-separated learning rates'
+        )
+        parser.add_argument(
+            '--batch-sizes',
+            default=','.join(map(str, space.get('batch_size', [32]))),
+            help='Comma-separated batch sizes'
+        )
+        parser.add_argument(
+            '--image-sizes',
+            default=','.join(map(str, space.get('image_size', [224]))),
+            help='Comma-separated square input resolutions'
+        )
+        parser.add_argument(
+            '--architectures',
+            default=','.join(space.get('architecture', ['base'])),
+            help=f"Comma-separated architectures ({', '.join(ARCHITECTURES)})"
+        )
+        parser.add_argument(
+            '--parallel',
+            type=int,
+            default=None,
+            help='Trials run at once (defaults to CPU count / threads per trial)'
+        )
+        parser.add_argument(
+            '--threads-per-trial',
+            type=int,
+            default=None,
+            help='Math-library threads of each trial process'
+        )
+        parser.add_argument(
+            '--dataset-path',
+            default=None,
+            help='Dataset directory (defaults to ML_CONFIG DATASET_PATH)'
+        )
+        parser.add_argument(
+            '--use-cache',
+            action='store_true',
+            help='Read decoded images from the dataset cache'
+        )
+        parser.add_argument(
+            '--promote-to',
+            default=str(settings.ML_CONFIG['MODEL_PATH']),
+            help='Where the best model is installed'
+        )
+        parser.add_argument(
+            '--no-promote',
+            action='store_true',
+            help='Keep the best model in the sweep directory instead of promoting it'
+        )
+        parser.add_argument(
+            '--keep-trial-models',
+            action='store_true',
+            help='Keep every trial model file'
+        )
+    
+    def handle(self, *args, **options):
+        try:
+            space = {
+                'learning_rate': parse_list(options['learning_rates'], float),
+                'batch_size': parse_list(options['batch_sizes'], int),
+                'image_size': [[size, size] for size in parse_list(options['image_sizes'], int)],
+                'architecture': parse_list(options['architectures'], str.strip),
+            }
+        except ValueError as e:
+            raise CommandError(f"Invalid search space: {str(e)}")
+        unknown = set(space['architecture']) - set(ARCHITECTURES)
+        if unknown:
+            raise CommandError(f"Unknown architectures: {', '.join(sorted(unknown))}")
+        
+        if options['search'] == 'grid':
+            trials = grid_trials(space)
+        else:
+            trials = random_trials(space, options['trials'], options['seed'])
+        if not trials:
+            raise CommandError('The search space is empty')
+        
+        self.stdout.write(self.style.SUCCESS(f"Sweeping {len(trials)} configurations ({options['search']} search)..."))
+        try:
+            sweep = run_sweep(
+                trials,
+                epochs=options['epochs'],
+                parallel=options['parallel'],
+                threads_per_trial=options['threads_per_trial'],
+                dataset_path=options['dataset_path'],
+                use_cache=options['use_cache'],
+                promote_to=None if options['no_promote'] else options['promote_to'],
+                keep_trial_models=options['keep_trial_models'],
+                search=options['search'],
+            )
+        except TrainingInProgress as e:
+            raise CommandError(str(e))
+        
+        self.stdout.write(f"\nSweep session: {sweep.session_id}")
+        for trial in sweep.trials.order_by('id'):
+            score = min((entry.get('val_loss', entry.get('loss', float('inf'))) for entry in trial.history), default=None)
+            score_text = f"{score:.4f}" if score is not None else '-'
+            self.stdout.write(f"  {trial.status:<9} val_loss={score_text:<8} {trial.params} {trial.error_message[:80]}")
+        
+        if sweep.status != 'completed':
+            raise CommandError(f"Sweep failed: {sweep.error_message}")
+        self.stdout.write(self.style.SUCCESS(f"\n{sweep.stop_reason}"))
+        if sweep.model_path:
+            self.stdout.write(self.style.SUCCESS(f"Promoted to {sweep.model_path}"))
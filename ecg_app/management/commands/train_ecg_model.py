@@ -1,7 +1,28 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from ecg_app.ml_model import ECGModelTrainer
+from ecg_app.models import TrainingSession
+from ecg_app.training_jobs import TrainingInProgress, create_session, run_training_job
 import argparse
+import signal
+import sys
+
+METRIC_LABELS = (
+    ('accuracy', 'Accuracy'),
+    ('loss', 'Loss'),
+    ('precision', 'Precision'),
+    ('recall', 'Recall'),
+    ('f1_score', 'F1-Score'),
+)
+NO_TEST_RESULTS = 'No test results: the dataset split left no test images to evaluate on'
+
+def metric_lines(test_results, prefix='Test', keys=None):
+    """Formatted test metrics, skipping any the results do not hold"""
+    return [
+        f"{prefix} {label}: {test_results[key]:.4f}"
+        for key, label in METRIC_LABELS
+        if (keys is None or key in keys) and test_results.get(key) is not None
+    ]
 
 class Command(BaseCommand):
     help = 'Train the ECG classification model'
@@ -24,11 +45,34 @@ class Command(BaseCommand):
             action='store_true',
             help='Only test existing model without training'
         )
+        parser.add_argument(
+            '--dataset-path',
+            default=None,
+            help='Dataset directory (defaults to ML_CONFIG DATASET_PATH)'
+        )
+        parser.add_argument(
+            '--use-cache',
+            action='store_true',
+            help='Read decoded images from the dataset cache, refreshing it first'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted run from its last checkpoint'
+        )
+        parser.add_argument(
+            '--head-only',
+            action='store_true',
+            help='Retrain only the dense head of the existing model on cached backbone features'
+        )
     
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting ECG Model Training...'))
         
-        trainer = ECGModelTrainer()
+        trainer = ECGModelTrainer(
+            dataset_path=options['dataset_path'],
+            use_cache=options['use_cache'] or None
+        )
         
         if options['test_only']:
             # Test existing model
@@ -38,38 +82,57 @@ class Command(BaseCommand):
                 
                 # Load test data
                 X_train, X_val, X_test, y_train, y_val, y_test = trainer.prepare_data()
+                if not X_test:
+                    self.stdout.write(self.style.ERROR(NO_TEST_RESULTS))
+                    return
                 
                 # Evaluate
                 test_results = trainer.evaluate(X_test, y_test)
                 
-                self.stdout.write(self.style.SUCCESS(
-                    f"\nTest Accuracy: {test_results['accuracy']:.4f}"
-                ))
-                self.stdout.write(self.style.SUCCESS(
-                    f"Test Loss: {test_results['loss']:.4f}"
-                ))
+                self.stdout.write('')
+                for line in metric_lines(test_results, keys=('accuracy', 'loss')):
+                    self.stdout.write(self.style.SUCCESS(line))
                 
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f"Error: {str(e)}"))
                 
         else:
-            # Train new model
+            # Train new model, recorded as a TrainingSession
             try:
-                history, test_results = trainer.train(
+                session = create_session(
                     epochs=options['epochs'],
-                    batch_size=options['batch_size']
+                    batch_size=options['batch_size'],
+                    head_only=options['head_only']
                 )
-                
+            except TrainingInProgress as e:
+                self.stdout.write(self.style.ERROR(f"Error: {str(e)}"))
+                return
+            self.stdout.write(f"Training session: {session.session_id}")
+            
+            # Preemption sends SIGTERM: unwind so the session is closed; the checkpoint stays
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+            
+            try:
+                test_results = run_training_job(
+                    session.pk,
+                    trainer=trainer,
+                    resume=options['resume'],
+                    close_connection=False
+                )
+                session = TrainingSession.objects.get(pk=session.pk)
+                if test_results is None:
+                    raise RuntimeError(session.error_message)
                 self.stdout.write(self.style.SUCCESS('\n' + '='*50))
                 self.stdout.write(self.style.SUCCESS('TRAINING COMPLETED SUCCESSFULLY'))
                 self.stdout.write(self.style.SUCCESS('='*50))
                 
-                self.stdout.write(self.style.SUCCESS(
-                    f"\nFinal Test Accuracy: {test_results['accuracy']:.4f}"
-                ))
-                self.stdout.write(self.style.SUCCESS(
-                    f"Final Test Loss: {test_results['loss']:.4f}"
-                ))
+                self.stdout.write(self.style.SUCCESS(session.stop_reason))
+                self.stdout.write('')
+                if test_results:
+                    for line in metric_lines(test_results, prefix='Final Test', keys=('accuracy', 'loss')):
+                        self.stdout.write(self.style.SUCCESS(line))
+                else:
+                    self.stdout.write(self.style.WARNING(NO_TEST_RESULTS))
                 
                 # Save summary
                 summary_path = settings.BASE_DIR / 'training_summary.txt'
@@ -78,11 +141,9 @@ class Command(BaseCommand):
                     f.write("="*50 + "\n")
                     f.write(f"Epochs: {options['epochs']}\n")
                     f.write(f"Batch Size: {options['batch_size']}\n")
-                    f.write(f"Test Accuracy: {test_results['accuracy']:.4f}\n")
-                    f.write(f"Test Loss: {test_results['loss']:.4f}\n")
-                    f.write(f"Test Precision: {test_results['precision']:.4f}\n")
-                    f.write(f"Test Recall: {test_results['recall']:.4f}\n")
-                    f.write(f"Test F1-Score: {test_results['f1_score']:.4f}\n")
+                    f.write(f"Stopped: {session.stop_reason}\n")
+                    for line in metric_lines(test_results) or [NO_TEST_RESULTS]:
+                        f.write(line + "\n")
                 
                 self.stdout.write(self.style.SUCCESS(
                     f"\nTraining summary saved to: {summary_path}"
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-16 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecg_app', '0002_alter_ecgrecord_confidence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ecgrecord',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='CachedPrediction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('model_version', models.CharField(max_length=64)),
+                ('predicted_category', models.CharField(choices=[('normal', 'Normal ECG'), ('abnormal', 'Abnormal Heartbeat'), ('mi', 'Myocardial Infarction'), ('post_mi', 'Post MI History')], max_length=20)),
+                ('confidence', models.FloatField()),
+                ('normal_prob', models.FloatField(default=0.0)),
+                ('abnormal_prob', models.FloatField(default=0.0)),
+                ('mi_prob', models.FloatField(default=0.0)),
+                ('post_mi_prob', models.FloatField(default=0.0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('content_hash', 'model_version')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-16 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecg_app', '0004_trainingsession_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingsession',
+            name='resumed_from_epoch',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trainingsession',
+            name='stop_reason',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-16 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecg_app', '0005_trainingsession_stop_reason'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingsession',
+            name='head_only',
+            field=models.BooleanField(default=False),
+        ),
+    ]
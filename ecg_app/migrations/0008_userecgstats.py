@@ -0,0 +1,44 @@
+# Generated by Django 5.0.6 on 2026-10-16 23:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('ecg_app', '0007_trainingsession_sweep'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserECGStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ecg_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+                ('processing', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('failed', models.IntegerField(default=0)),
+                ('normal', models.IntegerField(default=0)),
+                ('abnormal', models.IntegerField(default=0)),
+                ('mi', models.IntegerField(default=0)),
+                ('post_mi', models.IntegerField(default=0)),
+                ('completed_normal', models.IntegerField(default=0)),
+                ('completed_abnormal', models.IntegerField(default=0)),
+                ('completed_mi', models.IntegerField(default=0)),
+                ('completed_post_mi', models.IntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0.0)),
+                ('confidence_count', models.IntegerField(default=0)),
+                ('last_upload_date', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_record', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ecg_app.ecgrecord')),
+            ],
+            options={
+                'verbose_name': 'User ECG Stats',
+                'verbose_name_plural': 'User ECG Stats',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-16 23:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecg_app', '0008_userecgstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ecgrecord',
+            index=models.Index(fields=['user', 'upload_date'], name='ecg_user_upload_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ecgrecord',
+            index=models.Index(fields=['user', 'status', 'upload_date'], name='ecg_user_status_upload_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ecgrecord',
+            index=models.Index(fields=['user', 'predicted_category', 'upload_date'], name='ecg_user_category_upload_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ecgrecord',
+            index=models.Index(fields=['upload_date'], name='ecg_upload_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-16 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecg_app', '0009_ecgrecord_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ecgrecord',
+            name='error_message',
+            field=models.TextField(blank=True),
+        ),
+    ]
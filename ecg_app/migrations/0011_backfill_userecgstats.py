@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-17 09:12
+
+from django.db import migrations
+
+
+def backfill_user_stats(apps, schema_editor):
+    # Counters of records stored before 0008 created the table; the aggregate
+    # queries only read ECGRecord columns that exist as of this migration
+    from ecg_app.stats import rebuild_all_user_stats
+    rebuild_all_user_stats()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecg_app', '0010_ecgrecord_error_message'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_user_stats, migrations.RunPython.noop),
+    ]
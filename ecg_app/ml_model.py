@@ -1,165 +1,346 @@
 # ml_model.py
+# TensorFlow is imported inside the methods that need it, so that web requests,
+# migrations and management commands that never run the model start fast.
 import os
+import json
+import hashlib
+import threading
+import time
 import numpy as np
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import img_to_array, load_img
-import tensorflow as tf
 from django.conf import settings
+from django.utils import timezone
 import logging
 
+from .batching import MicroBatcher
+from .dataset_cache import dataset_cache_for
+from .dataset_manifest import DatasetManifest
+from .datasets import build_cached_dataset, build_dataset, list_dataset_files, split_dataset
+from .inference_backends import KerasBackend, load_backend, resolve_backend
+from .inference_pool import ProcessInferencePool
+from .predictions import PredictionBatch
+from .preprocessing import ECGPreprocessor, preprocessor_for
+
 logger = logging.getLogger(__name__)
 
+def metadata_path_for(model_path):
+    """Path of the JSON metadata sidecar stored next to a model file"""
+    return os.path.splitext(str(model_path))[0] + '.json'
+
+def file_sha256(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_model_metadata(model, model_path, class_names, metrics=None, **extra):
+    """Write the metadata sidecar for a model that has just been saved"""
+    model_summary = []
+    model.summary(print_fn=lambda line, **kwargs: model_summary.append(line))
+    
+    metadata = {
+        'model_file': os.path.basename(str(model_path)),
+        'file_sha256': file_sha256(model_path),
+        'file_size': os.path.getsize(model_path),
+        'trained_at': timezone.now().isoformat(),
+        'class_names': list(class_names),
+        'input_shape': list(model.input_shape[1:]),
+        'parameter_count': int(model.count_params()),
+        'model_summary': model_summary,
+        'metrics': metrics or {},
+    }
+    metadata.update(extra)
+    save_model_metadata(model_path, metadata)
+    return metadata
+
+def save_model_metadata(model_path, metadata):
+    """Atomically replace a model's metadata sidecar"""
+    # Write to a temporary file first so readers never see a partial sidecar
+    path = metadata_path_for(model_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, path)
+
+def read_model_metadata(model_path):
+    """Read a model's metadata sidecar, or None if it is missing or unreadable"""
+    try:
+        with open(metadata_path_for(model_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def model_file_version(model_path, backend, metadata=None):
+    """Identifier of a model file and the backend serving it, used to key cached predictions"""
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return None
+    if metadata and metadata.get('file_sha256') and metadata.get('file_size') == stat.st_size:
+        return f"{metadata['file_sha256'][:16]}-{backend}"
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}-{backend}"
+
+# Output order assumed for a model without a metadata sidecar
+DEFAULT_CLASS_NAMES = ['normal', 'abnormal', 'mi', 'post_mi']
+
 class MemoryEfficientECGModel:
     def __init__(self):
-        self.model = None
-        self.model_path = os.path.join(settings.BASE_DIR, 'ml_models', 'ecg_model.h5')
-        self.class_names = ['normal', 'abnormal', 'mi', 'post_mi']
+        self.backend = None
+        self.pool = None
+        # The file trainers write and sweeps promote to
+        self.model_path = str(settings.ML_CONFIG['MODEL_PATH'])
         self.training_in_progress = False
+        self._batcher = None
+        self._load_lock = threading.Lock()
+        self._ready = threading.Event()
+        self.warmup_seconds = None
+        self.warmup_error = None
+        self._metadata = None
+        self._metadata_mtime = None
+        self._loaded_file = None
         
+    def _model_file_state(self):
+        try:
+            stat = os.stat(self.model_path)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+    
+    def _drop_replaced_model(self):
+        """Unload the served model once another file (e.g. a promoted one) took its place"""
+        with self._load_lock:
+            if self._loaded_file is None or self._model_file_state() == self._loaded_file:
+                return
+            logger.info("Model file changed on disk, reloading")
+            if self.pool is not None:
+                self.pool.stop()
+            self.backend = self.pool = None
+            self._loaded_file = None
+    
+    @property
+    def metadata(self):
+        """Metadata sidecar of the current model file, re-read only when it changes"""
+        try:
+            mtime = os.stat(metadata_path_for(self.model_path)).st_mtime_ns
+        except OSError:
+            self._metadata = self._metadata_mtime = None
+            return None
+        if mtime != self._metadata_mtime:
+            self._metadata = read_model_metadata(self.model_path)
+            self._metadata_mtime = mtime
+        return self._metadata
+    
+    @property
+    def class_names(self):
+        """Labels of the model outputs, in the order the model was trained with"""
+        # Trainers and sweeps record their (sorted) class order in the sidecar
+        metadata = self.metadata
+        if metadata and metadata.get('class_names'):
+            return list(metadata['class_names'])
+        return list(DEFAULT_CLASS_NAMES)
+    
     def get_model_info(self):
         """Get information about the model"""
         info = {
             'is_trained': self.model_exists(),
-            'training_in_progress': self.training_in_progress,
+            'training_in_progress': self.training_in_progress or self.training_job_active(),
             'num_classes': len(self.class_names),
             'class_names': self.class_names,
             'model_path': self.model_path,
         }
         
-        if self.model_exists():
-            try:
-                model = load_model(self.model_path, compile=False)
-                # Get model summary
-                model_summary = []
-                model.summary(print_fn=lambda x: model_summary.append(x))
-                info['model_summary'] = model_summary
-                info['accuracy'] = 0.85  # Default accuracy, can be loaded from history
-            except:
-                info['accuracy'] = 0.0
+        metadata = self.metadata if self.model_exists() else None
+        if metadata:
+            metrics = metadata.get('metrics', {})
+            info.update({
+                'model_summary': metadata.get('model_summary', []),
+                'parameter_count': metadata.get('parameter_count'),
+                'input_shape': metadata.get('input_shape'),
+                'trained_at': metadata.get('trained_at'),
+                'file_sha256': metadata.get('file_sha256'),
+                'metrics': metrics,
+                'accuracy': metrics.get('val_accuracy', metrics.get('accuracy')),
+                'metadata_stale': metadata.get('file_size') != os.path.getsize(self.model_path),
+            })
         
         return info
     
+    def training_job_active(self):
+        """Whether a background training job is running in any process"""
+        from .models import TrainingSession
+        return TrainingSession.objects.filter(is_active=True).exists()
+    
+    @property
+    def model_version(self):
+        """Identifier of the model file on disk, used to key cached predictions"""
+        # The backend actually serving: a stale or missing export falls back to Keras
+        if self.backend is not None:
+            backend = self.backend.name
+        elif self.pool is not None:
+            backend = self.pool.backend
+        else:
+            backend = resolve_backend(self.model_path, warn=False)[0]
+        return model_file_version(self.model_path, backend, self.metadata)
+    
     def model_exists(self):
         """Check if model file exists"""
         return os.path.exists(self.model_path)
     
     def load_model(self):
         """Load the model if it exists"""
-        if self.model_exists():
-            try:
-                self.model = load_model(self.model_path)
-                logger.info("Model loaded successfully")
+        with self._load_lock:
+            if self.backend is not None or self.pool is not None:
                 return True
-            except Exception as e:
-                logger.error(f"Error loading model: {str(e)}")
-                return False
+            if self.model_exists():
+                try:
+                    self._loaded_file = self._model_file_state()
+                    if settings.ML_CONFIG.get('INFERENCE_MODE', 'thread') == 'process':
+                        # Separate processes own the model; this process only preprocesses
+                        self.pool = ProcessInferencePool(
+                            self.model_path,
+                            num_workers=settings.ML_CONFIG.get('INFERENCE_PROCESSES'),
+                            backend=resolve_backend(self.model_path)[0],
+                            input_shape=(self.metadata or {}).get('input_shape'),
+                        )
+                        self.pool.start()
+                        logger.info("Model served by the inference process pool")
+                    else:
+                        self.backend = load_backend(self.model_path)
+                        logger.info(f"Model loaded successfully ({self.backend.name} backend)")
+                    return True
+                except Exception as e:
+                    logger.error(f"Error loading model: {str(e)}")
+                    return False
         return False
     
+    @property
+    def is_ready(self):
+        """True once warm_up() has finished"""
+        return self._ready.is_set()
+    
+    def warm_up(self):
+        """Load the model and run a dummy forward pass so the first request does not pay for it"""
+        start = time.monotonic()
+        try:
+            if self.load_model():
+                if self.pool is not None:
+                    # Each worker process warms its own copy of the model up
+                    if not self.pool.wait_until_ready():
+                        raise RuntimeError('; '.join(self.pool.errors))
+                else:
+                    dummy_batch = np.zeros((1,) + preprocessor_for(self.backend.input_shape).input_shape, dtype=np.float32)
+                    self.backend.predict(dummy_batch)
+                logger.info("Model warmed up")
+            else:
+                logger.warning("No trained model found, predictions will fail until one is trained")
+        except Exception as e:
+            self.warmup_error = str(e)
+            logger.error(f"Model warm-up failed: {str(e)}")
+        finally:
+            self.warmup_seconds = time.monotonic() - start
+            self._ready.set()
+        return self.warmup_error is None
+    
+    def start_warm_up(self):
+        """Run warm_up() in a background thread; is_ready reports False until it finishes"""
+        if not settings.ML_CONFIG.get('WARMUP_ON_STARTUP', True):
+            self._ready.set()
+            return None
+        thread = threading.Thread(target=self.warm_up, name='ecg-model-warmup', daemon=True)
+        thread.start()
+        return thread
+    
+    @property
+    def batcher(self):
+        """Micro-batching front-end shared by concurrent predict() callers"""
+        if self._batcher is None and settings.ML_CONFIG.get('BATCHING_ENABLED', True):
+            # In process mode keep one batch in flight per inference process
+            in_flight = 1
+            if settings.ML_CONFIG.get('INFERENCE_MODE', 'thread') == 'process':
+                in_flight = settings.ML_CONFIG.get('INFERENCE_PROCESSES') or os.cpu_count() or 1
+            self._batcher = MicroBatcher(
+                self.predict_batch,
+                max_batch_size=settings.ML_CONFIG.get('BATCH_MAX_SIZE', 16),
+                max_wait_ms=settings.ML_CONFIG.get('BATCH_MAX_WAIT_MS', 10),
+                num_threads=in_flight,
+            )
+        return self._batcher
+    
     def predict(self, image_path):
-        """Make prediction on an ECG image"""
+        """Make prediction on an ECG image.
+        
+        Raises when there is no model, the image cannot be read or inference
+        fails: a caller must never mistake a failure for a result.
+        """
+        if self.batcher is not None:
+            return self.batcher.predict(image_path)
+        
+        result = self.predict_batch([image_path])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+    
+    def predict_many(self, image_paths):
+        """Predict several ECG images with as few forward passes as possible.
+        
+        Returns one entry per path: a result dict, or the Exception raised
+        for that image. They go through the shared batcher, so they can share
+        a batch with other callers' images.
+        """
+        if self.batcher is not None:
+            return self.batcher.predict_many(image_paths)
         try:
-            # Load model if not loaded
-            if self.model is None:
-                if not self.load_model():
-                    # Create a simple model for testing if no model exists
-                    logger.warning("No trained model found, using dummy prediction")
-                    return self._dummy_prediction()
-            
-            # Load and preprocess image
-            img = load_img(image_path, target_size=(224, 224))
-            img_array = img_to_array(img)
-            img_array = np.expand_dims(img_array, axis=0)
-            img_array = img_array / 255.0  # Normalize
-            
-            # Make prediction
-            predictions = self.model.predict(img_array)
-            predicted_class_idx = np.argmax(predictions[0])
-            predicted_class = self.class_names[predicted_class_idx]
-            confidence = float(predictions[0][predicted_class_idx])
-            
-            # Get all probabilities
-            all_probabilities = {
-                self.class_names[i]: float(predictions[0][i])
-                for i in range(len(self.class_names))
-            }
-            
-            return {
-                'predicted_class': predicted_class,
-                'confidence': confidence,
-                'all_probabilities': all_probabilities
-            }
-            
+            return self.predict_batch(image_paths)
         except Exception as e:
-            logger.error(f"Prediction error: {str(e)}")
-            return self._dummy_prediction()
+            return [e] * len(image_paths)
     
-    def _dummy_prediction(self):
-        """Return dummy prediction for testing"""
-        return {
-            'predicted_class': 'normal',
-            'confidence': 0.85,
-            'all_probabilities': {
-                'normal': 0.85,
-                'abnormal': 0.10,
-                'mi': 0.03,
-                'post_mi': 0.02
-            }
-        }
+    def predict_batch(self, image_paths):
+        """Run a single forward pass over several ECG images.
+        
+        Returns one entry per path; images that could not be read come back
+        as the Exception that was raised for them.
+        """
+        self._drop_replaced_model()
+        # Load model if not loaded
+        if self.backend is None and self.pool is None:
+            if not self.load_model():
+                raise RuntimeError("No trained model is available")
+        
+        results = [None] * len(image_paths)
+        
+        if self.pool is not None:
+            # Images are preprocessed into shared memory and run by a worker process
+            predictions, failed = self.pool.predict(image_paths)
+        else:
+            # Load and preprocess images
+            # Models trained at another input resolution get their own resize
+            engine = preprocessor_for(self.backend.input_shape)
+            batch, failed = engine.preprocess_batch(image_paths, skip_errors=True)
+            predictions = self.backend.predict(batch) if len(batch) else []
+        
+        for idx, error in failed:
+            results[idx] = ValueError(error)
+        
+        batch = PredictionBatch(predictions, self.class_names, failed)
+        for idx, row in enumerate(batch.rows):
+            if row >= 0:
+                results[idx] = batch.row_dict(row)
+        
+        return results
     
-    def train_model(self, epochs=30, batch_size=16):
-        """Train the model (simplified version for now)"""
+    def train_model(self, epochs=30, batch_size=16, use_cache=None):
+        """Train the model on the dataset streamed from ML_CONFIG['DATASET_PATH']"""
         try:
             self.training_in_progress = True
             
-            # Check if we have a dataset
-            dataset_path = os.path.join(settings.BASE_DIR, 'dataset')
-            if not os.path.exists(dataset_path):
-                logger.error("Dataset directory not found")
-                self.training_in_progress = False
-                return False
+            trainer = ECGModelTrainer(model_path=self.model_path, class_names=self.class_names, use_cache=use_cache)
+            history, test_results = trainer.train(epochs=epochs, batch_size=batch_size)
             
-            # Create a simple CNN model
-            model = tf.keras.Sequential([
-                tf.keras.layers.Conv2D(32, (3, 3), activation='relu', input_shape=(224, 224, 3)),
-                tf.keras.layers.MaxPooling2D(2, 2),
-                tf.keras.layers.Conv2D(64, (3, 3), activation='relu'),
-                tf.keras.layers.MaxPooling2D(2, 2),
-                tf.keras.layers.Conv2D(128, (3, 3), activation='relu'),
-                tf.keras.layers.MaxPooling2D(2, 2),
-                tf.keras.layers.Flatten(),
-                tf.keras.layers.Dense(512, activation='relu'),
-                tf.keras.layers.Dropout(0.5),
-                tf.keras.layers.Dense(4, activation='softmax')
-            ])
-            
-            model.compile(
-                optimizer='adam',
-                loss='categorical_crossentropy',
-                metrics=['accuracy']
-            )
-            
-            # Create simple dummy data for testing
-            # In production, load actual dataset
-            dummy_data = np.random.randn(100, 224, 224, 3)
-            dummy_labels = np.random.randint(0, 4, (100, 4))
-            
-            # Train the model
-            history = model.fit(
-                dummy_data, dummy_labels,
-                epochs=epochs,
-                batch_size=batch_size,
-                validation_split=0.2,
-                verbose=0
-            )
-            
-            # Save the model
-            os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            model.save(self.model_path)
-            
-            self.model = model
+            self.replace_model(trainer.model)
             self.training_in_progress = False
             
-            logger.info(f"Model trained successfully. Accuracy: {history.history['accuracy'][-1]:.4f}")
+            logger.info(f"Model trained successfully. Test accuracy: {test_results['accuracy']:.4f}")
             return True
             
         except Exception as e:
@@ -167,6 +348,25 @@ class MemoryEfficientECGModel:
             self.training_in_progress = False
             return False
     
+    def replace_model(self, model):
+        """Serve a freshly trained Keras model"""
+        with self._load_lock:
+            if self.pool is not None:
+                self.pool.stop()
+                self.pool = None
+            # The trainer has just saved this model to model_path
+            self._loaded_file = self._model_file_state()
+            if (settings.ML_CONFIG.get('INFERENCE_MODE', 'thread') == 'thread'
+                    and settings.ML_CONFIG.get('INFERENCE_BACKEND', 'keras') == 'keras'):
+                self.backend = KerasBackend(model=model)
+            else:
+                # Reloaded on the next prediction with the configured backend and mode
+                self.backend = None
+    
+    def check_dataset_ready(self, dataset_path=None):
+        """Check the dataset manifest before training. Returns ``(ready, issues)``."""
+        return DatasetManifest(dataset_path).check()
+    
     def auto_train_if_needed(self):
         """Auto-train model if it doesn't exist"""
         if not self.model_exists():
@@ -174,5 +374,386 @@ class MemoryEfficientECGModel:
             return self.train_model(epochs=10, batch_size=16)
         return True
 
+# Convolution filters per block and dense units of the head, by architecture name
+ARCHITECTURES = {
+    'small': {'filters': (16, 32, 64), 'dense_units': 256},
+    'base': {'filters': (32, 64, 128), 'dense_units': 512},
+    'wide': {'filters': (64, 128, 256), 'dense_units': 512},
+    'deep': {'filters': (32, 64, 128, 256), 'dense_units': 512},
+}
+
+def build_cnn(num_classes, input_shape=(224, 224, 3), architecture='base', learning_rate=None):
+    """The ECG classification CNN"""
+    import tensorflow as tf
+    
+    spec = ARCHITECTURES[architecture]
+    layers = [tf.keras.layers.Input(shape=input_shape)]
+    for filters in spec['filters']:
+        layers.append(tf.keras.layers.Conv2D(filters, (3, 3), activation='relu'))
+        layers.append(tf.keras.layers.MaxPooling2D(2, 2))
+    layers.extend([
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(spec['dense_units'], activation='relu'),
+        tf.keras.layers.Dropout(0.5),
+        tf.keras.layers.Dense(num_classes, activation='softmax')
+    ])
+    model = tf.keras.Sequential(layers)
+    
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate or 1e-3),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    return model
+
+def write_label_artifacts(class_names):
+    """Write the LabelEncoder and class_names.txt that ECGClassifier loads next to MODEL_PATH"""
+    import joblib
+    from sklearn.preprocessing import LabelEncoder
+    
+    encoder = LabelEncoder().fit(class_names)
+    if list(encoder.classes_) != list(class_names):
+        # The encoder can only represent sorted class orders
+        return False
+    joblib.dump(encoder, str(settings.ML_CONFIG['LABEL_ENCODER_PATH']))
+    with open(settings.ML_CONFIG['CLASS_NAMES_PATH'], 'w') as f:
+        f.write('\n'.join(class_names))
+    return True
+
+def build_head(head_layers, feature_shape, num_classes):
+    """Fresh copy of a classifier head for new training; weights are kept where the shapes still fit"""
+    import tensorflow as tf
+    
+    layers = []
+    for idx, layer in enumerate(head_layers):
+        config = layer.get_config()
+        if idx == len(head_layers) - 1 and 'units' in config:
+            # The output layer follows the (possibly new) class mapping
+            config['units'] = num_classes
+        layers.append(type(layer).from_config(config))
+    
+    head = tf.keras.Sequential([tf.keras.layers.Input(shape=feature_shape)] + layers, name='head')
+    for new_layer, old_layer in zip(layers, head_layers):
+        old_weights = old_layer.get_weights()
+        if [w.shape for w in old_weights] == [w.shape for w in new_layer.get_weights()]:
+            new_layer.set_weights(old_weights)
+    
+    head.compile(
+        optimizer='adam',
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    return head
+
+def _per_class_scores(cm):
+    """Per-class precision, recall, F1 and support of a confusion matrix (rows = true class)"""
+    cm = np.asarray(cm, dtype=np.float64)
+    true_positives = np.diag(cm)
+    predicted = cm.sum(axis=0)
+    support = cm.sum(axis=1)
+    precision = np.divide(true_positives, predicted, out=np.zeros_like(true_positives), where=predicted > 0)
+    recall = np.divide(true_positives, support, out=np.zeros_like(true_positives), where=support > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall,
+                   out=np.zeros_like(true_positives), where=(precision + recall) > 0)
+    return precision, recall, f1, support
+
+def metrics_from_confusion_matrix(cm):
+    """Accuracy and macro precision/recall/F1 from a confusion matrix (rows = true class)"""
+    precision, recall, f1, support = _per_class_scores(cm)
+    total = support.sum()
+    return {
+        'accuracy': float(np.trace(np.asarray(cm)) / total) if total else 0.0,
+        'precision': float(precision.mean()),
+        'recall': float(recall.mean()),
+        'f1_score': float(f1.mean()),
+    }
+
+def classification_report_from_confusion_matrix(cm, class_names):
+    """The dict sklearn's classification_report(output_dict=True) gives, from an accumulated confusion matrix"""
+    precision, recall, f1, support = _per_class_scores(cm)
+    total = support.sum()
+    report = {
+        name: {
+            'precision': float(precision[idx]),
+            'recall': float(recall[idx]),
+            'f1-score': float(f1[idx]),
+            'support': int(support[idx]),
+        }
+        for idx, name in enumerate(class_names)
+    }
+    report['accuracy'] = float(np.trace(np.asarray(cm)) / total) if total else 0.0
+    weights = support / total if total else np.zeros_like(support)
+    for name, average in (('macro avg', np.mean), ('weighted avg', None)):
+        scores = [precision, recall, f1]
+        values = [float(average(s)) if average else float(np.dot(s, weights)) for s in scores]
+        report[name] = {
+            'precision': values[0],
+            'recall': values[1],
+            'f1-score': values[2],
+            'support': int(total),
+        }
+    return report
+
+class ECGModelTrainer:
+    """Trains and evaluates the ECG CNN on the image dataset, streamed from disk"""
+    
+    def __init__(self, model_path=None, class_names=None, dataset_path=None, use_cache=None,
+                 image_size=None, architecture='base', learning_rate=None):
+        self.model_path = str(model_path or settings.ML_CONFIG['MODEL_PATH'])
+        # The default order matches the LabelEncoder used by ECGClassifier (sorted labels)
+        self.class_names = list(class_names or sorted(settings.ML_CONFIG['CLASS_LABELS']))
+        self.dataset_path = dataset_path
+        # Read decoded images from the DatasetCache shards instead of the source files
+        self.use_cache = settings.ML_CONFIG.get('DATASET_CACHE_ENABLED', False) if use_cache is None else use_cache
+        # Hyperparameters of new models; image_size is a square side or (width, height)
+        if isinstance(image_size, int):
+            image_size = (image_size, image_size)
+        self.preprocessor = ECGPreprocessor(image_size) if image_size else preprocessor_for(None)
+        self.architecture = architecture
+        self.learning_rate = learning_rate
+        # Off when the caller has already refreshed the cache (parallel sweep trials)
+        self.refresh_cache = True
+        self.model = None
+        self.stop_reason = None
+        self.resumed_from_epoch = 0
+    
+    @property
+    def dataset_cache(self):
+        return dataset_cache_for(self.preprocessor.input_shape)
+    
+    @property
+    def hyperparameters(self):
+        width, height = self.preprocessor.image_size
+        return {
+            'architecture': self.architecture,
+            'learning_rate': self.learning_rate or 1e-3,
+            'image_size': [width, height],
+        }
+    
+    @property
+    def checkpoint_dir(self):
+        """Checkpoints of an unfinished run, one directory per target model path"""
+        model_path = os.path.abspath(self.model_path)
+        key = hashlib.sha1(model_path.encode()).hexdigest()[:8]
+        name = f"{os.path.splitext(os.path.basename(model_path))[0]}-{key}"
+        return os.path.join(settings.ML_CONFIG.get('CHECKPOINT_DIR', settings.BASE_DIR / 'checkpoints'), name)
+    
+    def prepare_data(self, seed=42):
+        """Split the dataset into train/validation/test file lists and labels"""
+        paths, labels = list_dataset_files(self.dataset_path)
+        if not paths:
+            raise ValueError(f"No images found in {self.dataset_path or settings.ML_CONFIG['DATASET_PATH']}")
+        if self.use_cache and self.refresh_cache:
+            self.dataset_cache.refresh(paths, labels)
+        return split_dataset(paths, labels, seed=seed)
+    
+    def dataset(self, paths, labels, batch_size=32, shuffle=False):
+        """tf.data pipeline over the given files, from the cache shards when enabled"""
+        if self.use_cache:
+            images = self.dataset_cache.select(paths, labels)
+            if images.missing:
+                logger.warning(f"{len(images.missing)} images are not in the dataset cache and are skipped")
+            return build_cached_dataset(images, self.class_names, batch_size, shuffle=shuffle)
+        return build_dataset(paths, labels, self.class_names, batch_size, shuffle=shuffle,
+                             image_size=self.preprocessor.image_size)
+    
+    def load_trained_model(self):
+        """Load the saved Keras model"""
+        from tensorflow.keras.models import load_model
+        self.model = load_model(self.model_path)
+        return self.model
+    
+    def train(self, epochs=50, batch_size=32, callbacks=None, resume=False):
+        """Train a new model, evaluate it on the test split and save it
+        
+        The model and optimizer state are checkpointed every CHECKPOINT_EVERY
+        epochs; with resume, training continues from the last checkpoint.
+        Training stops early once the validation loss stops improving, and
+        the learning rate is reduced on plateaus.
+        """
+        import tensorflow as tf
+        from .training_callbacks import TrainingCheckpoint, clear_checkpoints, load_checkpoint
+        
+        config = settings.ML_CONFIG
+        X_train, X_val, X_test, y_train, y_val, y_test = self.prepare_data()
+        logger.info(f"Training on {len(X_train)} images, validating on {len(X_val)}, testing on {len(X_test)}")
+        
+        train_ds = self.dataset(X_train, y_train, batch_size, shuffle=True)
+        val_ds = self.dataset(X_val, y_val, batch_size) if X_val else None
+        
+        state = None
+        if resume:
+            self.model, state = load_checkpoint(self.checkpoint_dir)
+            if state is None:
+                logger.info("No checkpoint to resume from, starting a new run")
+        if state is None:
+            clear_checkpoints(self.checkpoint_dir)
+            self.model = build_cnn(
+                len(self.class_names),
+                input_shape=self.preprocessor.input_shape,
+                architecture=self.architecture,
+                learning_rate=self.learning_rate,
+            )
+        self.resumed_from_epoch = state['epoch'] if state else 0
+        if self.resumed_from_epoch:
+            logger.info(f"Resuming training at epoch {self.resumed_from_epoch + 1}")
+        
+        monitor = 'val_loss' if val_ds is not None else 'loss'
+        early_stopping = tf.keras.callbacks.EarlyStopping(
+            monitor=monitor,
+            patience=config.get('EARLY_STOPPING_PATIENCE', 5),
+            min_delta=config.get('EARLY_STOPPING_MIN_DELTA', 1e-3),
+        )
+        reduce_lr = tf.keras.callbacks.ReduceLROnPlateau(
+            monitor=monitor,
+            factor=config.get('REDUCE_LR_FACTOR', 0.5),
+            patience=config.get('REDUCE_LR_PATIENCE', 2),
+            min_lr=config.get('MIN_LEARNING_RATE', 1e-6),
+        )
+        checkpoint = TrainingCheckpoint(
+            self.checkpoint_dir,
+            every=config.get('CHECKPOINT_EVERY', 1),
+            early_stopping=early_stopping,
+            stateful_callbacks=[reduce_lr],
+            state=state,
+        )
+        
+        history = self.model.fit(
+            train_ds,
+            validation_data=val_ds,
+            epochs=epochs,
+            initial_epoch=self.resumed_from_epoch,
+            callbacks=list(callbacks or []) + [early_stopping, reduce_lr, checkpoint],
+            verbose=2
+        )
+        checkpoint.restore_best_weights()
+        self.stop_reason = self._stop_reason(checkpoint.state, early_stopping, monitor, epochs)
+        logger.info(self.stop_reason)
+        
+        test_results = self.evaluate(X_test, y_test, batch_size) if X_test else {}
+        
+        # Metrics of the whole run, including epochs before a resume
+        metrics = {name: float(values[-1]) for name, values in checkpoint.state['history'].items()}
+        metrics.update({
+            f'test_{name}': value for name, value in test_results.items()
+            if name != 'confusion_matrix'
+        })
+        self.save(metrics)
+        clear_checkpoints(self.checkpoint_dir)
+        return history, test_results
+    
+    def train_head(self, epochs=50, batch_size=32, callbacks=None):
+        """Retrain only the dense head of the saved model on cached backbone features
+        
+        The convolutional backbone (the layers up to Flatten) stays frozen:
+        its features are computed once per image and kept in an
+        EmbeddingCache, which is invalidated when the backbone weights or the
+        source images change. The head may have a new number of classes.
+        """
+        import tensorflow as tf
+        from .embedding_cache import EmbeddingCache, build_backbone, split_model
+        
+        config = settings.ML_CONFIG
+        base_model = self.load_trained_model()
+        # The head is trained for the saved model's input size and architecture
+        self.preprocessor = preprocessor_for(base_model.input_shape[1:])
+        saved_hyperparameters = (read_model_metadata(self.model_path) or {}).get('hyperparameters', {})
+        self.architecture = saved_hyperparameters.get('architecture', self.architecture)
+        backbone = build_backbone(base_model)
+        _, base_head = split_model(base_model)
+        head = build_head(base_head, backbone.output_shape[1:], len(self.class_names))
+        
+        X_train, X_val, X_test, y_train, y_val, y_test = self.prepare_data()
+        cache = EmbeddingCache(backbone, batch_size=batch_size)
+        cache.refresh(X_train + X_val + X_test, y_train + y_val + y_test)
+        
+        def embeddings(paths, labels, shuffle=False):
+            return build_cached_dataset(cache.select(paths, labels), self.class_names, batch_size, shuffle=shuffle)
+        
+        train_ds = embeddings(X_train, y_train, shuffle=True)
+        val_ds = embeddings(X_val, y_val) if X_val else None
+        monitor = 'val_loss' if val_ds is not None else 'loss'
+        early_stopping = tf.keras.callbacks.EarlyStopping(
+            monitor=monitor,
+            patience=config.get('EARLY_STOPPING_PATIENCE', 5),
+            min_delta=config.get('EARLY_STOPPING_MIN_DELTA', 1e-3),
+            restore_best_weights=True,
+        )
+        history = head.fit(
+            train_ds,
+            validation_data=val_ds,
+            epochs=epochs,
+            callbacks=list(callbacks or []) + [early_stopping],
+            verbose=2
+        )
+        self.resumed_from_epoch = 0
+        self.stop_reason = 'Head only. ' + self._stop_reason(
+            {'history': history.history}, early_stopping, monitor, epochs)
+        
+        test_results = self._evaluate_dataset(head, embeddings(X_test, y_test)) if X_test else {}
+        
+        # Put the frozen backbone and the new head back together as one servable model
+        self.model = tf.keras.Sequential(
+            [tf.keras.layers.Input(shape=base_model.input_shape[1:])] + backbone.layers + head.layers
+        )
+        for layer in self.model.layers:
+            layer.trainable = True
+        self.model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+        
+        metrics = {name: float(values[-1]) for name, values in history.history.items()}
+        metrics.update({
+            f'test_{name}': value for name, value in test_results.items()
+            if name != 'confusion_matrix'
+        })
+        self.save(metrics)
+        return history, test_results
+    
+    @staticmethod
+    def _stop_reason(state, early_stopping, monitor, epochs):
+        if early_stopping.stopped_epoch:
+            reason = (f"Early stopping at epoch {early_stopping.stopped_epoch + 1}: {monitor} did not improve "
+                      f"for {early_stopping.patience} epochs (best {float(early_stopping.best):.4f})")
+        else:
+            reason = f"Completed all {epochs} epochs"
+        
+        rates = state['history'].get('learning_rate', [])
+        reductions = sum(1 for before, after in zip(rates, rates[1:]) if after < before)
+        if reductions:
+            reason += f"; learning rate reduced {reductions} times to {rates[-1]:.2e}"
+        return reason
+    
+    def evaluate(self, X_test, y_test, batch_size=32):
+        """Evaluate the model on a list of image paths, one streamed batch at a time"""
+        if self.model is None:
+            self.load_trained_model()
+        return self._evaluate_dataset(self.model, self.dataset(X_test, y_test, batch_size))
+    
+    def _evaluate_dataset(self, model, dataset):
+        import tensorflow as tf
+        
+        num_classes = len(self.class_names)
+        cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+        loss_sum = 0.0
+        for images, one_hot in dataset:
+            probabilities = model(images, training=False)
+            loss_sum += float(tf.reduce_sum(tf.keras.losses.categorical_crossentropy(one_hot, probabilities)))
+            np.add.at(cm, (np.argmax(one_hot, axis=1), np.argmax(probabilities, axis=1)), 1)
+        
+        results = metrics_from_confusion_matrix(cm)
+        results['loss'] = loss_sum / max(1, int(cm.sum()))
+        results['confusion_matrix'] = cm.tolist()
+        return results
+    
+    def save(self, metrics=None):
+        """Save the model with its metadata sidecar"""
+        os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
+        self.model.save(self.model_path)
+        write_model_metadata(self.model, self.model_path, self.class_names, metrics,
+                             hyperparameters=self.hyperparameters)
+        
+        # Keep ECGClassifier's label artifacts in step with the configured model
+        if os.path.abspath(self.model_path) == os.path.abspath(str(settings.ML_CONFIG['MODEL_PATH'])):
+            write_label_artifacts(self.class_names)
+
 # Create a global instance
 ecg_model = MemoryEfficientECGModel()
\ No newline at end of file
@@ -0,0 +1,133 @@
+# model_export.py
+import glob
+import logging
+import os
+
+import numpy as np
+from django.utils import timezone
+
+from .inference_backends import BACKENDS, backend_model_path
+from .ml_model import file_sha256, read_model_metadata, save_model_metadata
+from .preprocessing import preprocessor_for
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PATTERNS = ('*.png', '*.jpg', '*.jpeg', '*.bmp')
+
+
+def sample_images(directory, limit):
+    """Up to ``limit`` image paths found under ``directory``, in a stable order"""
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(str(directory), '**', pattern), recursive=True))
+    return sorted(paths)[:limit]
+
+
+def load_samples(image_dir, limit, input_shape):
+    """Preprocessed sample batch for calibration and parity checks.
+
+    Uses real images when ``image_dir`` has any, otherwise uniform noise.
+    """
+    paths = sample_images(image_dir, limit) if image_dir else []
+    if paths:
+        batch, _ = preprocessor_for(input_shape).preprocess_batch(paths, skip_errors=True)
+        if len(batch):
+            return batch, 'images'
+    logger.warning("No sample images found, using random inputs for calibration and parity")
+    rng = np.random.default_rng(0)
+    return rng.random((limit,) + tuple(input_shape), dtype=np.float32), 'random'
+
+
+def export_tflite(model, output_path, quantize=None, samples=None):
+    """Convert a Keras model to TensorFlow Lite, optionally quantized"""
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == 'int8':
+        if samples is None:
+            raise ValueError("int8 quantization needs calibration samples")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([sample[np.newaxis]] for sample in samples)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def export_onnx(model, output_path, quantize=None):
+    """Convert a Keras model to ONNX, optionally quantized"""
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=str(output_path))
+
+    if quantize == 'float16':
+        import onnx
+        from onnxconverter_common import float16
+        converted = float16.convert_float_to_float16(onnx.load(str(output_path)), keep_io_types=True)
+        onnx.save(converted, str(output_path))
+    elif quantize == 'int8':
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp_path = str(output_path) + '.tmp'
+        os.replace(output_path, tmp_path)
+        quantize_dynamic(tmp_path, str(output_path), weight_type=QuantType.QInt8)
+        os.remove(tmp_path)
+
+
+def parity_check(keras_model, backend, samples):
+    """Compare exported-model predictions against the Keras model on the same batch"""
+    expected = keras_model.predict(samples, verbose=0)
+    actual = np.concatenate([backend.predict(samples[i:i + 1]) for i in range(len(samples))])
+    deltas = np.abs(expected - actual)
+    return {
+        'samples': int(len(samples)),
+        'top1_agreement': float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1))),
+        'max_prob_delta': float(deltas.max()),
+        'mean_prob_delta': float(deltas.mean()),
+    }
+
+
+def export_model(model_path, backend, quantize=None, sample_dir=None, num_samples=64):
+    """Export a Keras .h5 model for a lightweight backend and record a parity check.
+
+    The result is stored under ``exports`` in the model's metadata sidecar.
+    """
+    from tensorflow.keras.models import load_model
+
+    if backend not in ('tflite', 'onnx'):
+        raise ValueError(f"Cannot export to backend: {backend}")
+
+    keras_model = load_model(str(model_path), compile=False)
+    output_path = backend_model_path(model_path, backend)
+    samples, sample_source = load_samples(sample_dir, num_samples, keras_model.input_shape[1:])
+
+    if backend == 'tflite':
+        export_tflite(keras_model, output_path, quantize, samples)
+    else:
+        export_onnx(keras_model, output_path, quantize)
+
+    parity = parity_check(keras_model, BACKENDS[backend](output_path), samples)
+    parity['sample_source'] = sample_source
+
+    export_info = {
+        'path': os.path.basename(output_path),
+        'quantize': quantize or 'none',
+        'file_sha256': file_sha256(output_path),
+        'file_size': os.path.getsize(output_path),
+        'keras_file_sha256': file_sha256(model_path),
+        'exported_at': timezone.now().isoformat(),
+        'parity': parity,
+    }
+
+    # Record the export next to the rest of the model metadata
+    metadata = read_model_metadata(model_path) or {}
+    metadata.setdefault('exports', {})[backend] = export_info
+    save_model_metadata(model_path, metadata)
+
+    return export_info
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -37,6 +37,8 @@ class ECGRecord(models.Model):
     processed_date = models.DateTimeField(null=True, blank=True)
     notes = models.TextField(blank=True)
     doctor_notes = models.TextField(blank=True)
+    error_message = models.TextField(blank=True)  # why the analysis failed
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the uploaded file
     
     # Store prediction probabilities
     normal_prob = models.FloatField(default=0.0)
@@ -47,10 +49,105 @@ class ECGRecord(models.Model):
     def __str__(self):
         return f"ECG #{self.id} - {self.get_predicted_category_display()}"
     
+    # The user's UserECGStats counters are updated by signal handlers (ecg_app.stats)
+    # inside the same transaction as the row itself
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+    
     class Meta:
         ordering = ['-upload_date']
         verbose_name = 'ECG Record'
         verbose_name_plural = 'ECG Records'
+        # Every user-facing page lists one user's records newest first, optionally
+        # narrowed to a status or category and an upload date range
+        indexes = [
+            models.Index(fields=['user', 'upload_date'], name='ecg_user_upload_idx'),
+            models.Index(fields=['user', 'status', 'upload_date'], name='ecg_user_status_upload_idx'),
+            models.Index(fields=['user', 'predicted_category', 'upload_date'], name='ecg_user_category_upload_idx'),
+            models.Index(fields=['upload_date'], name='ecg_upload_date_idx'),
+        ]
+
+class UserECGStats(models.Model):
+    """Running per-user ECGRecord counters, so the stats pages never scan a user's history.
+
+    Kept in step with every ECGRecord write by ecg_app.stats; rebuild or
+    check them with the rebuild_user_stats command.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='ecg_stats')
+    total = models.IntegerField(default=0)
+    
+    # Records by status
+    pending = models.IntegerField(default=0)
+    processing = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    
+    # Records by predicted category, of any status
+    normal = models.IntegerField(default=0)
+    abnormal = models.IntegerField(default=0)
+    mi = models.IntegerField(default=0)
+    post_mi = models.IntegerField(default=0)
+    
+    # Completed analyses by predicted category
+    completed_normal = models.IntegerField(default=0)
+    completed_abnormal = models.IntegerField(default=0)
+    completed_mi = models.IntegerField(default=0)
+    completed_post_mi = models.IntegerField(default=0)
+    
+    # Confidence of completed analyses, for the running average
+    confidence_sum = models.FloatField(default=0.0)
+    confidence_count = models.IntegerField(default=0)
+    
+    last_upload_date = models.DateTimeField(null=True, blank=True)
+    last_record = models.ForeignKey(ECGRecord, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    @property
+    def avg_confidence(self):
+        return self.confidence_sum / self.confidence_count if self.confidence_count else 0
+    
+    def __str__(self):
+        return f"{self.user.username}'s ECG stats"
+    
+    class Meta:
+        verbose_name = 'User ECG Stats'
+        verbose_name_plural = 'User ECG Stats'
+
+class CachedPrediction(models.Model):
+    """Persistent tier of the prediction cache, keyed by image hash and model version"""
+    content_hash = models.CharField(max_length=64)
+    model_version = models.CharField(max_length=64)
+    predicted_category = models.CharField(max_length=20, choices=ECGRecord.CATEGORY_CHOICES)
+    confidence = models.FloatField()  # 0-1, as returned by the model
+    normal_prob = models.FloatField(default=0.0)
+    abnormal_prob = models.FloatField(default=0.0)
+    mi_prob = models.FloatField(default=0.0)
+    post_mi_prob = models.FloatField(default=0.0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def to_result(self):
+        """Return the entry in the same shape as a model prediction"""
+        return {
+            'predicted_class': self.predicted_category,
+            'confidence': self.confidence,
+            'all_probabilities': {
+                'normal': self.normal_prob,
+                'abnormal': self.abnormal_prob,
+                'mi': self.mi_prob,
+                'post_mi': self.post_mi_prob,
+            }
+        }
+    
+    def __str__(self):
+        return f"{self.content_hash[:12]} @ {self.model_version}"
+    
+    class Meta:
+        unique_together = ('content_hash', 'model_version')
 
 class TrainingSession(models.Model):
     STATUS_CHOICES = [
@@ -72,11 +169,39 @@ class TrainingSession(models.Model):
     f1_score = models.FloatField(null=True, blank=True)
     training_time = models.FloatField(null=True, blank=True)  # in seconds
     created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     error_message = models.TextField(blank=True)
+    stop_reason = models.CharField(max_length=255, blank=True)  # early stopping, epoch limit, interruption
+    resumed_from_epoch = models.IntegerField(default=0)
+    head_only = models.BooleanField(default=False)  # only the dense head was retrained
+    
+    # Hyperparameter sweeps: the sweep session is the parent of one session per trial
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='trials')
+    params = models.JSONField(default=dict, blank=True)  # architecture, learning_rate, image_size...
+    model_path = models.CharField(max_length=500, blank=True)
+    
+    # Progress of a running job, written by the training thread
+    current_epoch = models.IntegerField(default=0)
+    history = models.JSONField(default=list, blank=True)  # one dict of metrics per epoch
+    updated_at = models.DateTimeField(auto_now=True)  # heartbeat
+    
+    # Set while the job is pending or running; at most one session can hold it
+    is_active = models.BooleanField(default=False)
     
     def __str__(self):
         return f"Training Session {self.session_id}"
     
+    @property
+    def progress(self):
+        return self.current_epoch / self.epochs if self.epochs else 0.0
+    
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_active'],
+                condition=models.Q(is_active=True),
+                name='single_active_training_session',
+            ),
+        ]
\ No newline at end of file
@@ -0,0 +1,139 @@
+# prediction_cache.py
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError
+
+from .models import CachedPrediction
+
+
+def hash_upload(uploaded_file):
+    """SHA-256 of an uploaded file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """Two-tier cache of predictions keyed by image content hash and model version.
+
+    An in-process LRU sits in front of the CachedPrediction table, so repeated
+    uploads of the same scan never reach the model.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or settings.ML_CONFIG.get('PREDICTION_CACHE_SIZE', 1024)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def get(self, content_hash, model_version):
+        """Return the cached prediction result or None"""
+        if not content_hash or not model_version:
+            return None
+        key = (content_hash, model_version)
+
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return result
+
+        entry = CachedPrediction.objects.filter(
+            content_hash=content_hash, model_version=model_version
+        ).first()
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        result = entry.to_result()
+        with self._lock:
+            self.db_hits += 1
+            self._remember(key, result)
+        return result
+
+    def get_many(self, content_hashes, model_version):
+        """Return ``{content_hash: result}`` for the cached hashes, with one query for the memory misses"""
+        if not model_version:
+            return {}
+        found = {}
+        with self._lock:
+            for content_hash in content_hashes:
+                result = self._entries.get((content_hash, model_version))
+                if result is not None:
+                    self._entries.move_to_end((content_hash, model_version))
+                    self.memory_hits += 1
+                    found[content_hash] = result
+        lookups = {content_hash for content_hash in content_hashes if content_hash and content_hash not in found}
+        if not lookups:
+            return found
+
+        entries = CachedPrediction.objects.filter(content_hash__in=lookups, model_version=model_version)
+        with self._lock:
+            for entry in entries:
+                found[entry.content_hash] = entry.to_result()
+                self._remember((entry.content_hash, model_version), found[entry.content_hash])
+                self.db_hits += 1
+            self.misses += len(lookups - found.keys())
+        return found
+
+    def set(self, content_hash, model_version, result):
+        """Store a prediction result in both tiers"""
+        if not content_hash or not model_version:
+            return
+        key = (content_hash, model_version)
+        with self._lock:
+            self._remember(key, result)
+
+        probabilities = result.get('all_probabilities', {})
+        try:
+            CachedPrediction.objects.get_or_create(
+                content_hash=content_hash,
+                model_version=model_version,
+                defaults={
+                    'predicted_category': result['predicted_class'],
+                    'confidence': result['confidence'],
+                    'normal_prob': probabilities.get('normal', 0.0),
+                    'abnormal_prob': probabilities.get('abnormal', 0.0),
+                    'mi_prob': probabilities.get('mi', 0.0),
+                    'post_mi_prob': probabilities.get('post_mi', 0.0),
+                }
+            )
+        except IntegrityError:
+            # Another worker stored the same prediction first
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._entries),
+                'max_entries': self.max_entries,
+            }
+
+    def _remember(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Global cache instance
+prediction_cache = PredictionCache()
@@ -0,0 +1,60 @@
+# predictions.py
+from collections.abc import Sequence
+
+import numpy as np
+
+
+def label_table(label_encoder):
+    """Index-to-label table of a fitted LabelEncoder, as plain strings"""
+    return [str(label) for label in label_encoder.classes_]
+
+
+class PredictionBatch(Sequence):
+    """Columnar results of one batched prediction.
+
+    Class indices, confidences and the probability matrix are kept as NumPy
+    arrays; the per-image result dicts are only built when an item is
+    accessed. Indexing follows the input order and gives None for the inputs
+    listed in ``failed`` as ``(index, error)`` pairs.
+    """
+
+    def __init__(self, probabilities, class_names, failed=()):
+        self.probabilities = np.asarray(probabilities, dtype=np.float32).reshape(-1, len(class_names))
+        self.class_names = list(class_names)
+        self.class_indices = np.argmax(self.probabilities, axis=1) if len(self.probabilities) else np.empty(0, np.int64)
+        self.confidences = self.probabilities[np.arange(len(self.probabilities)), self.class_indices]
+        self.failed = list(failed)
+
+        # Position in the input -> row of the probability matrix (-1 for failures)
+        size = len(self.probabilities) + len(self.failed)
+        self.rows = np.full(size, -1, dtype=np.int64)
+        failed_mask = np.zeros(size, dtype=bool)
+        failed_mask[[idx for idx, _ in self.failed]] = True
+        self.rows[~failed_mask] = np.arange(len(self.probabilities))
+
+    @property
+    def predicted_classes(self):
+        """Predicted label of every successful row"""
+        return np.asarray(self.class_names, dtype=object)[self.class_indices]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        row = self.rows[idx]
+        return None if row < 0 else self.row_dict(row)
+
+    def row_dict(self, row):
+        """Result dict of one row of the probability matrix"""
+        class_idx = int(self.class_indices[row])
+        return {
+            'predicted_class': self.class_names[class_idx],
+            'confidence': float(self.confidences[row]),
+            'all_probabilities': dict(zip(self.class_names, self.probabilities[row].tolist())),
+            'predicted_class_idx': class_idx
+        }
+
+    def to_list(self):
+        return list(self)
@@ -0,0 +1,150 @@
+# preprocessing.py
+import os
+
+import cv2
+import numpy as np
+
+IMAGE_SIZE = (224, 224)
+
+
+class ECGPreprocessor:
+    """Single preprocessing pipeline shared by training, evaluation and serving.
+
+    Images are decoded to uint8, resized straight into a preallocated batch
+    buffer and normalized to [0, 1] once, in float32.
+    """
+
+    def __init__(self, image_size=IMAGE_SIZE):
+        self.image_size = tuple(image_size)
+
+    @property
+    def input_shape(self):
+        width, height = self.image_size
+        return (height, width, 3)
+
+    def decode(self, image):
+        """Decode a path, raw bytes, file object or BGR array into a uint8 BGR array"""
+        if isinstance(image, (str, os.PathLike)):
+            img = cv2.imread(str(image), cv2.IMREAD_COLOR)
+            if img is None:
+                raise ValueError(f"Could not read image from {image}")
+            return img
+
+        if hasattr(image, 'read'):
+            # Django UploadedFile or any other file-like object
+            if hasattr(image, 'seek'):
+                image.seek(0)
+            image = image.read()
+
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            img = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                raise ValueError("Could not decode image data")
+            return img
+
+        # Assume image is a numpy array in OpenCV (BGR) channel order
+        img = np.asarray(image)
+        if img.dtype != np.uint8:
+            raise ValueError(f"Expected a uint8 image array, got {img.dtype}")
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        elif img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        return img
+
+    def decode_into(self, image, out):
+        """Decode an image and write it, resized and in RGB order, into a uint8 slot"""
+        img = self.decode(image)
+        resized = cv2.resize(img, self.image_size, dst=out)
+        if not np.shares_memory(resized, out):
+            out[...] = resized
+        # Converting after the resize touches 224x224 pixels instead of the full scan
+        cv2.cvtColor(out, cv2.COLOR_BGR2RGB, dst=out)
+        return out
+
+    def decode_batch(self, images, skip_errors=False, out=None, executor=None):
+        """Decode images into one preallocated (n, h, w, 3) uint8 buffer.
+
+        Returns ``(batch, failed)``. Rows of ``batch`` follow the input order
+        with unreadable images left out; ``failed`` lists ``(index, error)``
+        pairs for them. Without ``skip_errors`` the first failure is raised.
+        ``out`` may be a reusable uint8 buffer with at least ``len(images)``
+        rows; with an ``executor`` the images are decoded in parallel (OpenCV
+        releases the GIL).
+        """
+        if out is not None:
+            buffer = out[:len(images)]
+        else:
+            buffer = np.empty((len(images),) + self.input_shape, dtype=np.uint8)
+        if executor is not None:
+            return self._decode_parallel(images, buffer, skip_errors, executor)
+
+        failed = []
+        count = 0
+        for idx, image in enumerate(images):
+            try:
+                self.decode_into(image, buffer[count])
+                count += 1
+            except Exception as e:
+                if not skip_errors:
+                    raise
+                failed.append((idx, str(e)))
+        return buffer[:count], failed
+
+    def _decode_parallel(self, images, buffer, skip_errors, executor):
+        def decode(idx):
+            try:
+                self.decode_into(images[idx], buffer[idx])
+                return None
+            except Exception as e:
+                if not skip_errors:
+                    raise
+                return (idx, str(e))
+
+        failed = [result for result in executor.map(decode, range(len(images))) if result is not None]
+        if failed:
+            # Close the gaps left by unreadable images, keeping input order
+            failed_indices = {idx for idx, _ in failed}
+            keep = [idx for idx in range(len(images)) if idx not in failed_indices]
+            buffer[:len(keep)] = buffer[keep]
+        return buffer[:len(images) - len(failed)], failed
+
+    def normalize(self, batch, out=None):
+        """Scale a uint8 batch to float32 in [0, 1] in a single pass"""
+        if out is None:
+            out = np.empty(batch.shape, dtype=np.float32)
+        np.multiply(batch, np.float32(1.0 / 255.0), out=out)
+        return out
+
+    def preprocess_batch(self, images, out=None, skip_errors=False):
+        """Decode, resize and normalize images into a float32 model batch.
+
+        Returns ``(batch, failed)`` as described in ``decode_batch``. ``out``
+        may be a preallocated float32 buffer with at least ``len(images)`` rows.
+        """
+        decoded, failed = self.decode_batch(images, skip_errors=skip_errors)
+        if out is not None:
+            out = out[:len(decoded)]
+        return self.normalize(decoded, out=out), failed
+
+    def preprocess(self, image):
+        """Preprocess a single image into a (1, h, w, 3) float32 batch"""
+        batch, _ = self.preprocess_batch([image])
+        return batch
+
+
+# Shared instance
+preprocessor = ECGPreprocessor()
+
+_sized_preprocessors = {}
+
+
+def preprocessor_for(input_shape):
+    """Shared preprocessor for a model's (height, width, channels) input shape"""
+    if not input_shape or any(not dim for dim in input_shape[:2]):
+        # Unknown or dynamic spatial size: use the default resolution
+        return preprocessor
+    height, width = int(input_shape[0]), int(input_shape[1])
+    if (height, width, 3) == preprocessor.input_shape:
+        return preprocessor
+    return _sized_preprocessors.setdefault((width, height), ECGPreprocessor((width, height)))
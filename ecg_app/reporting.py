@@ -0,0 +1,175 @@
+# reporting.py
+# Headless rendering of evaluation reports: figures are drawn on Agg canvases
+# without pyplot, so nothing blocks on a display and rendering is safe in workers
+import base64
+import html
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+REPORT_METRICS = ('precision', 'recall', 'f1-score')
+
+
+def figure_png(fig, dpi=100):
+    """PNG bytes of a figure"""
+    FigureCanvasAgg(fig)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def confusion_matrix_figure(cm, class_names):
+    import seaborn as sns
+
+    fig = Figure(figsize=(10, 8))
+    ax = fig.add_subplot()
+    sns.heatmap(np.asarray(cm), annot=True, fmt='d', cmap='Blues',
+                xticklabels=class_names, yticklabels=class_names, ax=ax)
+    ax.set_title('Test Set Confusion Matrix')
+    ax.set_ylabel('True Label')
+    ax.set_xlabel('Predicted Label')
+    fig.tight_layout()
+    return fig
+
+
+def class_metrics_figure(classification_report, class_names):
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    x = np.arange(len(class_names))
+    width = 0.25
+    for idx, metric in enumerate(REPORT_METRICS):
+        values = [classification_report[name][metric] for name in class_names]
+        ax.bar(x + idx * width, values, width, label=metric.capitalize())
+    ax.set_xlabel('Classes')
+    ax.set_ylabel('Score')
+    ax.set_title('Class-wise Performance Metrics')
+    ax.set_xticks(x + width)
+    ax.set_xticklabels(class_names, rotation=45, ha='right')
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    return fig
+
+
+def predictions_figure(samples, n_cols=4):
+    """Grid of decoded RGB images titled with their prediction.
+
+    ``samples`` are dicts with 'image', 'predicted_class', 'confidence',
+    optional 'true_class' and 'top_probabilities' ((class, probability) pairs).
+    """
+    n_cols = max(1, min(n_cols, len(samples)))
+    n_rows = max(1, (len(samples) + n_cols - 1) // n_cols)
+    fig = Figure(figsize=(15, 4 * n_rows))
+    axes = fig.subplots(n_rows, n_cols, squeeze=False).flatten()
+
+    for ax, sample in zip(axes, samples):
+        ax.imshow(sample['image'])
+        title = f"Predicted: {sample['predicted_class']}\n"
+        title += f"Confidence: {sample['confidence']:.2%}"
+        true_class = sample.get('true_class')
+        if true_class is not None:
+            title += f"\nTrue: {true_class}"
+            ax.set_title(title, color='green' if true_class == sample['predicted_class'] else 'red')
+        else:
+            ax.set_title(title)
+        if sample.get('top_probabilities'):
+            probs_text = "\n".join(f"{name}: {prob:.2%}" for name, prob in sample['top_probabilities'])
+            ax.text(0.02, 0.98, probs_text, transform=ax.transAxes,
+                    fontsize=8, verticalalignment='top',
+                    bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
+
+    for ax in axes:
+        ax.axis('off')
+    fig.tight_layout()
+    return fig
+
+
+FIGURES = {
+    'confusion_matrix': confusion_matrix_figure,
+    'class_metrics': class_metrics_figure,
+    'predictions': predictions_figure,
+}
+
+
+def render_figure(name, args, dpi=100):
+    """Draw one of FIGURES and return its PNG bytes"""
+    return figure_png(FIGURES[name](*args), dpi=dpi)
+
+
+def render_figures(jobs, dpi=100, parallel=None):
+    """Render ``{key: (figure name, args)}`` to ``{key: png bytes}``, optionally in worker processes"""
+    if not parallel or parallel < 2 or len(jobs) < 2:
+        return {key: render_figure(name, args, dpi) for key, (name, args) in jobs.items()}
+
+    # Spawned workers: forking a process that holds TensorFlow threads is not safe
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(parallel, len(jobs)), mp_context=context) as executor:
+        futures = {key: executor.submit(render_figure, name, args, dpi) for key, (name, args) in jobs.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+
+def _img_tag(png, alt):
+    encoded = base64.b64encode(png).decode('ascii')
+    return f'<img src="data:image/png;base64,{encoded}" alt="{html.escape(alt)}">'
+
+
+def html_report(report, figures, title='ECG Model Evaluation Report'):
+    """A single self-contained HTML page (figures inlined as base64 PNGs)"""
+    esc = html.escape
+    class_report = report['per_class_metrics']
+    rows = []
+    for name in list(report['class_names']) + ['macro avg', 'weighted avg']:
+        scores = class_report[name]
+        rows.append(
+            f"<tr><td>{esc(str(name))}</td>"
+            + "".join(f"<td>{scores[metric]:.4f}</td>" for metric in REPORT_METRICS)
+            + f"<td>{scores['support']}</td></tr>"
+        )
+    skipped = "".join(
+        f"<tr><td>{esc(entry['path'])}</td><td>{esc(str(entry['label']))}</td><td>{esc(entry['error'])}</td></tr>"
+        for entry in report['skipped']
+    )
+    sections = {
+        'confusion_matrix': 'Confusion Matrix',
+        'class_metrics': 'Class-wise Metrics',
+        'predictions': 'Sample Predictions',
+    }
+    figure_html = "".join(
+        f"<h2>{heading}</h2>{_img_tag(figures[key], heading)}"
+        for key, heading in sections.items() if key in figures
+    )
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{esc(title)}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; color: #222; }}
+table {{ border-collapse: collapse; margin: 1em 0; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 10px; text-align: left; }}
+th {{ background: #f0f0f0; }}
+img {{ max-width: 100%; }}
+</style>
+</head>
+<body>
+<h1>{esc(title)}</h1>
+<p>Generated {esc(report['generated_at'])} &middot; model {esc(str(report.get('model_path', '')))}</p>
+<p><strong>Accuracy: {report['overall_accuracy']:.4f}</strong> on {report['num_test_samples']} images
+({len(report['skipped'])} skipped)</p>
+<table>
+<tr><th>Class</th><th>Precision</th><th>Recall</th><th>F1-score</th><th>Support</th></tr>
+{''.join(rows)}
+</table>
+{figure_html}
+<h2>Skipped Files</h2>
+<table>
+<tr><th>Path</th><th>Label</th><th>Reason</th></tr>
+{skipped or '<tr><td colspan="3">None</td></tr>'}
+</table>
+</body>
+</html>
+"""
@@ -0,0 +1,326 @@
+# stats.py
+from collections import defaultdict, namedtuple
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ECGRecord, UserECGStats
+
+STATUSES = [status for status, _ in ECGRecord.STATUS_CHOICES]
+CATEGORIES = [category for category, _ in ECGRecord.CATEGORY_CHOICES]
+COUNTER_FIELDS = (
+    ['total'] + STATUSES + CATEGORIES + [f'completed_{category}' for category in CATEGORIES]
+    + ['confidence_sum', 'confidence_count']
+)
+
+# What one ECGRecord contributes to its user's counters, and the columns it is read from
+RecordState = namedtuple('RecordState', 'user_id status category confidence')
+STATE_COLUMNS = ('user_id', 'status', 'predicted_category', 'confidence')
+
+
+def day_start(day):
+    """Aware datetime of midnight starting ``day`` in the current time zone.
+
+    Filtering ``upload_date`` against day boundaries instead of with
+    ``upload_date__date`` lets the database use its upload_date indexes.
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def get_user_stats(user, activity_days=7, recent=True):
+    """ECG statistics of one user, shared by the dashboard, profile, history and stats API.
+
+    Totals come from the user's UserECGStats row, so they cost the same for
+    any history size. With ``recent``, this month's uploads and the activity
+    chart come from one GROUP BY day over the current month and the last
+    ``activity_days``.
+    """
+    counters = UserECGStats.objects.filter(user=user).first() or rebuild_user_stats(user.pk)
+    completed_by_category = {category: getattr(counters, f'completed_{category}') for category in CATEGORIES}
+    by_category = {category: getattr(counters, category) for category in CATEGORIES if getattr(counters, category)}
+
+    stats = {
+        'total': counters.total,
+        'by_status': {status: getattr(counters, status) for status in STATUSES},
+        'completed_by_category': completed_by_category,
+        'by_category': by_category,
+        'most_common_category': max(by_category, key=by_category.get) if by_category else None,
+        'avg_confidence': counters.avg_confidence,
+        'last_upload_date': counters.last_upload_date,
+        'last_record_id': counters.last_record_id,
+        'this_month': None,
+        'activity': [],
+    }
+    if not recent:
+        return stats
+
+    now = timezone.localtime()
+    month_start = now.date().replace(day=1)
+    first_day = now.date() - timedelta(days=activity_days - 1) if activity_days else month_start
+    per_day = _uploads_per_day(user, min(month_start, first_day))
+
+    stats['this_month'] = sum(count for day, count in per_day.items() if day >= month_start)
+    if activity_days:
+        stats['activity'] = _activity_chart(per_day, first_day, activity_days)
+    return stats
+
+
+def _uploads_per_day(user, first_day):
+    return dict(
+        ECGRecord.objects.filter(user=user, upload_date__gte=day_start(first_day))
+        .annotate(day=TruncDate('upload_date'))
+        .order_by()
+        .values('day')
+        .annotate(count=Count('id'))
+        .values_list('day', 'count')
+    )
+
+
+def _activity_chart(per_day, first_day, days):
+    """Uploads per day (oldest first), with bar heights for the dashboard chart"""
+    counts = [per_day.get(first_day + timedelta(days=offset), 0) for offset in range(days)]
+    # Bars are scaled against the total of the period, as the dashboard always did
+    max_count = max(1, sum(counts))
+    return [
+        {
+            'date': (first_day + timedelta(days=offset)).strftime('%a'),  # Short day name
+            'count': count,
+            'height': min(int((count / max_count) * 100) + 20, 120),  # 20-120px
+        }
+        for offset, count in enumerate(counts)
+    ]
+
+
+# ========== COUNTER MAINTENANCE ==========
+
+def record_state(record):
+    return RecordState(record.user_id, record.status, record.predicted_category, record.confidence)
+
+
+def record_counters(state):
+    """Counter increments one record contributes to its user's UserECGStats row"""
+    counters = {'total': 1}
+    if state.status in STATUSES:
+        counters[state.status] = 1
+    if state.category in CATEGORIES:
+        counters[state.category] = 1
+        if state.status == 'completed':
+            counters[f'completed_{state.category}'] = 1
+    if state.status == 'completed' and state.confidence is not None:
+        counters['confidence_sum'] = state.confidence
+        counters['confidence_count'] = 1
+    return counters
+
+
+def counter_aggregates():
+    """Aggregate expressions computing every UserECGStats counter from ECGRecord rows"""
+    completed = Q(status='completed')
+    aggregates = {
+        'total': Count('id'),
+        'confidence_sum': Coalesce(Sum('confidence', filter=completed), Value(0.0)),
+        'confidence_count': Count('confidence', filter=completed),
+        'last_upload_date': Max('upload_date'),
+    }
+    for status in STATUSES:
+        aggregates[status] = Count('id', filter=Q(status=status))
+    for category in CATEGORIES:
+        aggregates[category] = Count('id', filter=Q(predicted_category=category))
+        aggregates[f'completed_{category}'] = Count('id', filter=completed & Q(predicted_category=category))
+    return aggregates
+
+
+def _last_record_id(user_id):
+    return (ECGRecord.objects.filter(user_id=user_id)
+            .order_by('-upload_date', '-id').values_list('id', flat=True).first())
+
+
+def rebuild_user_stats(user_id):
+    """Recompute one user's counters from their records and store them"""
+    with transaction.atomic():
+        values = ECGRecord.objects.filter(user_id=user_id).aggregate(**counter_aggregates())
+        values['last_record_id'] = _last_record_id(user_id)
+        stats, _ = UserECGStats.objects.update_or_create(user_id=user_id, defaults=values)
+    return stats
+
+
+def expected_user_stats():
+    """Counters of every user with records, recomputed in one grouped query: ``{user_id: values}``"""
+    last_record = (ECGRecord.objects.filter(user_id=OuterRef('user_id'))
+                   .order_by('-upload_date', '-id').values('id')[:1])
+    rows = (ECGRecord.objects.order_by().values('user_id')
+            .annotate(**counter_aggregates(), last_record_id=Subquery(last_record)))
+    return {row.pop('user_id'): row for row in rows}
+
+
+def rebuild_all_user_stats():
+    """Replace every UserECGStats row with counters recomputed from scratch. Returns the row count."""
+    with transaction.atomic():
+        expected = expected_user_stats()
+        UserECGStats.objects.all().delete()
+        UserECGStats.objects.bulk_create(
+            [UserECGStats(user_id=user_id, **expected.get(user_id, {}))
+             for user_id in User.objects.values_list('id', flat=True)],
+            batch_size=500
+        )
+    return UserECGStats.objects.count()
+
+
+def check_user_stats(tolerance=1e-6):
+    """Compare the stored counters with recomputed ones.
+
+    Returns ``(user_id, field, stored, expected)`` tuples for every
+    difference; a user with records but no row is reported with field None.
+    """
+    expected = expected_user_stats()
+    stored = {stats.user_id: stats for stats in UserECGStats.objects.all()}
+    mismatches = []
+    for user_id in sorted(set(expected) | set(stored)):
+        values = expected.get(user_id)
+        stats = stored.get(user_id)
+        if stats is None:
+            mismatches.append((user_id, None, None, values))
+            continue
+        if values is None:
+            values = {field: 0 for field in COUNTER_FIELDS}
+            values.update(last_upload_date=None, last_record_id=None)
+        for field, value in values.items():
+            current = getattr(stats, field)
+            if field == 'confidence_sum':
+                same = abs(current - value) <= tolerance * max(1.0, abs(value))
+            else:
+                same = current == value
+            if not same:
+                mismatches.append((user_id, field, current, value))
+    return mismatches
+
+
+def apply_record_changes(changes, rebuild_missing=True):
+    """Move records' contributions between counters.
+
+    ``changes`` are ``(old state, new state)`` pairs, None for a created or
+    deleted record. Must run in the transaction that wrote the records; a
+    user without a counters row gets one rebuilt from the table instead.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for old, new in changes:
+        for state, sign in ((old, -1), (new, 1)):
+            if state is not None:
+                for field, value in record_counters(state).items():
+                    deltas[state.user_id][field] += sign * value
+
+    with transaction.atomic():
+        for user_id, user_deltas in deltas.items():
+            updates = {field: F(field) + value for field, value in user_deltas.items() if value}
+            if not updates:
+                continue
+            updates['updated_at'] = timezone.now()
+            if not UserECGStats.objects.filter(user_id=user_id).update(**updates) and rebuild_missing:
+                rebuild_user_stats(user_id)
+
+
+def _note_upload(record):
+    """Make ``record`` the user's last upload if it is the newest one"""
+    UserECGStats.objects.filter(
+        Q(last_upload_date__isnull=True) | Q(last_upload_date__lte=record.upload_date),
+        user_id=record.user_id,
+    ).update(last_upload_date=record.upload_date, last_record_id=record.pk)
+
+
+def count_created_records(records):
+    """Add records inserted with bulk_create (which sends no signals) to their users' counters"""
+    with transaction.atomic():
+        apply_record_changes([(None, record_state(record)) for record in records])
+        for record in records:
+            _note_upload(record)
+
+
+def _locked_state(record):
+    """The stored state of ``record``, its row locked until the transaction ends; None if not stored.
+
+    Counters move from what the row holds, not from what the instance was
+    loaded with: another process may have changed the row since.
+    """
+    if record.pk is None:
+        return None
+    rows = ECGRecord.objects.filter(pk=record.pk)
+    if connection.features.has_select_for_update:
+        rows = rows.select_for_update()
+    else:
+        # SQLite has no row locks: it locks the whole database on the first write, and
+        # fails at once rather than wait when two transactions that have both read try to
+        # write. This no-op UPDATE takes the write lock before reading; it runs inside the
+        # save's own transaction, so it adds a statement but no commit.
+        rows.update(id=F('id'))
+    values = rows.values_list(*STATE_COLUMNS).first()
+    return RecordState(*values) if values else None
+
+
+def _moves_counters(instance, update_fields):
+    """Whether a save can change the counters: saves limited to other columns do not"""
+    if update_fields is None:
+        return True
+    written = {instance._meta.get_field(name).attname for name in update_fields}
+    return not written.isdisjoint(STATE_COLUMNS)
+
+
+def _saved_state(instance, old, update_fields):
+    """State of the row after a save, which only writes ``update_fields`` when given"""
+    new = record_state(instance)
+    if old is None or update_fields is None:
+        return new
+    written = {instance._meta.get_field(name).attname for name in update_fields}
+    return RecordState(*(
+        new_value if column in written else old_value
+        for column, old_value, new_value in zip(STATE_COLUMNS, old, new)
+    ))
+
+
+# ECGRecord.save() and deletes run in a transaction, so the row stays locked
+# from the pre_ signal to the counter update of the post_ signal
+@receiver(pre_save, sender=ECGRecord)
+def _lock_saved_record(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Only saves that can move counters pay for the lock and the read
+    if not raw and _moves_counters(instance, update_fields):
+        instance._stats_state = _locked_state(instance)
+
+
+@receiver(post_save, sender=ECGRecord)
+def _count_saved_record(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        # Fixture loads: rebuild_user_stats afterwards
+        return
+    if not _moves_counters(instance, update_fields):
+        return
+    old = None if created else instance._stats_state
+    new = _saved_state(instance, old, update_fields)
+    if old != new:
+        apply_record_changes([(old, new)])
+    if created:
+        _note_upload(instance)
+
+
+@receiver(pre_delete, sender=ECGRecord)
+def _lock_deleted_record(sender, instance, **kwargs):
+    instance._stats_state = _locked_state(instance)
+
+
+@receiver(post_delete, sender=ECGRecord)
+def _count_deleted_record(sender, instance, **kwargs):
+    old = instance._stats_state
+    if old is None:
+        # Already deleted by someone else
+        return
+    # A user being deleted loses the counters row too; do not recreate it
+    apply_record_changes([(old, None)], rebuild_missing=False)
+    stats = UserECGStats.objects.filter(user_id=instance.user_id).first()
+    if stats is not None and (stats.last_record_id is None or stats.last_record_id == instance.pk):
+        stats.last_record_id = _last_record_id(instance.user_id)
+        stats.last_upload_date = (ECGRecord.objects.filter(pk=stats.last_record_id)
+                                  .values_list('upload_date', flat=True).first())
+        stats.save(update_fields=['last_record', 'last_upload_date', 'updated_at'])
@@ -0,0 +1,189 @@
+# sweep.py
+import itertools
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .dataset_cache import dataset_cache_for
+from .datasets import list_dataset_files
+from .ml_model import metadata_path_for, read_model_metadata, save_model_metadata, write_label_artifacts
+from .models import TrainingSession
+from .sweep_worker import init_trial_worker, run_trial
+from .training_jobs import create_session
+
+logger = logging.getLogger(__name__)
+
+
+def grid_trials(space):
+    """Every combination of the search space values"""
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_trials(space, num_trials, seed=None):
+    """Distinct random combinations of the search space values"""
+    grid = grid_trials(space)
+    return random.Random(seed).sample(grid, min(num_trials, len(grid)))
+
+
+def trial_score(session):
+    """Best validation loss reached by a trial (training loss without a validation split)"""
+    losses = [entry.get('val_loss', entry.get('loss')) for entry in session.history]
+    losses = [loss for loss in losses if loss is not None]
+    return min(losses) if losses else float('inf')
+
+
+def promote_model(trial, target_path, sweep_session_id=None):
+    """Install a trial's model and metadata sidecar as ``target_path``"""
+    target_path = str(target_path)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    tmp_path = target_path + '.tmp'
+    shutil.copyfile(trial.model_path, tmp_path)
+    os.replace(tmp_path, target_path)
+
+    metadata = read_model_metadata(trial.model_path) or {}
+    metadata.update({
+        'input_size': trial.params.get('image_size'),
+        'promoted_from': {'sweep': sweep_session_id, 'trial': trial.session_id, 'params': trial.params},
+    })
+    save_model_metadata(target_path, metadata)
+
+    if os.path.abspath(target_path) == os.path.abspath(str(settings.ML_CONFIG['MODEL_PATH'])):
+        write_label_artifacts(metadata.get('class_names', sorted(settings.ML_CONFIG['CLASS_LABELS'])))
+    if settings.ML_CONFIG.get('INFERENCE_BACKEND', 'keras') != 'keras':
+        logger.warning("Promoted a new Keras model: re-run export_ecg_model for the configured inference backend")
+
+
+def run_sweep(trials, epochs, parallel=None, threads_per_trial=None, dataset_path=None, use_cache=False,
+              promote_to=None, keep_trial_models=False, user=None, search='grid'):
+    """Train every trial configuration in a pool of processes and promote the best model.
+
+    The sweep holds the single active TrainingSession; each trial is recorded
+    as a child session. Every worker process gets its own share of the cores.
+    Returns the sweep session.
+    """
+    config = settings.ML_CONFIG
+    cpu_count = os.cpu_count() or 1
+    threads_per_trial = threads_per_trial or config.get('SWEEP_THREADS_PER_TRIAL', 4)
+    parallel = parallel or max(1, cpu_count // threads_per_trial)
+    parallel = min(parallel, len(trials))
+    threads_per_trial = max(1, min(threads_per_trial, cpu_count // parallel))
+    class_names = sorted(config['CLASS_LABELS'])
+
+    sweep = create_session(user, epochs=epochs, batch_size=0)
+    output_dir = Path(config.get('SWEEP_DIR', settings.BASE_DIR / 'sweeps')) / sweep.session_id
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sweep_params = {
+        'search': search,
+        'num_trials': len(trials),
+        'parallel': parallel,
+        'threads_per_trial': threads_per_trial,
+        'completed_trials': 0,
+    }
+    TrainingSession.objects.filter(pk=sweep.pk).update(
+        status='running', started_at=timezone.now(), params=sweep_params)
+
+    trial_sessions = [
+        TrainingSession.objects.create(
+            session_id=uuid.uuid4().hex,
+            user=sweep.user,
+            epochs=epochs,
+            batch_size=params['batch_size'],
+            parent=sweep,
+            params=params,
+            model_path=str(output_dir / f'trial-{idx:03d}.h5'),
+        )
+        for idx, params in enumerate(trials)
+    ]
+
+    started = time.monotonic()
+    final = {'status': 'failed'}
+    try:
+        if use_cache:
+            # Refresh once per resolution here rather than concurrently in every trial
+            paths, labels = list_dataset_files(dataset_path)
+            for width, height in {tuple(params['image_size']) for params in trials}:
+                dataset_cache_for((height, width, 3)).refresh(paths, labels)
+
+        logger.info(f"Sweep {sweep.session_id}: {len(trials)} trials, {parallel} in parallel, "
+                    f"{threads_per_trial} threads each")
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=parallel, mp_context=context,
+                                 initializer=init_trial_worker, initargs=(threads_per_trial,)) as executor:
+            futures = {
+                executor.submit(run_trial, session.pk, session.model_path, class_names, dataset_path, use_cache): session
+                for session in trial_sessions
+            }
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=config.get('TRAINING_HEARTBEAT_INTERVAL', 30),
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    session = futures[future]
+                    if future.exception() is not None:
+                        # The worker died before it could record the failure itself
+                        TrainingSession.objects.filter(pk=session.pk).update(
+                            status='failed', error_message=str(future.exception()), completed_at=timezone.now())
+                    sweep_params['completed_trials'] += 1
+                    logger.info(f"Trial {sweep_params['completed_trials']}/{len(trials)} finished: {session.params}")
+                # Heartbeat and progress of the sweep itself
+                TrainingSession.objects.filter(pk=sweep.pk).update(params=sweep_params, updated_at=timezone.now())
+
+        finished = [session for session in sweep.trials.filter(status='completed')]
+        best = min(finished, key=trial_score) if finished else None
+        if best is None:
+            final['error_message'] = 'No trial completed'
+        else:
+            sweep_params['best_trial'] = best.session_id
+            sweep_params['best_params'] = best.params
+            final = {
+                'status': 'completed',
+                'accuracy': best.accuracy,
+                'loss': best.loss,
+                'precision': best.precision,
+                'recall': best.recall,
+                'f1_score': best.f1_score,
+                'history': best.history,
+                'stop_reason': f"Best of {len(finished)}/{len(trials)} trials: {best.params} "
+                               f"(validation loss {trial_score(best):.4f})",
+            }
+            if promote_to:
+                promote_model(best, promote_to, sweep.session_id)
+                final['model_path'] = str(promote_to)
+                logger.info(f"Promoted trial {best.session_id} to {promote_to}")
+    except BaseException as e:
+        final.update({'status': 'failed', 'stop_reason': 'Sweep interrupted', 'error_message': str(e) or type(e).__name__})
+        sweep.trials.filter(status__in=['pending', 'running']).update(
+            status='failed', error_message='Sweep interrupted', completed_at=timezone.now())
+        raise
+    finally:
+        TrainingSession.objects.filter(pk=sweep.pk).update(
+            is_active=False,
+            params=sweep_params,
+            training_time=time.monotonic() - started,
+            completed_at=timezone.now(),
+            **final,
+        )
+        if not keep_trial_models:
+            promoted = 'model_path' in final
+            for session in trial_sessions:
+                # Keep the best trial's own copy only when it was not promoted
+                if session.session_id == sweep_params.get('best_trial') and not promoted:
+                    continue
+                for path in (session.model_path, metadata_path_for(session.model_path)):
+                    if os.path.exists(path):
+                        os.remove(path)
+            if not any(output_dir.iterdir()):
+                output_dir.rmdir()
+
+    sweep.refresh_from_db()
+    return sweep
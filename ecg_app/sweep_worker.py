@@ -0,0 +1,32 @@
+# sweep_worker.py
+# Entry points of sweep trial processes. Spawned workers import this module
+# before Django is set up, so it must not import models at module level.
+from .inference_pool import limit_cpu_threads
+
+
+def init_trial_worker(threads):
+    """Runs once in each fresh worker process, before TensorFlow is imported"""
+    limit_cpu_threads(threads)
+    import django
+    django.setup()
+
+
+def run_trial(session_pk, model_path, class_names, dataset_path, use_cache):
+    """Train one sweep trial and record it in its TrainingSession"""
+    from .ml_model import ECGModelTrainer
+    from .models import TrainingSession
+    from .training_jobs import run_training_job
+
+    session = TrainingSession.objects.get(pk=session_pk)
+    trainer = ECGModelTrainer(
+        model_path=model_path,
+        class_names=class_names,
+        dataset_path=dataset_path,
+        use_cache=use_cache,
+        image_size=session.params['image_size'],
+        architecture=session.params['architecture'],
+        learning_rate=session.params['learning_rate'],
+    )
+    # The sweep refreshed the dataset cache once before starting the trials
+    trainer.refresh_cache = False
+    return run_training_job(session_pk, trainer=trainer)
@@ -1,11 +1,14 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import numpy as np
-import cv2
-import matplotlib.pyplot as plt
-from sklearn.metrics import classification_report, confusion_matrix
-import seaborn as sns
 import joblib
 from django.conf import settings
-from .ml_model import ECGModelTrainer
+from .ml_model import ECGModelTrainer, classification_report_from_confusion_matrix
+from .dataset_cache import dataset_cache_for
+from .predictions import PredictionBatch, label_table
+from .preprocessing import preprocessor, preprocessor_for
+from .reporting import figure_png, html_report, predictions_figure, render_figures
 
 class ECGModelTester:
     def __init__(self):
@@ -13,13 +16,15 @@ class ECGModelTester:
         self.model = None
         self.label_encoder = None
         self.class_names = []
+        self.preprocessor = preprocessor
         
     def load_model(self):
         """Load trained model"""
         try:
             self.model = self.trainer.load_trained_model()
+            self.preprocessor = preprocessor_for(self.model.input_shape[1:])
             self.label_encoder = joblib.load(str(settings.ML_CONFIG['LABEL_ENCODER_PATH']))
-            self.class_names = list(self.label_encoder.classes_)
+            self.class_names = label_table(self.label_encoder)
             print(f"Model loaded successfully. Classes: {self.class_names}")
             return True
         except Exception as e:
@@ -34,161 +39,216 @@ class ECGModelTester:
         
         try:
             # Load and preprocess image
-            img = cv2.imread(image_path)
-            if img is None:
-                raise ValueError(f"Could not read image from {image_path}")
-            
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            img = cv2.resize(img, (224, 224))
-            img = img / 255.0
-            img = np.expand_dims(img, axis=0)
+            img = self.preprocessor.preprocess(image_path)
             
             # Make prediction
             predictions = self.model.predict(img, verbose=0)
-            predicted_class_idx = np.argmax(predictions[0])
-            confidence = float(predictions[0][predicted_class_idx])
-            
-            # Get class name
-            predicted_class = self.label_encoder.inverse_transform([predicted_class_idx])[0]
-            
-            # Get all probabilities
-            all_probs = {}
-            for idx, prob in enumerate(predictions[0]):
-                class_name = self.label_encoder.inverse_transform([idx])[0]
-                all_probs[class_name] = float(prob)
-            
-            return {
-                'predicted_class': predicted_class,
-                'confidence': confidence,
-                'all_probabilities': all_probs,
-                'predicted_class_idx': predicted_class_idx
-            }
+            return PredictionBatch(predictions, self.class_names)[0]
             
         except Exception as e:
             print(f"Error testing image: {str(e)}")
             return None
     
-    def batch_test(self, test_images, test_labels):
-        """Test model on multiple images"""
+    def batch_test(self, test_images, test_labels, use_cache=False, batch_size=64, workers=None, on_batch=None):
+        """Test model on multiple images
+        
+        The test set is streamed in chunks of batch_size: images are decoded
+        in parallel into reused buffers (the next chunk while the current one
+        is predicted) and the confusion matrix accumulates chunk by chunk, so
+        memory does not grow with the test set. Files that were not evaluated
+        are listed in 'skipped' with the reason; 'y_true' / 'y_pred' follow
+        the remaining files in input order.
+        
+        With use_cache, decoded images are read from the dataset cache shards
+        (refreshed first for changed files) instead of decoding every file.
+        on_batch(paths, images, label_ids, predictions) is called for every
+        chunk; the uint8 images are only valid during the call.
+        """
         if not self.model:
             if not self.load_model():
                 return None
         
-        # Preprocess images
-        processed_images = []
-        for img_path in test_images:
-            img = cv2.imread(img_path)
-            if img is not None:
-                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                img = cv2.resize(img, (224, 224))
-                img = img / 255.0
-                processed_images.append(img)
-        
-        if not processed_images:
-            return None
-        
-        X_test = np.array(processed_images)
-        y_test = np.array(test_labels)
-        
-        # Encode labels
-        y_test_encoded = self.label_encoder.transform(y_test)
-        
-        # Make predictions
-        predictions = self.model.predict(X_test, verbose=0)
-        y_pred = np.argmax(predictions, axis=1)
+        class_index = {name: idx for idx, name in enumerate(self.class_names)}
+        skipped = []
+        paths, label_ids = [], []
+        for path, label in zip(test_images, test_labels):
+            if label in class_index:
+                paths.append(path)
+                label_ids.append(class_index[label])
+            else:
+                skipped.append({'path': str(path), 'label': label, 'error': f"Unknown class label '{label}'"})
         
-        # Calculate accuracy
-        accuracy = np.mean(y_pred == y_test_encoded)
+        if use_cache:
+            chunks = self._cached_chunks(paths, label_ids, batch_size, skipped)
+        else:
+            chunks = self._decoded_chunks(paths, label_ids, batch_size, workers, skipped)
         
-        # Generate classification report
-        report = classification_report(
-            y_test_encoded, 
-            y_pred, 
-            target_names=self.class_names,
-            output_dict=True
-        )
+        num_classes = len(self.class_names)
+        cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+        evaluated, y_true, y_pred, confidences = [], [], [], []
+        buffer = np.empty((batch_size,) + self.preprocessor.input_shape, dtype=np.float32)
+        for batch_paths, batch, batch_labels in chunks:
+            X_batch = self.preprocessor.normalize(batch, out=buffer[:len(batch)])
+            predictions = np.asarray(self.model.predict_on_batch(X_batch))
+            batch_pred = np.argmax(predictions, axis=1)
+            np.add.at(cm, (batch_labels, batch_pred), 1)
+            if on_batch is not None:
+                on_batch(batch_paths, batch, batch_labels, predictions)
+            evaluated.extend(str(path) for path in batch_paths)
+            y_true.append(batch_labels)
+            y_pred.append(batch_pred)
+            confidences.append(predictions[np.arange(len(batch_pred)), batch_pred].astype(np.float32))
         
-        # Confusion matrix
-        cm = confusion_matrix(y_test_encoded, y_pred)
+        if not y_true:
+            return None
         
+        report = classification_report_from_confusion_matrix(cm, self.class_names)
         return {
-            'accuracy': accuracy,
+            'accuracy': report['accuracy'],
             'classification_report': report,
             'confusion_matrix': cm,
-            'predictions': predictions,
-            'y_true': y_test_encoded,
-            'y_pred': y_pred
+            'y_true': np.concatenate(y_true),
+            'y_pred': np.concatenate(y_pred),
+            'confidence': np.concatenate(confidences),
+            'paths': evaluated,
+            'num_evaluated': int(cm.sum()),
+            'skipped': skipped
         }
     
-    def visualize_predictions(self, image_paths, true_labels=None):
-        """Visualize predictions for multiple images"""
-        if not self.model:
-            if not self.load_model():
-                return
-        
-        n_images = len(image_paths)
-        n_cols = min(4, n_images)
-        n_rows = (n_images + n_cols - 1) // n_cols
+    def _decoded_chunks(self, paths, label_ids, batch_size, workers, skipped):
+        """Yield (paths, uint8 batch, label ids) chunks, decoding the next chunk while the caller predicts"""
+        label_ids = np.asarray(label_ids, dtype=np.int64)
+        # Two alternating buffers: the one being filled is never the one handed out
+        buffers = [np.empty((batch_size,) + self.preprocessor.input_shape, dtype=np.uint8) for _ in range(2)]
         
-        fig, axes = plt.subplots(n_rows, n_cols, figsize=(15, 4*n_rows))
-        axes = axes.flatten() if n_images > 1 else [axes]
-        
-        for idx, (img_path, ax) in enumerate(zip(image_paths, axes)):
-            if idx >= len(image_paths):
-                ax.axis('off')
-                continue
-            
-            result = self.test_single_image(img_path)
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as decoder, \
+                ThreadPoolExecutor(max_workers=1) as prefetcher:
+            def decode_chunk(start):
+                buffer = buffers[(start // batch_size) % 2]
+                chunk = paths[start:start + batch_size]
+                return self.preprocessor.decode_batch(chunk, skip_errors=True, out=buffer, executor=decoder)
             
-            if result:
-                # Load and display image
-                img = cv2.imread(img_path)
-                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                ax.imshow(img)
-                
-                # Title with prediction
-                title = f"Predicted: {result['predicted_class']}\n"
-                title += f"Confidence: {result['confidence']:.2%}"
-                
-                if true_labels and idx < len(true_labels):
-                    title += f"\nTrue: {true_labels[idx]}"
-                    # Color code based on correctness
-                    if true_labels[idx] == result['predicted_class']:
-                        ax.set_title(title, color='green')
-                    else:
-                        ax.set_title(title, color='red')
-                else:
-                    ax.set_title(title)
-                
-                ax.axis('off')
+            starts = range(0, len(paths), batch_size)
+            pending = prefetcher.submit(decode_chunk, 0) if len(paths) else None
+            for start in starts:
+                batch, failed = pending.result()
+                if start + batch_size < len(paths):
+                    pending = prefetcher.submit(decode_chunk, start + batch_size)
                 
-                # Add probability distribution as text
-                probs_text = "\n".join([f"{cls}: {prob:.2%}" 
-                                      for cls, prob in list(result['all_probabilities'].items())[:3]])
-                ax.text(0.02, 0.98, probs_text, transform=ax.transAxes,
-                       fontsize=8, verticalalignment='top',
-                       bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
-            else:
-                ax.text(0.5, 0.5, "Error loading image", 
-                       ha='center', va='center', transform=ax.transAxes)
-                ax.axis('off')
+                keep = np.ones(min(batch_size, len(paths) - start), dtype=bool)
+                for idx, error in failed:
+                    keep[idx] = False
+                    skipped.append({
+                        'path': str(paths[start + idx]),
+                        'label': str(self.class_names[label_ids[start + idx]]),
+                        'error': error
+                    })
+                if len(batch):
+                    chunk_paths = [path for path, ok in zip(paths[start:start + len(keep)], keep) if ok]
+                    yield chunk_paths, batch, label_ids[start:start + len(keep)][keep]
+    
+    def _cached_chunks(self, paths, label_ids, batch_size, skipped):
+        """Yield (paths, uint8 batch, label ids) chunks of memory-mapped dataset cache rows"""
+        cache = dataset_cache_for(self.preprocessor.input_shape)
+        cache.refresh(paths, [self.class_names[idx] for idx in label_ids])
+        cached = cache.select(paths, label_ids)
+        for idx, path in cached.missing:
+            skipped.append({
+                'path': str(path),
+                'label': str(self.class_names[label_ids[idx]]),
+                'error': 'Could not read image (not in the dataset cache)'
+            })
+        offset = 0
+        for batch, labels in cached.iter_batches(batch_size):
+            yield cached.paths[offset:offset + len(batch)], batch, np.asarray(labels, dtype=np.int64)
+            offset += len(batch)
+    
+    def predict_images(self, image_paths, batch_size=64):
+        """Decode images once and predict them in batches
         
-        # Hide empty subplots
-        for idx in range(len(image_paths), len(axes)):
-            axes[idx].axis('off')
+        Returns (images, predictions, failed): the decoded uint8 RGB images
+        at model size, their class probabilities and (index, error) pairs of
+        the images that could not be read.
+        """
+        images, failed = self.preprocessor.decode_batch(image_paths, skip_errors=True)
+        predictions = np.empty((len(images), len(self.class_names)), dtype=np.float32)
+        buffer = np.empty((batch_size,) + self.preprocessor.input_shape, dtype=np.float32)
+        for start in range(0, len(images), batch_size):
+            batch = images[start:start + batch_size]
+            X_batch = self.preprocessor.normalize(batch, out=buffer[:len(batch)])
+            predictions[start:start + len(batch)] = self.model.predict_on_batch(X_batch)
+        return images, predictions, failed
+    
+    def _prediction_sample(self, image, probabilities, true_label=None):
+        predicted_idx = int(np.argmax(probabilities))
+        top = np.argsort(probabilities)[::-1][:3]
+        return {
+            'image': image,
+            'predicted_class': str(self.class_names[predicted_idx]),
+            'confidence': float(probabilities[predicted_idx]),
+            'true_class': None if true_label is None else str(true_label),
+            'top_probabilities': [(str(self.class_names[idx]), float(probabilities[idx])) for idx in top]
+        }
+    
+    def visualize_predictions(self, image_paths, true_labels=None, output_path='prediction_visualizations.png', dpi=300):
+        """Visualize predictions for multiple images
         
-        plt.tight_layout()
-        plt.savefig('prediction_visualizations.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        Runs one batched prediction and draws the decoded images it used,
+        off-screen. Writes the figure to output_path and returns it.
+        """
+        if not self.model:
+            if not self.load_model():
+                return None
+        
+        images, predictions, failed = self.predict_images(image_paths)
+        failed_indices = {idx for idx, _ in failed}
+        for idx, error in failed:
+            print(f"Error loading image {image_paths[idx]}: {error}")
+        
+        samples = []
+        readable = (idx for idx in range(len(image_paths)) if idx not in failed_indices)
+        for row, idx in enumerate(readable):
+            true_label = true_labels[idx] if true_labels and idx < len(true_labels) else None
+            samples.append(self._prediction_sample(images[row], predictions[row], true_label))
+        
+        fig = predictions_figure(samples)
+        if output_path:
+            with open(output_path, 'wb') as f:
+                f.write(figure_png(fig, dpi=dpi))
+        return fig
     
-    def generate_performance_report(self, X_test, y_test):
-        """Generate comprehensive performance report"""
+    def generate_performance_report(self, X_test, y_test, output_path=None, use_cache=False, batch_size=64,
+                                    max_samples=None, parallel=None, dpi=None):
+        """Generate comprehensive performance report
+        
+        Evaluates with one streaming batched pass (keeping a few decoded
+        images, misclassified ones first, for the sample grid), renders the
+        figures off-screen, optionally in parallel processes, and writes a
+        single self-contained HTML file to output_path (defaults to a
+        timestamped file in ML_CONFIG REPORT_DIR).
+        """
         if not self.model:
             if not self.load_model():
                 return None
         
-        # Get batch test results
-        batch_results = self.batch_test(X_test, y_test)
+        config = settings.ML_CONFIG
+        max_samples = config.get('REPORT_SAMPLES', 12) if max_samples is None else max_samples
+        dpi = dpi or config.get('REPORT_DPI', 100)
+        
+        # Bounded sample of decoded images, copied out of the reused chunk buffers
+        samples = {'wrong': [], 'right': []}
+        
+        def collect_samples(paths, images, label_ids, predictions):
+            for path, image, label_idx, probabilities in zip(paths, images, label_ids, predictions):
+                kind = 'right' if np.argmax(probabilities) == label_idx else 'wrong'
+                if len(samples[kind]) < max_samples:
+                    samples[kind].append(
+                        self._prediction_sample(image.copy(), probabilities, self.class_names[label_idx]))
+                if len(samples['wrong']) >= max_samples:
+                    return
+        
+        batch_results = self.batch_test(X_test, y_test, use_cache=use_cache, batch_size=batch_size,
+                                        on_batch=collect_samples if max_samples else None)
         
         if not batch_results:
             return None
@@ -198,52 +258,31 @@ class ECGModelTester:
             'overall_accuracy': batch_results['accuracy'],
             'per_class_metrics': batch_results['classification_report'],
             'confusion_matrix': batch_results['confusion_matrix'].tolist(),
-            'class_names': self.class_names,
-            'num_test_samples': len(X_test)
+            'class_names': [str(name) for name in self.class_names],
+            'num_test_samples': batch_results['num_evaluated'],
+            'skipped': batch_results['skipped'],
+            'model_path': str(self.trainer.model_path),
+            'generated_at': datetime.now().isoformat(timespec='seconds')
+        }
+        
+        jobs = {
+            'confusion_matrix': ('confusion_matrix', (batch_results['confusion_matrix'], report['class_names'])),
+            'class_metrics': ('class_metrics', (report['per_class_metrics'], report['class_names'])),
         }
+        sample_grid = (samples['wrong'] + samples['right'])[:max_samples]
+        if sample_grid:
+            jobs['predictions'] = ('predictions', (sample_grid,))
+        figures = render_figures(jobs, dpi=dpi, parallel=parallel)
         
-        # Plot confusion matrix
-        plt.figure(figsize=(10, 8))
-        sns.heatmap(batch_results['confusion_matrix'], 
-                   annot=True, fmt='d', cmap='Blues',
-                   xticklabels=self.class_names,
-                   yticklabels=self.class_names)
-        plt.title('Test Set Confusion Matrix')
-        plt.ylabel('True Label')
-        plt.xlabel('Predicted Label')
-        plt.tight_layout()
-        plt.savefig('test_confusion_matrix.png', dpi=300, bbox_inches='tight')
-        plt.show()
-        
-        # Plot class-wise metrics
-        metrics = ['precision', 'recall', 'f1-score']
-        class_metrics = {metric: [] for metric in metrics}
-        
-        for class_name in self.class_names:
-            for metric in metrics:
-                if class_name in batch_results['classification_report']:
-                    class_metrics[metric].append(
-                        batch_results['classification_report'][class_name][metric]
-                    )
-        
-        x = np.arange(len(self.class_names))
-        width = 0.25
-        
-        fig, ax = plt.subplots(figsize=(12, 6))
-        for idx, (metric, values) in enumerate(class_metrics.items()):
-            ax.bar(x + idx*width, values, width, label=metric.capitalize())
-        
-        ax.set_xlabel('Classes')
-        ax.set_ylabel('Score')
-        ax.set_title('Class-wise Performance Metrics')
-        ax.set_xticks(x + width)
-        ax.set_xticklabels(self.class_names, rotation=45, ha='right')
-        ax.legend()
-        ax.grid(True, alpha=0.3)
-        
-        plt.tight_layout()
-        plt.savefig('class_performance_metrics.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        if output_path is None:
+            report_dir = config.get('REPORT_DIR', settings.BASE_DIR / 'reports')
+            os.makedirs(report_dir, exist_ok=True)
+            output_path = os.path.join(report_dir, f"evaluation-{datetime.now():%Y%m%d-%H%M%S}.html")
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(html_report(report, figures))
+        os.replace(tmp_path, output_path)
+        report['output_path'] = str(output_path)
         
         return report
 
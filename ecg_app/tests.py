@@ -1,3 +1,1599 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .batch_upload import process_batch_upload
+from .batching import MicroBatcher
+from .dataset_cache import DatasetCache
+from .dataset_manifest import DatasetManifest, inspect_image
+from .exports import parquet_available, stream_export
+from .history import HISTORY_PAGE_SIZE, encode_cursor
+from .inference_backends import resolve_backend
+from .inference_pool import ProcessInferencePool, _Worker
+from .inference_queue import InferenceQueue
+from .ml_model import DEFAULT_CLASS_NAMES, MemoryEfficientECGModel, file_sha256, save_model_metadata
+from .models import CachedPrediction, ECGRecord, TrainingSession, UserECGStats
+from .prediction_cache import PredictionCache, hash_upload, prediction_cache
+from .predictions import PredictionBatch
+from .preprocessing import ECGPreprocessor
+from .stats import (CATEGORIES, STATUSES, check_user_stats, count_created_records, day_start,
+                    rebuild_all_user_stats, rebuild_user_stats)
+from .sweep import grid_trials, promote_model, random_trials, trial_score
+from .test_model import ECGModelTester
+from .training_jobs import create_session, release_stale_sessions, run_training_job
+
+RECORD_TABLE = ECGRecord._meta.db_table
+
+
+class SyntheticHistoryMixin:
+    """A table of many users' ECG records, of which the test user owns a small share"""
+
+    num_users = 40
+    records_per_user = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        users = User.objects.bulk_create(
+            [User(username=f'user{idx}', password='!') for idx in range(cls.num_users)]
+        )
+        cls.user = users[0]
+        cls.now = timezone.now()
+
+        records = [
+            ECGRecord(
+                user=user,
+                image='uploaded_ecgs/test.png',
+                predicted_category=rng.choice(CATEGORIES),
+                status=rng.choice(STATUSES),
+                confidence=rng.uniform(40, 100),
+            )
+            for user in users for idx in range(cls.records_per_user)
+        ]
+        ECGRecord.objects.bulk_create(records, batch_size=500)
+        # auto_now_add stamps every row with the same time; spread them over a year
+        for record in records:
+            record.upload_date = cls.now - timedelta(minutes=rng.randrange(365 * 24 * 60))
+        ECGRecord.objects.bulk_update(records, ['upload_date'], batch_size=500)
+        rebuild_all_user_stats()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def history_url(self, **params):
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        return reverse('history') + (f'?{query}' if query else '')
+
+    def api_history_url(self, **params):
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        return reverse('api_history') + (f'?{query}' if query else '')
+
+    def capture(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, url)
+        return [query['sql'] for query in queries.captured_queries]
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class ECGRecordQueryPlanTests(SyntheticHistoryMixin, TestCase):
+    """Every ECGRecord query of a user-facing page must search an index, never scan the table"""
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedPlans(self, url, ordered=False):
+        record_queries = [sql for sql in self.capture(url) if RECORD_TABLE in sql and sql.startswith('SELECT')]
+        self.assertTrue(record_queries, f'{url} ran no ECGRecord query')
+        plans = []
+        for sql in record_queries:
+            plan = self.explain(sql)
+            plans.append(plan)
+            for step in plan:
+                if RECORD_TABLE in step:
+                    self.assertTrue(step.startswith('SEARCH'), f'{url}: {step}\n{sql}')
+                    self.assertIn('INDEX', step, f'{url}: {step}\n{sql}')
+            if ordered and 'ORDER BY' in sql and 'LIMIT' in sql:
+                self.assertFalse(
+                    any('TEMP B-TREE FOR ORDER BY' in step for step in plan),
+                    f'{url} sorts the whole result instead of reading an index in order:\n{sql}'
+                )
+        return plans
+
+    def test_dashboard(self):
+        self.assertIndexedPlans(reverse('dashboard'), ordered=True)
+
+    def test_profile(self):
+        self.assertIndexedPlans(reverse('profile'), ordered=True)
+
+    def test_upload_page(self):
+        self.assertIndexedPlans(reverse('upload'), ordered=True)
+
+    def test_user_stats_api(self):
+        # Served from the counters row alone
+        queries = self.capture(reverse('api_user_stats'))
+        self.assertFalse([sql for sql in queries if RECORD_TABLE in sql])
+
+    def test_history(self):
+        self.assertIndexedPlans(self.history_url(), ordered=True)
+
+    def test_history_filters(self):
+        start = (self.now - timedelta(days=60)).date()
+        end = (self.now - timedelta(days=30)).date()
+        for params in [
+            {'status': 'completed'},
+            {'category': 'mi'},
+            {'status': 'failed', 'category': 'normal'},
+            {'start_date': start},
+            {'end_date': end},
+            {'start_date': start, 'end_date': end},
+            {'status': 'pending', 'start_date': start, 'end_date': end},
+        ]:
+            with self.subTest(**params):
+                self.assertIndexedPlans(self.history_url(**params), ordered=True)
+
+    def test_export(self):
+        for params in [{}, {'format': 'ndjson', 'status': 'completed'}, {'category': 'mi', 'start_date': '2000-01-01'}]:
+            with self.subTest(**params):
+                self.assertIndexedPlans(reverse('export_history') + '?' + '&'.join(
+                    f'{key}={value}' for key, value in params.items()))
+
+    def test_deep_history_pages(self):
+        # A cursor deep into the history seeks the index instead of skipping rows
+        records = ECGRecord.objects.filter(user=self.user).order_by('-upload_date', '-id')
+        cursor = encode_cursor(records[self.records_per_user - 20])
+        for params in [{}, {'status': 'completed'}, {'category': 'normal', 'start_date': '2000-01-01'}]:
+            with self.subTest(**params):
+                for url in (self.history_url(cursor=cursor, **params), self.api_history_url(cursor=cursor, **params)):
+                    steps = [step for plan in self.assertIndexedPlans(url, ordered=True) for step in plan]
+                    self.assertTrue(any('upload_date<?' in step for step in steps), f'{url}: {steps}')
+
+
+class ViewQueryCountTests(SyntheticHistoryMixin, TestCase):
+    """Query counts of the pages must not depend on how many records exist"""
+
+    # Each count includes the session and user lookups of the logged-in request
+    expected_queries = {
+        'dashboard': 5,
+        'profile': 4,
+        'history': 6,
+        'api_user_stats': 3,
+    }
+
+    def test_query_counts(self):
+        for name, expected in self.expected_queries.items():
+            with self.subTest(view=name):
+                self.assertEqual(len(self.capture(reverse(name))), expected)
+
+    def test_later_history_pages_skip_statistics(self):
+        first = self.capture(reverse('api_history'))
+        cursor = self.client.get(reverse('api_history')).json()['next_cursor']
+        # Session, user and the page itself
+        self.assertEqual(len(self.capture(self.api_history_url(cursor=cursor))), 3)
+        self.assertGreater(len(first), 3)
+
+    def test_query_counts_do_not_grow_with_history(self):
+        before = {name: len(self.capture(reverse(name))) for name in self.expected_queries}
+        ECGRecord.objects.create(user=self.user, image='uploaded_ecgs/test.png', predicted_category='normal',
+                                 status='completed', confidence=90.0)
+        self.assertEqual({name: len(self.capture(reverse(name))) for name in self.expected_queries}, before)
+
+
+class HistoryDateFilterTests(TestCase):
+    """The history date filters cover whole days in the current time zone"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        self.day = timezone.localdate() - timedelta(days=10)
+        for offset in (timedelta(0), timedelta(hours=23, minutes=59), timedelta(days=1), timedelta(seconds=-1)):
+            record = ECGRecord.objects.create(user=self.user, image='uploaded_ecgs/test.png',
+                                              predicted_category='normal')
+            ECGRecord.objects.filter(pk=record.pk).update(upload_date=day_start(self.day) + offset)
+
+    def records(self, **params):
+        response = self.client.get(reverse('history'), params)
+        return response.context['total_records']
+
+    def test_single_day(self):
+        self.assertEqual(self.records(start_date=self.day, end_date=self.day), 2)
+
+    def test_open_ranges(self):
+        self.assertEqual(self.records(start_date=self.day), 3)
+        self.assertEqual(self.records(end_date=self.day), 3)
+
+    def test_invalid_date_is_ignored(self):
+        self.assertEqual(self.records(start_date='2024-02-30'), 4)
+
+
+class HistoryPaginationTests(TestCase):
+    """Keyset pagination of the history page and its infinite scroll API"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        other = User.objects.create_user('bob', password='secret')
+        self.client.force_login(self.user)
+        now = timezone.now()
+        for idx in range(25):
+            for user in (self.user, other):
+                record = ECGRecord.objects.create(user=user, image='uploaded_ecgs/test.png',
+                                                  predicted_category='normal' if idx % 2 else 'mi',
+                                                  status='completed', confidence=80.0)
+                # Pairs of records share a timestamp, so ties must be broken by id
+                ECGRecord.objects.filter(pk=record.pk).update(upload_date=now - timedelta(hours=idx // 2))
+        self.expected = list(ECGRecord.objects.filter(user=self.user)
+                             .order_by('-upload_date', '-id').values_list('id', flat=True))
+
+    def scroll(self, **params):
+        """Record ids of every API page, and the responses"""
+        ids, pages, cursor = [], [], None
+        while True:
+            query = dict(params, **({'cursor': cursor} if cursor else {}))
+            data = self.client.get(reverse('api_history'), query).json()
+            pages.append(data)
+            ids += [record['id'] for record in data['records']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return ids, pages
+
+    def test_api_walks_every_record_once(self):
+        ids, pages = self.scroll(limit=4)
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(len(pages), 7)
+        self.assertIn('stats', pages[0])
+        self.assertEqual(pages[0]['stats']['total_records'], 25)
+        self.assertFalse(any('stats' in page for page in pages[1:]))
+        self.assertFalse(pages[-1]['has_more'])
+
+    def test_api_keeps_filters(self):
+        ids, _ = self.scroll(category='normal', limit=5)
+        expected = list(ECGRecord.objects.filter(user=self.user, predicted_category='normal')
+                        .order_by('-upload_date', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_page_links_to_next_cursor(self):
+        response = self.client.get(reverse('history'), {'category': 'mi'})
+        records = response.context['records']
+        self.assertEqual(len(records), HISTORY_PAGE_SIZE)
+        self.assertEqual(response.context['filter_query'], 'category=mi')
+        self.assertContains(response, f"cursor={response.context['next_cursor']}")
+
+        response = self.client.get(reverse('history'), {'category': 'mi', 'cursor': response.context['next_cursor']})
+        self.assertEqual(response.context['records'][0].id,
+                         ECGRecord.objects.filter(user=self.user, predicted_category='mi')
+                         .order_by('-upload_date', '-id')[HISTORY_PAGE_SIZE].id)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('api_history'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        # The page falls back to the first page
+        response = self.client.get(reverse('history'), {'cursor': 'not-a-cursor'})
+        self.assertEqual([record.id for record in response.context['records']], self.expected[:HISTORY_PAGE_SIZE])
+
+
+class HistoryExportTests(TestCase):
+    """Streaming exports of the history in every format"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        other = User.objects.create_user('bob', password='secret')
+        self.client.force_login(self.user)
+        for idx in range(7):
+            for user in (self.user, other):
+                ECGRecord.objects.create(user=user, image=f'uploaded_ecgs/2024/01/01/ecg_{idx}.png',
+                                         predicted_category='normal' if idx % 2 else 'mi',
+                                         status='completed' if idx else 'pending',
+                                         confidence=None if idx == 0 else 50.0 + idx, notes=f'note {idx}')
+        self.records = ECGRecord.objects.filter(user=self.user).order_by('-upload_date', '-id')
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_history'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows[0], ['ID', 'Date', 'Filename', 'Prediction', 'Confidence', 'Status', 'Notes'])
+        self.assertEqual([int(row[0]) for row in rows[1:]], [record.id for record in self.records])
+        newest = self.records[0]
+        self.assertEqual(rows[1][2:], ['ecg_6.png', 'mi', '56.0%', 'completed', 'note 6'])
+        self.assertEqual(rows[1][1], newest.upload_date.strftime('%Y-%m-%d %H:%M:%S'))
+        self.assertEqual(rows[-1][4], '')
+
+    def test_csv_keeps_old_url(self):
+        response = self.client.get(reverse('export_history_csv_view'))
+        self.assertEqual(len(list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))), 8)
+
+    def test_empty_csv_has_header(self):
+        _, content = self.export(status='failed')
+        self.assertEqual(content.decode().strip(), 'ID,Date,Filename,Prediction,Confidence,Status,Notes')
+
+    def test_ndjson_with_filters(self):
+        response, content = self.export(format='ndjson', category='normal')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([line['id'] for line in lines],
+                         [record.id for record in self.records.filter(predicted_category='normal')])
+        self.assertEqual(set(lines[0]), {'id', 'upload_date', 'filename', 'predicted_category', 'confidence',
+                                         'status', 'notes'})
+
+    def test_gzip(self):
+        _, plain = self.export(format='ndjson')
+        response, compressed = self.export(format='ndjson', gzip=1)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('ecg_history.ndjson.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+    def test_chunked_encoding(self):
+        chunks, _, _ = stream_export(self.records, 'csv', chunk_size=3)
+        self.assertEqual(len(list(chunks)), 3)
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('export_history'), {'format': 'xlsx'})
+        self.assertRedirects(response, reverse('history'))
+
+    @skipUnless(parquet_available(), 'pyarrow is not installed')
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+
+        for params in [{}, {'gzip': 1}]:
+            with self.subTest(**params):
+                response, content = self.export(format='parquet', **params)
+                self.assertIn('ecg_history.parquet', response['Content-Disposition'])
+                table = pq.read_table(io.BytesIO(content))
+                self.assertEqual(table.column('id').to_pylist(), [record.id for record in self.records])
+                self.assertEqual(table.column('filename').to_pylist()[0], 'ecg_6.png')
+                self.assertEqual(table.column('upload_date').to_pylist()[0], self.records[0].upload_date)
+
+    @skipUnless(parquet_available(), 'pyarrow is not installed')
+    def test_parquet_row_groups(self):
+        import pyarrow.parquet as pq
+
+        chunks, _, _ = stream_export(self.records, 'parquet', chunk_size=3)
+        parquet_file = pq.ParquetFile(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+        self.assertEqual(parquet_file.metadata.num_rows, 7)
+
+
+STUB_RESULT = {
+    'predicted_class': 'mi',
+    'confidence': 0.9,
+    'all_probabilities': {'normal': 0.05, 'abnormal': 0.03, 'mi': 0.9, 'post_mi': 0.02},
+}
+
+
+class StubClassifier:
+    """Stands in for ecg_model: returns a fixed result (or raises) and records what it was asked"""
+
+    model_version = 'stub-v1'
+
+    def __init__(self, result=STUB_RESULT, error=None):
+        self.result = result
+        self.error = error
+        self.calls = []
+
+    def predict_many(self, images):
+        self.calls.extend(images)
+        if self.error is not None:
+            raise self.error
+        return [dict(self.result) for _ in images]
+
+
+class InferenceQueueTests(TestCase):
+    """Background inference: claiming records, failures and recovery after a restart"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        prediction_cache.clear()
+        self.queue = InferenceQueue(num_workers=1, max_size=10)
+
+    def pending_record(self, **fields):
+        fields = {'status': 'pending', 'content_hash': 'a' * 64, 'image': 'uploaded_ecgs/test.png', **fields}
+        return ECGRecord.objects.create(user=self.user, **fields)
+
+    def process(self, record, classifier):
+        with mock.patch('ecg_app.inference_queue.ecg_model', classifier):
+            self.queue.process(record.id)
+        record.refresh_from_db()
+        return record
+
+    def test_process_completes_record(self):
+        classifier = StubClassifier()
+        record = self.process(self.pending_record(), classifier)
+        self.assertEqual(len(classifier.calls), 1)
+        self.assertEqual(record.status, 'completed')
+        self.assertEqual(record.predicted_category, 'mi')
+        self.assertAlmostEqual(record.confidence, 90.0)
+        self.assertAlmostEqual(record.mi_prob, 0.9)
+        self.assertIsNotNone(record.processed_date)
+        self.assertEqual(check_user_stats(), [])
+
+    def test_record_is_claimed_once(self):
+        classifier = StubClassifier()
+        record = self.pending_record()
+        self.process(record, classifier)
+        self.process(record, classifier)
+        self.assertEqual(len(classifier.calls), 1)
+
+    def test_record_claimed_by_another_worker_is_skipped(self):
+        classifier = StubClassifier()
+        record = self.pending_record()
+        ECGRecord.objects.filter(pk=record.pk).update(status='processing')
+        record = self.process(record, classifier)
+        self.assertEqual(classifier.calls, [])
+        self.assertEqual(record.status, 'processing')
+
+    def test_failed_prediction_marks_record_failed(self):
+        classifier = StubClassifier(error=RuntimeError('model crashed'))
+        with self.assertLogs('ecg_app.inference_queue', 'ERROR'):
+            record = self.process(self.pending_record(), classifier)
+        self.assertEqual(record.status, 'failed')
+        self.assertIsNotNone(record.processed_date)
+        self.assertFalse(CachedPrediction.objects.exists())
+        self.assertEqual(check_user_stats(), [])
+
+    def test_empty_prediction_marks_record_failed(self):
+        with self.assertLogs('ecg_app.inference_queue', 'ERROR'):
+            record = self.process(self.pending_record(), StubClassifier(result={}))
+        self.assertEqual(record.status, 'failed')
+
+    def real_model(self, backend=None):
+        """The real MemoryEfficientECGModel, serving ``backend`` or without any model file"""
+        model = MemoryEfficientECGModel()
+        model.model_path = f'{self.media_root}/missing_model.h5'
+        model.backend = backend
+        return model
+
+    def write_upload(self, name, data):
+        os.makedirs(f'{self.media_root}/uploaded_ecgs', exist_ok=True)
+        with open(f'{self.media_root}/uploaded_ecgs/{name}', 'wb') as f:
+            f.write(data)
+        return f'uploaded_ecgs/{name}'
+
+    def use_media_root(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def test_missing_model_fails_the_record(self):
+        self.use_media_root()
+        png = cv2.imencode('.png', np.zeros((40, 60, 3), dtype=np.uint8))[1].tobytes()
+        record = self.pending_record(image=self.write_upload('ecg.png', png))
+        with self.assertLogs('ecg_app', 'ERROR'):
+            record = self.process(record, self.real_model())
+        self.assertEqual(record.status, 'failed')
+        self.assertEqual(record.predicted_category, '')
+        self.assertIn('No trained model', record.error_message)
+        self.assertEqual(check_user_stats(), [])
+
+    def test_unreadable_image_fails_the_record(self):
+        self.use_media_root()
+        png = cv2.imencode('.png', np.zeros((40, 60, 3), dtype=np.uint8))[1].tobytes()
+        record = self.pending_record(image=self.write_upload('truncated.png', png[:40]))
+        with self.assertLogs('ecg_app.inference_queue', 'ERROR'):
+            record = self.process(record, self.real_model(StubBackend([0.1, 0.2, 0.3, 0.4])))
+        self.assertEqual(record.status, 'failed')
+        self.assertIsNone(record.confidence)
+        self.assertTrue(record.error_message)
+        self.assertFalse(CachedPrediction.objects.exists())
+
+    def test_worker_death_fails_the_record(self):
+        self.use_media_root()
+        png = cv2.imencode('.png', np.zeros((40, 60, 3), dtype=np.uint8))[1].tobytes()
+        record = self.pending_record(image=self.write_upload('ecg.png', png))
+        pool = ProcessInferencePool('ecg_model.h5', num_workers=1)
+        pool._spawn = lambda slot: _Worker(FakeProcess(300), FakeConnection())
+
+        def die(task):
+            # The dispatcher notices the dead process while the caller waits on its task
+            worker.process.exitcode = -9
+            threading.Thread(target=pool._check_workers).start()
+
+        worker = _Worker(FakeProcess(200), FakeConnection(on_send=die))
+        pool.workers = [worker]
+        pool._handle(worker, 'ready', None, None)
+        model = self.real_model()
+        model.pool = pool
+
+        with self.assertLogs('ecg_app', 'ERROR'):
+            record = self.process(record, model)
+        self.assertEqual(record.status, 'failed')
+        self.assertIn('exited with code -9', record.error_message)
+        self.assertEqual(check_user_stats(), [])
+
+    def test_worker_takes_queued_records_together(self):
+        queue = InferenceQueue(num_workers=1, max_size=10, batch_size=3)
+        for record_id in range(5):
+            queue.jobs.put_nowait(record_id)
+        self.assertEqual(queue._next_batch(), [0, 1, 2])
+        self.assertEqual(queue._next_batch(), [3, 4])
+
+    @override_settings(ML_CONFIG={**settings.ML_CONFIG, 'BATCH_MAX_WAIT_MS': 200})
+    def test_queued_records_share_a_forward_pass(self):
+        self.use_media_root()
+        backend = StubBackend([0.1, 0.7, 0.1, 0.1])
+        records = []
+        for idx in range(5):
+            png = cv2.imencode('.png', np.full((40, 60, 3), idx * 10, dtype=np.uint8))[1].tobytes()
+            records.append(self.pending_record(image=self.write_upload(f'ecg{idx}.png', png)))
+
+        with mock.patch('ecg_app.inference_queue.ecg_model', self.real_model(backend)):
+            self.queue.process_batch([record.id for record in records])
+
+        self.assertEqual(backend.batch_sizes, [5])
+        statuses = ECGRecord.objects.order_by().values_list('status', 'predicted_category').distinct()
+        self.assertEqual(list(statuses), [('completed', 'abnormal')])
+        self.assertEqual(check_user_stats(), [])
+
+    def test_restart_requeues_pending_records(self):
+        pending = [self.pending_record(), self.pending_record()]
+        self.pending_record(status='completed')
+        self.pending_record(status='failed')
+        self.queue.requeue_pending()
+        queued = []
+        while not self.queue.jobs.empty():
+            queued.append(self.queue.jobs.get_nowait())
+        self.assertEqual(sorted(queued), sorted(record.id for record in pending))
+
+    def test_full_queue_rejects_records(self):
+        queue = InferenceQueue(num_workers=1, max_size=1)
+        with mock.patch.object(InferenceQueue, 'is_running', new_callable=mock.PropertyMock, return_value=True), \
+                self.assertLogs('ecg_app.inference_queue', 'WARNING'):
+            self.assertTrue(queue.submit(1))
+            self.assertFalse(queue.submit(2))
+
+
+class MicroBatcherTests(TestCase):
+    """Concurrent requests are served by shared batched calls, each caller getting its own result"""
+
+    def test_concurrent_requests_share_a_batch(self):
+        batches = []
+        release = threading.Event()
+
+        def double(items):
+            release.wait(5)
+            batches.append(list(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=200)
+        futures = [batcher.submit(idx) for idx in range(5)]
+        release.set()
+        self.assertEqual([future.result(timeout=5) for future in futures], [0, 2, 4, 6, 8])
+        self.assertEqual(sorted(item for batch in batches for item in batch), list(range(5)))
+        self.assertLess(len(batches), 5)
+        self.assertEqual(batcher.stats()['items_served'], 5)
+
+    def test_batches_are_capped(self):
+        batches = []
+        gate = threading.Event()
+
+        def record(items):
+            gate.wait(5)
+            batches.append(len(items))
+            return items
+
+        batcher = MicroBatcher(record, max_batch_size=3, max_wait_ms=200)
+        futures = [batcher.submit(idx) for idx in range(7)]
+        gate.set()
+        self.assertEqual([future.result(timeout=5) for future in futures], list(range(7)))
+        self.assertLessEqual(max(batches), 3)
+
+    def test_item_errors_reach_only_their_caller(self):
+        batcher = MicroBatcher(lambda items: [ValueError(item) if item < 0 else item for item in items])
+        self.assertEqual(batcher.predict(1, timeout=5), 1)
+        with self.assertRaises(ValueError):
+            batcher.predict(-1, timeout=5)
+
+    def test_batch_errors_reach_every_caller(self):
+        def fail(items):
+            raise RuntimeError('backend down')
+
+        batcher = MicroBatcher(fail, max_wait_ms=50)
+        futures = [batcher.submit(idx) for idx in range(3)]
+        with self.assertLogs('ecg_app.batching', 'ERROR'):
+            for future in futures:
+                with self.assertRaises(RuntimeError):
+                    future.result(timeout=5)
+
+    def test_predict_many_returns_item_errors(self):
+        batcher = MicroBatcher(lambda items: [ValueError(item) if item < 0 else item for item in items])
+        results = batcher.predict_many([1, -2, 3], timeout=5)
+        self.assertEqual(results[0::2], [1, 3])
+        self.assertIsInstance(results[1], ValueError)
+
+    def test_wrong_result_count_is_an_error(self):
+        batcher = MicroBatcher(lambda items: items[:-1], max_wait_ms=0)
+        with self.assertLogs('ecg_app.batching', 'ERROR'), self.assertRaises(RuntimeError):
+            batcher.predict(1, timeout=5)
+
+
+class PreprocessingTests(TestCase):
+    """The shared pipeline: RGB output at the model size, reusable buffers and skipped unreadable images"""
+
+    def setUp(self):
+        self.preprocessor = ECGPreprocessor((32, 24))
+        rng = np.random.default_rng(0)
+        self.images = [rng.integers(0, 256, (60, 80, 3), dtype=np.uint8) for _ in range(4)]
+        self.encoded = [cv2.imencode('.png', image)[1].tobytes() for image in self.images]
+
+    def expected(self, image):
+        return cv2.cvtColor(cv2.resize(image, (32, 24)), cv2.COLOR_BGR2RGB)
+
+    def test_decode_batch_matches_opencv(self):
+        batch, failed = self.preprocessor.decode_batch(self.encoded)
+        self.assertEqual(failed, [])
+        self.assertEqual(batch.shape, (4, 24, 32, 3))
+        for row, image in zip(batch, self.images):
+            np.testing.assert_array_equal(row, self.expected(image))
+
+    def test_decode_batch_reuses_buffer(self):
+        out = np.zeros((8,) + self.preprocessor.input_shape, dtype=np.uint8)
+        batch, _ = self.preprocessor.decode_batch(self.encoded, out=out)
+        self.assertTrue(np.shares_memory(batch, out))
+        np.testing.assert_array_equal(out[3], self.expected(self.images[3]))
+
+    def test_unreadable_images_are_skipped_in_order(self):
+        images = [self.encoded[0], b'not an image', self.encoded[1], b'', self.encoded[2]]
+        for executor in (None, ThreadPoolExecutor(max_workers=3)):
+            with self.subTest(parallel=executor is not None):
+                batch, failed = self.preprocessor.decode_batch(images, skip_errors=True, executor=executor)
+                self.assertEqual([idx for idx, _ in failed], [1, 3])
+                self.assertEqual(len(batch), 3)
+                for row, image in zip(batch, self.images[:3]):
+                    np.testing.assert_array_equal(row, self.expected(image))
+                if executor is not None:
+                    executor.shutdown()
+
+    def test_unreadable_image_raises_without_skip_errors(self):
+        with self.assertRaises(ValueError):
+            self.preprocessor.decode_batch([self.encoded[0], b'not an image'])
+
+    def test_preprocess_batch_normalizes_into_buffer(self):
+        out = np.empty((4,) + self.preprocessor.input_shape, dtype=np.float32)
+        batch, _ = self.preprocessor.preprocess_batch(self.encoded[:2], out=out)
+        self.assertTrue(np.shares_memory(batch, out))
+        self.assertEqual(batch.dtype, np.float32)
+        np.testing.assert_allclose(batch[1], self.expected(self.images[1]) / 255.0, rtol=1e-6)
+
+
+class PredictionCacheTests(TestCase):
+    """Two-tier prediction cache: in-process LRU in front of the CachedPrediction table"""
+
+    def setUp(self):
+        self.cache = PredictionCache(max_entries=2)
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get('a' * 64, 'v1'))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_memory_hit(self):
+        self.cache.set('a' * 64, 'v1', STUB_RESULT)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cache.get('a' * 64, 'v1'), STUB_RESULT)
+        self.assertEqual(self.cache.stats()['memory_hits'], 1)
+
+    def test_database_hit_from_another_process(self):
+        self.cache.set('a' * 64, 'v1', STUB_RESULT)
+        other = PredictionCache(max_entries=2)
+        result = other.get('a' * 64, 'v1')
+        self.assertEqual(result['predicted_class'], 'mi')
+        self.assertAlmostEqual(result['all_probabilities']['mi'], 0.9)
+        self.assertEqual(other.stats()['db_hits'], 1)
+        # Promoted to the memory tier
+        with self.assertNumQueries(0):
+            other.get('a' * 64, 'v1')
+
+    def test_keyed_by_model_version(self):
+        self.cache.set('a' * 64, 'v1', STUB_RESULT)
+        self.assertIsNone(self.cache.get('a' * 64, 'v2'))
+        self.assertIsNone(self.cache.get('a' * 64, None))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for key in 'abc':
+            self.cache.set(key * 64, 'v1', STUB_RESULT)
+        self.assertEqual(self.cache.stats()['memory_entries'], 2)
+        with self.assertNumQueries(1):
+            # Evicted from memory, still in the table
+            self.assertIsNotNone(self.cache.get('a' * 64, 'v1'))
+
+    def test_storing_twice_keeps_one_row(self):
+        self.cache.set('a' * 64, 'v1', STUB_RESULT)
+        PredictionCache().set('a' * 64, 'v1', STUB_RESULT)
+        self.assertEqual(CachedPrediction.objects.count(), 1)
+
+
+class PredictionCacheRequestPathTests(TestCase):
+    """Uploads are answered from the cache, and dummy predictions are never stored"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        prediction_cache.clear()
+        image = np.zeros((40, 60, 3), dtype=np.uint8)
+        self.png = cv2.imencode('.png', image)[1].tobytes()
+
+    def upload(self, classifier):
+        with mock.patch('ecg_app.views.ecg_model', classifier), \
+                mock.patch('ecg_app.views.inference_queue') as queue:
+            response = self.client.post(reverse('upload'), {
+                'image': SimpleUploadedFile('ecg.png', self.png, content_type='image/png'),
+            })
+        return response, queue
+
+    def test_cached_upload_skips_the_queue(self):
+        content_hash = hash_upload(SimpleUploadedFile('ecg.png', self.png))
+        prediction_cache.set(content_hash, StubClassifier.model_version, STUB_RESULT)
+
+        response, queue = self.upload(StubClassifier())
+        record = ECGRecord.objects.get()
+        self.assertRedirects(response, reverse('ecg_result', args=[record.id]), fetch_redirect_response=False)
+        queue.submit.assert_not_called()
+        self.assertEqual(record.status, 'completed')
+        self.assertEqual(record.predicted_category, 'mi')
+
+    def test_uncached_upload_is_queued(self):
+        _, queue = self.upload(StubClassifier())
+        record = ECGRecord.objects.get()
+        queue.submit.assert_called_once_with(record.id)
+        self.assertEqual(record.status, 'pending')
+
+    def test_failed_predictions_are_not_cached(self):
+        record = ECGRecord.objects.create(user=self.user, image='uploaded_ecgs/test.png', status='pending',
+                                          content_hash='d' * 64)
+        classifier = StubClassifier(error=ValueError('Could not read image'))
+        with mock.patch('ecg_app.inference_queue.ecg_model', classifier), \
+                self.assertLogs('ecg_app.inference_queue', 'ERROR'):
+            InferenceQueue(num_workers=1).process(record.id)
+        record.refresh_from_db()
+        self.assertEqual(record.status, 'failed')
+        self.assertFalse(CachedPrediction.objects.exists())
+        self.assertIsNone(prediction_cache.get('d' * 64, classifier.model_version))
+
+    def test_real_predictions_are_cached(self):
+        record = ECGRecord.objects.create(user=self.user, image='uploaded_ecgs/test.png', status='pending',
+                                          content_hash='e' * 64)
+        with mock.patch('ecg_app.inference_queue.ecg_model', StubClassifier()):
+            InferenceQueue(num_workers=1).process(record.id)
+        self.assertTrue(CachedPrediction.objects.filter(content_hash='e' * 64, model_version='stub-v1').exists())
+
+    def test_batch_upload_only_predicts_cache_misses(self):
+        # The model queued uploads are served by, so both paths share cache entries
+        model = MemoryEfficientECGModel()
+        model.model_path = f'{settings.MEDIA_ROOT}/ecg_model.h5'
+        Path(model.model_path).write_bytes(b'weights')
+        model.backend = StubBackend([0.7, 0.1, 0.1, 0.1])
+        pngs = [cv2.imencode('.png', np.full((40, 60, 3), shade, dtype=np.uint8))[1].tobytes()
+                for shade in (0, 120, 255)]
+        files = [SimpleUploadedFile(f'{name}.png', png) for name, png in zip('abc', pngs)]
+        for uploaded in files[:2]:
+            prediction_cache.set(hash_upload(uploaded), model.model_version, STUB_RESULT)
+        # Only the database tier is left
+        prediction_cache.clear()
+
+        with mock.patch('ecg_app.batch_upload.ecg_model', model), \
+                mock.patch.object(CachedPrediction.objects, 'filter', wraps=CachedPrediction.objects.filter) as lookup:
+            outcomes = process_batch_upload(self.user, files)
+
+        self.assertEqual([outcome['status'] for outcome in outcomes], ['completed'] * 3)
+        self.assertEqual([outcome['predicted_category'] for outcome in outcomes], ['mi', 'mi', 'normal'])
+        self.assertEqual(lookup.call_count, 1)
+        self.assertEqual(model.backend.batch_sizes, [1])
+        self.assertIsNotNone(prediction_cache.get(hash_upload(files[2]), model.model_version))
+
+
+class StubBackend:
+    """Inference backend returning the same probability row for every image"""
+
+    name = 'stub'
+    input_shape = (24, 32, 3)
+
+    def __init__(self, probabilities):
+        self.probabilities = np.asarray(probabilities, dtype=np.float32)
+        self.batch_sizes = []
+
+    def predict(self, batch):
+        self.batch_sizes.append(len(batch))
+        return np.tile(self.probabilities, (len(batch), 1))
+
+
+class ServedClassNamesTests(TestCase):
+    """Model outputs are labelled in the class order recorded when the model was trained"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.model = MemoryEfficientECGModel()
+        self.model.model_path = f'{self.tmp}/ecg_model.h5'
+        with open(self.model.model_path, 'wb') as f:
+            f.write(b'weights')
+        self.image_path = f'{self.tmp}/ecg.png'
+        cv2.imwrite(self.image_path, np.zeros((40, 60, 3), dtype=np.uint8))
+        # Highest probability on the second output
+        self.model.backend = StubBackend([0.1, 0.7, 0.15, 0.05])
+
+    def test_sidecar_order_is_used(self):
+        save_model_metadata(self.model.model_path, {'class_names': sorted(DEFAULT_CLASS_NAMES)})
+        [result] = self.model.predict_batch([self.image_path])
+        self.assertEqual(self.model.class_names, ['abnormal', 'mi', 'normal', 'post_mi'])
+        self.assertEqual(result['predicted_class'], 'mi')
+        self.assertAlmostEqual(result['all_probabilities']['abnormal'], 0.1)
+
+    def test_default_order_without_sidecar(self):
+        [result] = self.model.predict_batch([self.image_path])
+        self.assertEqual(self.model.class_names, DEFAULT_CLASS_NAMES)
+        self.assertEqual(result['predicted_class'], 'abnormal')
+
+
+@override_settings(ML_CONFIG={**settings.ML_CONFIG, 'INFERENCE_MODE': 'thread'})
+class ReadinessTests(TestCase):
+    """The readiness probe fails until the model has been warmed up"""
+
+    def test_ready_after_warm_up(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        model = MemoryEfficientECGModel()
+        model.model_path = f'{tmp}/ecg_model.h5'
+        Path(model.model_path).write_bytes(b'weights')
+        backend = StubBackend([1.0, 0.0, 0.0, 0.0])
+
+        with mock.patch('ecg_app.views.ecg_model', model), \
+                mock.patch('ecg_app.ml_model.load_backend', return_value=backend):
+            response = self.client.get(reverse('api_readiness'))
+            self.assertEqual(response.status_code, 503)
+            self.assertFalse(response.json()['ready'])
+
+            self.assertTrue(model.warm_up())
+            response = self.client.get(reverse('api_readiness'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['ready'])
+        self.assertIsNone(response.json()['warmup_error'])
+        self.assertIsNotNone(response.json()['warmup_seconds'])
+        # The dummy forward pass ran during warm-up
+        self.assertEqual(backend.batch_sizes, [1])
+
+
+class PredictionBatchTests(TestCase):
+    """Rows of a batch with unreadable inputs stay aligned with the input order"""
+
+    def test_failed_inputs_are_none_placeholders(self):
+        probabilities = [[0.6, 0.2, 0.1, 0.1], [0.1, 0.1, 0.1, 0.7], [0.2, 0.5, 0.2, 0.1]]
+        # Inputs 1 and 3 of five could not be read
+        batch = PredictionBatch(probabilities, DEFAULT_CLASS_NAMES, failed=[(1, 'bad'), (3, 'bad')])
+
+        self.assertEqual(len(batch), 5)
+        self.assertEqual(batch.rows.tolist(), [0, -1, 1, -1, 2])
+        self.assertEqual([result and result['predicted_class'] for result in batch],
+                         ['normal', None, 'post_mi', None, 'abnormal'])
+        self.assertEqual(list(batch.predicted_classes), ['normal', 'post_mi', 'abnormal'])
+        self.assertAlmostEqual(batch[4]['confidence'], 0.5)
+        self.assertAlmostEqual(batch[2]['all_probabilities']['post_mi'], 0.7)
+        self.assertEqual(batch[1:3], [None, batch[2]])
+        self.assertIsNone(batch[-2])
+
+    def test_all_inputs_failed(self):
+        batch = PredictionBatch([], DEFAULT_CLASS_NAMES, failed=[(0, 'bad'), (1, 'bad')])
+        self.assertEqual(batch.to_list(), [None, None])
+        self.assertEqual(len(batch.predicted_classes), 0)
+
+
+class ExportedBackendTests(TestCase):
+    """A TFLite/ONNX export is only served while it matches the current Keras model"""
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.model_path = f'{tmp}/ecg_model.h5'
+        self.onnx_path = f'{tmp}/ecg_model.onnx'
+        with open(self.model_path, 'wb') as f:
+            f.write(b'keras weights')
+        with open(self.onnx_path, 'wb') as f:
+            f.write(b'onnx graph')
+        save_model_metadata(self.model_path, {
+            'exports': {'onnx': {'keras_file_sha256': file_sha256(self.model_path)}},
+        })
+        onnx_settings = override_settings(ML_CONFIG={**settings.ML_CONFIG, 'INFERENCE_BACKEND': 'onnx'})
+        onnx_settings.enable()
+        self.addCleanup(onnx_settings.disable)
+
+    def retrain(self):
+        with open(self.model_path, 'wb') as f:
+            f.write(b'retrained keras weights')
+
+    def test_current_export_is_served(self):
+        self.assertEqual(resolve_backend(self.model_path), ('onnx', self.onnx_path))
+
+    def test_stale_export_falls_back_to_keras(self):
+        self.retrain()
+        with self.assertLogs('ecg_app.inference_backends', 'WARNING'):
+            self.assertEqual(resolve_backend(self.model_path), ('keras', self.model_path))
+
+    def test_missing_export_falls_back_to_keras(self):
+        os.remove(self.onnx_path)
+        with self.assertLogs('ecg_app.inference_backends', 'WARNING'):
+            self.assertEqual(resolve_backend(self.model_path)[0], 'keras')
+
+    def test_model_version_names_the_served_backend(self):
+        model = MemoryEfficientECGModel()
+        model.model_path = self.model_path
+        self.assertTrue(model.model_version.endswith('-onnx'))
+        self.retrain()
+        self.assertTrue(model.model_version.endswith('-keras'))
+        model.backend = StubBackend([1.0, 0.0, 0.0, 0.0])
+        self.assertTrue(model.model_version.endswith('-stub'))
+
+
+class SweepTrialTests(TestCase):
+    """Expanding a search space into trials and ranking finished trials"""
+
+    space = {'learning_rate': [1e-3, 1e-4], 'architecture': ['small', 'base', 'wide'], 'image_size': [224]}
+
+    def test_grid_covers_every_combination(self):
+        trials = grid_trials(self.space)
+        self.assertEqual(len(trials), 6)
+        self.assertEqual(len({tuple(sorted(trial.items())) for trial in trials}), 6)
+        self.assertEqual(trials[0], {'architecture': 'small', 'image_size': 224, 'learning_rate': 1e-3})
+
+    def test_random_trials_are_reproducible(self):
+        trials = random_trials(self.space, 4, seed=7)
+        self.assertEqual(trials, random_trials(self.space, 4, seed=7))
+        self.assertEqual(len({tuple(sorted(trial.items())) for trial in trials}), 4)
+        # More trials than combinations runs each combination once
+        self.assertEqual(len(random_trials(self.space, 50, seed=7)), 6)
+
+    def test_score_is_the_best_validation_loss(self):
+        self.assertEqual(trial_score(SimpleNamespace(history=[{'val_loss': 0.9}, {'val_loss': 0.4}])), 0.4)
+        # Without a validation split the training loss ranks the trial
+        self.assertEqual(trial_score(SimpleNamespace(history=[{'loss': 0.7}, {'loss': 0.5}])), 0.5)
+        self.assertEqual(trial_score(SimpleNamespace(history=[])), float('inf'))
+
+
+class SweepPromotionTests(TestCase):
+    """A promoted sweep model replaces the one predictions are served from"""
+
+    def setUp(self):
+        tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        promote_settings = override_settings(ML_CONFIG={
+            **settings.ML_CONFIG,
+            'MODEL_PATH': tmp / 'ecg_model.h5',
+            'LABEL_ENCODER_PATH': tmp / 'label_encoder.pkl',
+            'CLASS_NAMES_PATH': tmp / 'class_names.txt',
+            'INFERENCE_MODE': 'thread',
+        })
+        promote_settings.enable()
+        self.addCleanup(promote_settings.disable)
+        settings.ML_CONFIG['MODEL_PATH'].write_bytes(b'current weights')
+        self.trial = SimpleNamespace(model_path=str(tmp / 'trial-000.h5'), params={'image_size': 224},
+                                     session_id='trial-1')
+        Path(self.trial.model_path).write_bytes(b'better trial weights')
+        save_model_metadata(self.trial.model_path, {'class_names': sorted(DEFAULT_CLASS_NAMES)})
+        self.image_path = str(tmp / 'ecg.png')
+        cv2.imwrite(self.image_path, np.zeros((40, 60, 3), dtype=np.uint8))
+
+    def test_promotion_changes_the_served_model(self):
+        model = MemoryEfficientECGModel()
+        self.assertEqual(model.model_path, str(settings.ML_CONFIG['MODEL_PATH']))
+        backend = StubBackend([0.1, 0.7, 0.15, 0.05])
+        with mock.patch('ecg_app.ml_model.load_backend', return_value=backend) as load:
+            [before] = model.predict_batch([self.image_path])
+            version = model.model_version
+
+            promote_model(self.trial, settings.ML_CONFIG['MODEL_PATH'])
+            [after] = model.predict_batch([self.image_path])
+
+        self.assertNotEqual(model.model_version, version)
+        self.assertEqual(load.call_count, 2)
+        # The promoted model's sidecar brings its own class order
+        self.assertEqual(before['predicted_class'], 'abnormal')
+        self.assertEqual(after['predicted_class'], 'mi')
+        self.assertTrue(settings.ML_CONFIG['CLASS_NAMES_PATH'].exists())
+
+
+class FakeProcess:
+    def __init__(self, pid):
+        self.pid = pid
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.exitcode is None
+
+
+class FakeConnection:
+    def __init__(self, on_send=None):
+        self.sent = []
+        self.on_send = on_send
+
+    def send(self, message):
+        self.sent.append(message)
+        if self.on_send is not None:
+            self.on_send(message)
+
+    def poll(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class InferencePoolWorkerTests(TestCase):
+    """Worker processes that die are noticed by the dispatcher, without spawning real ones"""
+
+    def setUp(self):
+        self.pool = ProcessInferencePool('ecg_model.h5', num_workers=2)
+        self.spawned = []
+        self.pool._spawn = self.spawn
+        self.pool.workers = [self.spawn(0), self.spawn(1)]
+        self.spawned = []
+
+    def spawn(self, slot):
+        self.spawned.append(slot)
+        return _Worker(FakeProcess(100 + len(self.spawned)), FakeConnection())
+
+    def submit(self, task_id, worker):
+        future = Future()
+        self.pool.pending[task_id] = future
+        worker.tasks.add(task_id)
+        return future
+
+    def ready(self, *workers):
+        for worker in workers:
+            self.pool._handle(worker, 'ready', None, None)
+
+    def test_results_reach_their_caller(self):
+        first, second = self.pool.workers
+        future = self.submit(1, first)
+        self.pool._handle(first, 'result', 1, 'probabilities')
+        self.assertEqual(future.result(timeout=0), 'probabilities')
+        self.assertEqual(first.tasks, set())
+
+    def test_dead_worker_fails_its_tasks_and_is_replaced(self):
+        first, second = self.pool.workers
+        self.ready(first, second)
+        lost = self.submit(1, first)
+        running = self.submit(2, second)
+        first.process.exitcode = -9
+        self.assertFalse(self.pool.is_running)
+
+        with self.assertLogs('ecg_app.inference_pool', 'ERROR'):
+            self.pool._check_workers()
+
+        with self.assertRaisesRegex(RuntimeError, 'exited with code -9'):
+            lost.result(timeout=0)
+        self.assertFalse(running.done())
+        self.assertEqual(self.spawned, [0])
+        self.assertIsNot(self.pool.workers[0], first)
+        self.assertTrue(self.pool.is_running)
+        self.assertEqual(self.pool.ready_workers, 1)
+        self.ready(self.pool.workers[0])
+        self.assertEqual(self.pool.ready_workers, 2)
+
+    def test_no_worker_left_fails_fast(self):
+        first, second = self.pool.workers
+        queued = self.submit(1, second)
+        first.process.exitcode = 0
+        second.process.exitcode = 1
+
+        with self.assertLogs('ecg_app.inference_pool', 'ERROR'):
+            self.pool._handle(first, 'error', None, 'Could not load model: missing file')
+            self.pool._check_workers()
+
+        self.assertEqual(self.spawned, [])
+        self.assertEqual(self.pool.workers, [])
+        self.assertFalse(self.pool.wait_until_ready(timeout=0))
+        self.assertEqual(len(self.pool.errors), 2)
+        with self.assertRaisesRegex(RuntimeError, 'exited with code 1'):
+            queued.result(timeout=0)
+        with self.assertRaisesRegex(RuntimeError, 'missing file'):
+            self.pool.predict(['ecg.png'])
+
+
+class SlowPreparationTrainer:
+    """Trainer whose data preparation outlasts the heartbeat timeout before any epoch runs"""
+    model_path = 'other_model.h5'
+    stop_reason = ''
+    resumed_from_epoch = 0
+
+    def __init__(self):
+        # Distinct heartbeats seen while "preparing data"
+        self.seen = set()
+
+    def train(self, epochs, batch_size, callbacks=None, resume=False):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            release_stale_sessions()
+            session = TrainingSession.objects.get()
+            if not session.is_active:
+                break
+            self.seen.add(session.updated_at)
+            if len(self.seen) >= 3:
+                break
+            time.sleep(0.05)
+        return None, {'accuracy': 0.9, 'loss': 0.3}
+
+
+@override_settings(ML_CONFIG={**settings.ML_CONFIG, 'TRAINING_HEARTBEAT_INTERVAL': 0.05,
+                              'TRAINING_HEARTBEAT_TIMEOUT': 0.5})
+class TrainingHeartbeatTests(TransactionTestCase):
+    """The heartbeat covers the whole job, not only the epochs"""
+
+    def test_session_stays_alive_before_the_first_epoch(self):
+        session = create_session(epochs=1)
+        trainer = SlowPreparationTrainer()
+        with mock.patch('ecg_app.training_jobs._progress_callback'):
+            results = run_training_job(session.pk, trainer=trainer, close_connection=False)
+
+        session.refresh_from_db()
+        self.assertEqual(results['accuracy'], 0.9)
+        self.assertEqual(session.status, 'completed')
+        self.assertGreaterEqual(len(trainer.seen), 3)
+
+    def test_silent_session_is_released(self):
+        session = create_session(epochs=1)
+        TrainingSession.objects.filter(pk=session.pk).update(updated_at=timezone.now() - timedelta(seconds=5))
+        self.assertEqual(release_stale_sessions(), 1)
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'failed')
+        self.assertFalse(session.is_active)
+
+
+class TrainingStatusAccessTests(TestCase):
+    """Users only see the progress of their own training jobs"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user('alice', password='secret')
+        self.session = TrainingSession.objects.create(session_id='a' * 32, user=self.owner, status='running')
+        self.url = reverse('api_training_status', args=[self.session.session_id])
+
+    def test_owner_can_poll(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'running')
+
+    def test_other_users_get_404(self):
+        self.client.force_login(User.objects.create_user('bob', password='secret'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_staff_can_poll_any_job(self):
+        self.client.force_login(User.objects.create_user('carol', password='secret', is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+@mock.patch('ecg_app.management.commands.train_ecg_model.signal')
+@mock.patch('ecg_app.management.commands.train_ecg_model.ECGModelTrainer')
+class TrainCommandOutputTests(TestCase):
+    """train_ecg_model reports a run without test results instead of failing on them"""
+
+    def setUp(self):
+        base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base_dir, ignore_errors=True)
+        base_settings = override_settings(BASE_DIR=Path(base_dir))
+        base_settings.enable()
+        self.addCleanup(base_settings.disable)
+        self.summary_path = Path(base_dir) / 'training_summary.txt'
+
+    def train(self, test_results, *args):
+        def finish(session_pk, **kwargs):
+            TrainingSession.objects.filter(pk=session_pk).update(is_active=False, status='completed')
+            return test_results
+
+        out = io.StringIO()
+        with mock.patch('ecg_app.management.commands.train_ecg_model.run_training_job', side_effect=finish):
+            call_command('train_ecg_model', '--epochs', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_results_are_reported(self, trainer_class, signal_module):
+        results = {'accuracy': 0.9, 'loss': 0.25, 'precision': 0.8, 'recall': 0.7, 'f1_score': 0.75}
+        output = self.train(results)
+        self.assertIn('Final Test Accuracy: 0.9000', output)
+        self.assertIn('Test F1-Score: 0.7500', self.summary_path.read_text())
+
+    def test_run_without_test_split(self, trainer_class, signal_module):
+        output = self.train({})
+        self.assertIn('TRAINING COMPLETED SUCCESSFULLY', output)
+        self.assertIn('No test results', output)
+        self.assertNotIn('Error', output)
+        self.assertIn('No test results', self.summary_path.read_text())
+
+    def test_test_only_without_test_images(self, trainer_class, signal_module):
+        trainer_class.return_value.prepare_data.return_value = ([], [], [], [], [], [])
+        out = io.StringIO()
+        call_command('train_ecg_model', '--test-only', stdout=out)
+        self.assertIn('No test results', out.getvalue())
+        trainer_class.return_value.evaluate.assert_not_called()
+
+
+class DatasetManifestTests(TestCase):
+    """refresh() only re-inspects changed files; check() reports what blocks training"""
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        for shade, folder in enumerate(settings.ML_CONFIG['DATASET_FOLDERS']):
+            (self.root / folder).mkdir()
+            self.write_image(f'{folder}/a.png', shade * 40)
+        self.manifest = DatasetManifest(self.root)
+
+    def write_image(self, key, shade, size=(20, 30)):
+        cv2.imwrite(str(self.root / key), np.full(size + (3,), shade, dtype=np.uint8))
+
+    def test_refresh_is_incremental(self):
+        folder = settings.ML_CONFIG['DATASET_FOLDERS'][0]
+        self.assertEqual(self.manifest.refresh(workers=2)['added'], 4)
+
+        self.write_image(f'{folder}/a.png', 200, size=(25, 30))
+        self.write_image(f'{folder}/b.png', 220)
+        (self.root / settings.ML_CONFIG['DATASET_FOLDERS'][1] / 'a.png').unlink()
+        with mock.patch('ecg_app.dataset_manifest.inspect_image', wraps=inspect_image) as inspect:
+            stats = self.manifest.refresh(workers=2)
+
+        self.assertEqual(stats, {'added': 1, 'updated': 1, 'unchanged': 2, 'removed': 1, 'corrupt': 0})
+        self.assertEqual(sorted(Path(call.args[0]).name for call in inspect.call_args_list), ['a.png', 'b.png'])
+        self.assertEqual(self.manifest.load()['entries'][f'{folder}/a.png']['height'], 25)
+
+    def test_ready_dataset(self):
+        self.manifest.refresh()
+        self.assertEqual(self.manifest.check(), (True, []))
+        paths, labels = self.manifest.files()
+        self.assertEqual(labels, ['normal', 'abnormal', 'mi', 'post_mi'])
+
+    def test_unindexed_dataset_is_not_ready(self):
+        ready, issues = self.manifest.check()
+        self.assertFalse(ready)
+        self.assertIn('not indexed', issues[0])
+
+    def test_check_reports_problems(self):
+        folders = settings.ML_CONFIG['DATASET_FOLDERS']
+        (self.root / folders[0] / 'broken.png').write_bytes(b'not an image')
+        # The same picture filed as two classes
+        shutil.copy(self.root / folders[2] / 'a.png', self.root / folders[3] / 'copy.png')
+        shutil.rmtree(self.root / folders[1])
+        self.assertEqual(self.manifest.refresh()['corrupt'], 1)
+
+        ready, issues = self.manifest.check()
+        self.assertFalse(ready)
+        self.assertEqual(len(issues), 3)
+        self.assertIn(f'Class folder missing: {folders[1]}', issues)
+        self.assertNotIn(str(self.root / folders[0] / 'broken.png'), self.manifest.files()[0])
+
+
+class DatasetCacheTests(TestCase):
+    """Shards are only written for changed files and read back without copies"""
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.cache = DatasetCache(self.root / 'cache', image_size=(16, 12), shard_size=2)
+        self.paths = [self.write_image(name, shade) for name, shade in (('a', 10), ('b', 20), ('c', 30))]
+        self.labels = ['normal', 'mi', 'abnormal']
+
+    def write_image(self, name, shade, size=(20, 30)):
+        path = str(self.root / f'{name}.png')
+        cv2.imwrite(path, np.full(size + (3,), shade, dtype=np.uint8))
+        return path
+
+    def shard_files(self):
+        return sorted(shard.name for shard in self.cache.cache_dir.glob('shard-*.npy'))
+
+    def test_refresh_is_incremental(self):
+        self.assertEqual(self.cache.refresh(self.paths, self.labels)['added'], 3)
+        self.assertEqual(self.shard_files(), ['shard-00000.npy', 'shard-00001.npy'])
+
+        self.write_image('b', 200, size=(25, 30))
+        os.remove(self.paths[2])
+        paths = self.paths[:2] + [self.write_image('d', 40)]
+        with mock.patch.object(self.cache.preprocessor, 'decode_into',
+                               wraps=self.cache.preprocessor.decode_into) as decode:
+            stats = self.cache.refresh(paths, ['normal', 'mi', 'post_mi'])
+
+        self.assertEqual(stats, {'added': 1, 'updated': 1, 'unchanged': 1, 'removed': 1, 'failed': 0})
+        self.assertEqual(sorted(Path(call.args[0]).name for call in decode.call_args_list), ['b.png', 'd.png'])
+        # c's shard has no live rows left; a still lives in the first one
+        self.assertEqual(self.shard_files(), ['shard-00000.npy', 'shard-00002.npy'])
+        images = self.cache.select(paths)
+        self.assertEqual([int(row[0, 0, 0]) for row in images.get_batch([0, 1, 2])], [10, 200, 40])
+        self.assertEqual(images.labels, ['normal', 'mi', 'post_mi'])
+
+    def test_batches_are_views_of_the_shards(self):
+        self.cache.refresh(self.paths, self.labels)
+        images = self.cache.select(self.paths)
+        shard = images.shards[0]
+
+        batch = images.get_batch([0, 1])
+        self.assertEqual(batch.shape, (2, 12, 16, 3))
+        self.assertTrue(np.shares_memory(batch, shard))
+        reordered = images.get_batch([1, 0])
+        self.assertFalse(np.shares_memory(reordered, shard))
+        self.assertEqual([int(row[0, 0, 0]) for row in reordered], [20, 10])
+
+        # Batches stop at the shard boundary so each one stays a view
+        batches = list(images.iter_batches(batch_size=8))
+        self.assertEqual([len(batch) for batch, _ in batches], [2, 1])
+        self.assertEqual([labels for _, labels in batches], [['normal', 'mi'], ['abnormal']])
+        self.assertTrue(all(isinstance(batch, np.memmap) for batch, _ in batches))
+
+    def test_select_reports_missing_images(self):
+        broken = self.root / 'broken.png'
+        broken.write_bytes(b'not an image')
+        with self.assertLogs('ecg_app.dataset_cache', 'WARNING'):
+            stats = self.cache.refresh(self.paths + [str(broken)], self.labels + ['mi'])
+        self.assertEqual(stats['failed'], 1)
+
+        unknown = str(self.root / 'unknown.png')
+        images = self.cache.select([self.paths[1], unknown, str(broken)], labels=['x', 'y', 'z'])
+        self.assertEqual(len(images), 1)
+        self.assertEqual(images.labels, ['x'])
+        self.assertEqual(images.missing, [(1, unknown), (2, str(broken))])
+
+        # The broken file is remembered and not decoded again until it changes
+        with mock.patch.object(self.cache.preprocessor, 'decode_into') as decode:
+            self.assertEqual(self.cache.refresh(self.paths + [str(broken)], self.labels + ['mi'])['unchanged'], 4)
+        decode.assert_not_called()
+
+
+class BrightnessModel:
+    """Stands in for a Keras model: the predicted class follows the image brightness"""
+
+    def __init__(self, num_classes):
+        self.num_classes = num_classes
+        self.batch_sizes = []
+
+    def predict_on_batch(self, batch):
+        self.batch_sizes.append(len(batch))
+        classes = np.minimum((batch.mean(axis=(1, 2, 3)) * self.num_classes).astype(int), self.num_classes - 1)
+        probabilities = np.full((len(batch), self.num_classes), 0.1 / (self.num_classes - 1), dtype=np.float32)
+        probabilities[np.arange(len(batch)), classes] = 0.9
+        return probabilities
+
+
+class ModelTesterTests(TestCase):
+    """Streaming evaluation of a test set in fixed-size chunks, and the HTML report built from it"""
+
+    # Brightness of an image the stub model assigns to each class
+    SHADES = {'abnormal': 10, 'mi': 80, 'normal': 150, 'post_mi': 230}
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.tester = ECGModelTester()
+        self.tester.class_names = sorted(DEFAULT_CLASS_NAMES)
+        self.tester.model = BrightnessModel(len(self.tester.class_names))
+        self.tester.preprocessor = ECGPreprocessor((16, 12))
+
+        # (drawn as, labelled as): one misclassified, one unreadable, one unknown label
+        samples = [('abnormal', 'abnormal'), ('mi', 'mi'), (None, 'mi'), ('normal', 'normal'),
+                   ('post_mi', 'post_mi'), ('abnormal', 'mi'), ('mi', 'unknown'), ('normal', 'normal'),
+                   ('post_mi', 'post_mi')]
+        self.paths, self.labels = [], []
+        for idx, (drawn, label) in enumerate(samples):
+            path = self.root / f'{idx}.png'
+            if drawn is None:
+                path.write_bytes(b'not an image')
+            else:
+                cv2.imwrite(str(path), np.full((20, 30, 3), self.SHADES[drawn], dtype=np.uint8))
+            self.paths.append(str(path))
+            self.labels.append(label)
+
+    def assertEvaluated(self, results):
+        class_ids = {name: idx for idx, name in enumerate(self.tester.class_names)}
+        evaluated = [0, 1, 3, 4, 5, 7, 8]
+        self.assertEqual(results['paths'], [self.paths[idx] for idx in evaluated])
+        self.assertEqual(results['y_true'].tolist(), [class_ids[self.labels[idx]] for idx in evaluated])
+        self.assertEqual(results['y_pred'].tolist(), [0, 1, 2, 3, 0, 2, 3])
+        self.assertEqual(results['num_evaluated'], 7)
+        self.assertEqual(int(results['confusion_matrix'].sum()), 7)
+        self.assertAlmostEqual(results['accuracy'], 6 / 7)
+        self.assertTrue(np.allclose(results['confidence'], 0.9))
+        self.assertEqual([(entry['path'], entry['label']) for entry in results['skipped']],
+                         [(self.paths[6], 'unknown'), (self.paths[2], 'mi')])
+
+    def test_batch_test_streams_chunks(self):
+        seen = []
+        results = self.tester.batch_test(self.paths, self.labels, batch_size=3,
+                                         on_batch=lambda paths, images, labels, predictions: seen.extend(paths))
+
+        self.assertEvaluated(results)
+        # Eight known labels in chunks of three; the unreadable file leaves a gap in the first
+        self.assertEqual(self.tester.model.batch_sizes, [2, 3, 2])
+        self.assertEqual(seen, results['paths'])
+        self.assertIn('Unknown class label', results['skipped'][0]['error'])
+
+    def test_batch_test_reads_the_dataset_cache(self):
+        cache = DatasetCache(self.root / 'cache', image_size=(16, 12))
+        with mock.patch('ecg_app.test_model.dataset_cache_for', return_value=cache), \
+                self.assertLogs('ecg_app.dataset_cache', 'WARNING'):
+            results = self.tester.batch_test(self.paths, self.labels, use_cache=True, batch_size=3)
+
+        self.assertEvaluated(results)
+        self.assertIn('not in the dataset cache', results['skipped'][1]['error'])
+
+    def test_nothing_readable(self):
+        self.assertIsNone(self.tester.batch_test([self.paths[2]], ['mi']))
+
+    def test_performance_report_is_written(self):
+        output_path = self.root / 'report.html'
+        report = self.tester.generate_performance_report(self.paths, self.labels, output_path=str(output_path),
+                                                         batch_size=3, max_samples=2)
+
+        self.assertEqual(report['output_path'], str(output_path))
+        self.assertEqual(report['num_test_samples'], 7)
+        self.assertAlmostEqual(report['overall_accuracy'], 6 / 7)
+        self.assertEqual(len(report['skipped']), 2)
+        self.assertEqual(sum(map(sum, report['confusion_matrix'])), 7)
+        self.assertEqual([path.name for path in self.root.glob('report.html*')], ['report.html'])
+
+        page = output_path.read_text(encoding='utf-8')
+        # Confusion matrix, class metrics and sample grid, all inlined
+        self.assertEqual(page.count('<img src="data:image/png;base64,'), 3)
+        self.assertIn('(2 skipped)', page)
+        self.assertIn(self.paths[2], page)
+
+    def test_report_without_samples(self):
+        output_path = self.root / 'report.html'
+        self.tester.generate_performance_report(self.paths, self.labels, output_path=str(output_path),
+                                                batch_size=4, max_samples=0)
+        page = output_path.read_text(encoding='utf-8')
+        self.assertEqual(page.count('<img src="data:image/png;base64,'), 2)
+        self.assertNotIn('Sample Predictions', page)
+
+
+class UserStatsCounterTests(TestCase):
+    """UserECGStats follows every way records change, including through stale instances"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+
+    def create(self, **fields):
+        fields = {'status': 'pending', **fields}
+        return ECGRecord.objects.create(user=self.user, image='uploaded_ecgs/test.png', **fields)
+
+    def counters(self):
+        return UserECGStats.objects.get(user=self.user)
+
+    def assertConsistent(self):
+        self.assertEqual(check_user_stats(), [])
+
+    def test_create(self):
+        self.create(status='completed', predicted_category='mi', confidence=80.0)
+        self.create()
+        counters = self.counters()
+        self.assertEqual((counters.total, counters.completed, counters.pending, counters.completed_mi), (2, 1, 1, 1))
+        self.assertConsistent()
+
+    def test_status_and_category_change(self):
+        record = self.create()
+        record.status, record.predicted_category, record.confidence = 'completed', 'normal', 90.0
+        record.save()
+        self.assertEqual(self.counters().completed_normal, 1)
+        record.predicted_category = 'abnormal'
+        record.save()
+        self.assertEqual((self.counters().completed_normal, self.counters().completed_abnormal), (0, 1))
+        self.assertConsistent()
+
+    def test_update_fields_only_counts_written_columns(self):
+        record = self.create()
+        record.status, record.predicted_category = 'failed', 'mi'
+        record.save(update_fields=['status'])
+        self.assertEqual(self.counters().mi, 0)
+        self.assertConsistent()
+
+    def test_saves_of_other_columns_skip_the_counters(self):
+        record = self.create()
+        record.notes = 'Reviewed'
+        with CaptureQueriesContext(connection) as queries:
+            record.save(update_fields=['notes'])
+        # Only the save itself: no row lock, stored-state read or counter update
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 1)
+        self.assertIn('"notes"', statements[0])
+
+    def test_stale_instance_save(self):
+        record = self.create()
+        stale = ECGRecord.objects.get(pk=record.pk)
+        record.status, record.predicted_category, record.confidence = 'completed', 'mi', 75.0
+        record.save()
+        # Written from an instance loaded before the prediction landed
+        stale.notes = 'reviewed'
+        stale.save()
+        self.assertEqual(self.counters().pending, 1)
+        self.assertConsistent()
+
+    def test_stale_instance_after_queue_claim(self):
+        record = self.create(content_hash='c' * 64)
+        with mock.patch('ecg_app.inference_queue.ecg_model', StubClassifier()):
+            InferenceQueue(num_workers=1).process(record.id)
+        self.assertConsistent()
+        record.notes = 'reviewed'
+        record.save(update_fields=['notes'])
+        self.assertEqual(self.counters().completed_mi, 1)
+        self.assertConsistent()
+
+    def test_delete(self):
+        record = self.create(status='completed', predicted_category='mi', confidence=60.0)
+        self.create()
+        stale = ECGRecord.objects.get(pk=record.pk)
+        record.status = 'failed'
+        record.save()
+        stale.delete()
+        self.assertEqual((self.counters().total, self.counters().failed, self.counters().completed), (1, 0, 0))
+        self.assertConsistent()
+
+    def test_queryset_delete(self):
+        for category in CATEGORIES:
+            self.create(status='completed', predicted_category=category, confidence=50.0)
+        keep = self.create()
+        ECGRecord.objects.filter(status='completed').delete()
+        counters = self.counters()
+        self.assertEqual((counters.total, counters.completed, counters.last_record_id), (1, 0, keep.pk))
+        self.assertConsistent()
+
+    def test_bulk_create(self):
+        records = [ECGRecord(user=self.user, image='uploaded_ecgs/test.png', status='completed',
+                             predicted_category='normal', confidence=70.0) for _ in range(3)]
+        ECGRecord.objects.bulk_create(records)
+        count_created_records(records)
+        self.assertEqual(self.counters().completed_normal, 3)
+        self.assertConsistent()
+
+    def test_rebuild_fixes_drift(self):
+        self.create(status='completed', predicted_category='mi', confidence=80.0)
+        UserECGStats.objects.filter(user=self.user).update(total=7, completed_mi=0)
+        self.assertEqual({field for _, field, _, _ in check_user_stats()}, {'total', 'completed_mi'})
+        rebuild_user_stats(self.user.pk)
+        self.assertConsistent()
+
+        UserECGStats.objects.all().delete()
+        self.assertEqual(check_user_stats(), [(self.user.pk, None, None, mock.ANY)])
+        rebuild_all_user_stats()
+        self.assertConsistent()
+
+    def test_check_command_catches_drift(self):
+        self.create()
+        call_command('rebuild_user_stats', '--check', stdout=io.StringIO())
+        UserECGStats.objects.filter(user=self.user).update(pending=0)
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_user_stats', '--check', stdout=out)
+        self.assertIn('pending is 0, expected 1', out.getvalue())
+
+        call_command('rebuild_user_stats', stdout=io.StringIO())
+        call_command('rebuild_user_stats', '--check', stdout=io.StringIO())
@@ -0,0 +1,106 @@
+# training_callbacks.py
+# Imports TensorFlow: only import this module from training code paths
+import json
+import logging
+import os
+import shutil
+
+import tensorflow as tf
+
+logger = logging.getLogger(__name__)
+
+LAST_CHECKPOINT = 'last.keras'
+BEST_WEIGHTS = 'best.weights.h5'
+STATE_FILE = 'state.json'
+
+# Counters that EarlyStopping / ReduceLROnPlateau reset in on_train_begin
+RESUMABLE_ATTRIBUTES = ('wait', 'best', 'best_epoch', 'cooldown_counter')
+
+
+def load_checkpoint(checkpoint_dir):
+    """Load the last checkpoint with its optimizer state. Returns ``(model, state)`` or ``(None, None)``."""
+    model_path = os.path.join(checkpoint_dir, LAST_CHECKPOINT)
+    try:
+        with open(os.path.join(checkpoint_dir, STATE_FILE)) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    if not os.path.exists(model_path):
+        return None, None
+    return tf.keras.models.load_model(model_path), state
+
+
+def clear_checkpoints(checkpoint_dir):
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+
+class TrainingCheckpoint(tf.keras.callbacks.Callback):
+    """Saves everything needed to resume training after an interruption.
+
+    Every ``every`` epochs the full model (weights and optimizer state) and a
+    state file with the epoch, metric history and the counters of the
+    early-stopping / plateau callbacks are written atomically. Best weights
+    by ``early_stopping``'s monitored metric are kept separately.
+    Must come after the callbacks it tracks in the callback list.
+    """
+
+    def __init__(self, checkpoint_dir, every=1, early_stopping=None, stateful_callbacks=(), state=None):
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.every = max(1, every)
+        self.early_stopping = early_stopping
+        self.stateful_callbacks = [cb for cb in (early_stopping, *stateful_callbacks) if cb is not None]
+        self.state = state or {'epoch': 0, 'history': {}, 'callbacks': {}}
+        self._epoch_lr = None
+
+    @property
+    def best_weights_path(self):
+        return os.path.join(self.checkpoint_dir, BEST_WEIGHTS)
+
+    def on_train_begin(self, logs=None):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        # The tracked callbacks have reset themselves by now; put back their resumed counters
+        for callback in self.stateful_callbacks:
+            for name, value in self.state['callbacks'].get(type(callback).__name__, {}).items():
+                setattr(callback, name, value)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_lr = float(tf.keras.backend.get_value(self.model.optimizer.learning_rate))
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = dict(logs or {})
+        logs.setdefault('learning_rate', self._epoch_lr)
+        for name, value in logs.items():
+            self.state['history'].setdefault(name, []).append(float(value))
+        self.state['epoch'] = epoch + 1
+        self.state['callbacks'] = {
+            type(callback).__name__: {
+                name: float(getattr(callback, name)) if name == 'best' else getattr(callback, name)
+                for name in RESUMABLE_ATTRIBUTES if hasattr(callback, name)
+            }
+            for callback in self.stateful_callbacks
+        }
+
+        if self.early_stopping is not None and self.early_stopping.wait == 0:
+            # The monitored metric improved this epoch
+            self.model.save_weights(self.best_weights_path)
+        if (epoch + 1) % self.every == 0 or self.model.stop_training:
+            self.save()
+
+    def save(self):
+        tmp_model = os.path.join(self.checkpoint_dir, 'last.tmp.keras')
+        self.model.save(tmp_model)
+        os.replace(tmp_model, os.path.join(self.checkpoint_dir, LAST_CHECKPOINT))
+
+        tmp_state = os.path.join(self.checkpoint_dir, STATE_FILE + '.tmp')
+        with open(tmp_state, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_state, os.path.join(self.checkpoint_dir, STATE_FILE))
+        logger.info(f"Saved training checkpoint at epoch {self.state['epoch']}")
+
+    def restore_best_weights(self):
+        """Load the best weights seen across all (resumed) runs into the model"""
+        if os.path.exists(self.best_weights_path):
+            self.model.load_weights(self.best_weights_path)
+            return True
+        return False
@@ -0,0 +1,194 @@
+# training_jobs.py
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .ml_model import ECGModelTrainer, ecg_model
+from .models import TrainingSession
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingInProgress(Exception):
+    """Raised when a training job is requested while another one is active"""
+
+    def __init__(self, session):
+        super().__init__(f"Training session {session.session_id} is already {session.status}")
+        self.session = session
+
+
+def active_session():
+    """The pending or running training session, if any"""
+    return TrainingSession.objects.filter(is_active=True).first()
+
+
+def release_stale_sessions():
+    """Fail active sessions whose worker stopped sending heartbeats (e.g. a killed process)"""
+    timeout = settings.ML_CONFIG.get('TRAINING_HEARTBEAT_TIMEOUT', 600)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return TrainingSession.objects.filter(is_active=True, updated_at__lt=cutoff).update(
+        is_active=False,
+        status='failed',
+        error_message='Training worker stopped responding',
+        completed_at=timezone.now(),
+    )
+
+
+def create_session(user=None, epochs=50, batch_size=32, head_only=False):
+    """Create the active TrainingSession.
+
+    The database enforces a single active session across all processes;
+    raises TrainingInProgress if another job holds it.
+    """
+    release_stale_sessions()
+    try:
+        with transaction.atomic():
+            session = TrainingSession.objects.create(
+                session_id=uuid.uuid4().hex,
+                user=user if user is not None and user.is_authenticated else None,
+                epochs=epochs,
+                batch_size=batch_size,
+                head_only=head_only,
+                is_active=True,
+            )
+    except IntegrityError:
+        session = active_session()
+        if session is None:
+            # The other job finished in the meantime
+            return create_session(user, epochs, batch_size, head_only)
+        raise TrainingInProgress(session)
+    return session
+
+
+def start_training_job(user=None, epochs=50, batch_size=32, head_only=False):
+    """Create a TrainingSession and train the served model for it on a background thread"""
+    session = create_session(user, epochs, batch_size, head_only)
+    thread = threading.Thread(
+        target=run_training_job,
+        args=(session.pk,),
+        name=f'ecg-training-{session.session_id[:8]}',
+        daemon=True,
+    )
+    thread.start()
+    return session
+
+
+def _heartbeat(session_pk, stop):
+    """Touch the session every TRAINING_HEARTBEAT_INTERVAL seconds until ``stop`` is set.
+
+    Runs beside the whole job, so data preparation and evaluation keep the
+    session alive as well as the epochs do.
+    """
+    interval = settings.ML_CONFIG.get('TRAINING_HEARTBEAT_INTERVAL', 30)
+    try:
+        while not stop.wait(interval):
+            TrainingSession.objects.filter(pk=session_pk).update(updated_at=timezone.now())
+    finally:
+        connection.close()
+
+
+def _progress_callback(session_pk, started):
+    """Keras callback that writes per-epoch metrics to the session"""
+    import tensorflow as tf
+
+    state = {'epoch_started': started, 'history': []}
+
+    def on_epoch_begin(epoch, logs=None):
+        state['epoch_started'] = time.monotonic()
+
+    def on_epoch_end(epoch, logs=None):
+        entry = {name: float(value) for name, value in (logs or {}).items()}
+        entry['epoch'] = epoch + 1
+        entry['seconds'] = round(time.monotonic() - state['epoch_started'], 3)
+        state['history'].append(entry)
+        TrainingSession.objects.filter(pk=session_pk).update(
+            current_epoch=epoch + 1,
+            history=state['history'],
+            loss=entry.get('loss'),
+            accuracy=entry.get('accuracy'),
+            updated_at=timezone.now(),
+        )
+
+    return tf.keras.callbacks.LambdaCallback(
+        on_epoch_begin=on_epoch_begin,
+        on_epoch_end=on_epoch_end,
+    )
+
+
+def run_training_job(session_pk, trainer=None, resume=False, close_connection=True):
+    """Train a model for a TrainingSession and record the outcome.
+
+    Trains the served model unless another ECGModelTrainer is given.
+    Returns the test results, or None if training failed (the session holds
+    the error). An interruption is recorded, then re-raised.
+    """
+    started = time.monotonic()
+    TrainingSession.objects.filter(pk=session_pk).update(status='running', started_at=timezone.now())
+    session = TrainingSession.objects.get(pk=session_pk)
+    if trainer is None:
+        trainer = ECGModelTrainer(model_path=ecg_model.model_path, class_names=ecg_model.class_names)
+    serves_model = os.path.abspath(trainer.model_path) == os.path.abspath(ecg_model.model_path)
+    if serves_model:
+        ecg_model.training_in_progress = True
+    test_results = None
+    interrupted = None
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat,
+        args=(session_pk, stop_heartbeat),
+        name=f'ecg-training-heartbeat-{session.session_id[:8]}',
+        daemon=True,
+    )
+    heartbeat.start()
+    try:
+        callbacks = [_progress_callback(session_pk, started)]
+        if session.head_only:
+            _, test_results = trainer.train_head(session.epochs, session.batch_size, callbacks=callbacks)
+        else:
+            _, test_results = trainer.train(session.epochs, session.batch_size, callbacks=callbacks, resume=resume)
+        if serves_model:
+            ecg_model.replace_model(trainer.model)
+
+        final = {'status': 'completed', 'stop_reason': trainer.stop_reason or ''}
+        for field in ('accuracy', 'loss', 'precision', 'recall', 'f1_score'):
+            if field in test_results:
+                final[field] = test_results[field]
+        logger.info(f"Training session {session.session_id} completed")
+    except (KeyboardInterrupt, SystemExit) as e:
+        interrupted = e
+        final = {
+            'status': 'failed',
+            'stop_reason': 'Interrupted; resume from the last checkpoint with --resume',
+            'error_message': 'Training was interrupted',
+        }
+    except Exception as e:
+        logger.exception(f"Training session {session.session_id} failed")
+        final = {'status': 'failed', 'error_message': str(e)}
+    finally:
+        if serves_model:
+            ecg_model.training_in_progress = False
+        stop_heartbeat.set()
+        heartbeat.join()
+
+    try:
+        TrainingSession.objects.filter(pk=session_pk).update(
+            is_active=False,
+            resumed_from_epoch=trainer.resumed_from_epoch,
+            training_time=time.monotonic() - started,
+            completed_at=timezone.now(),
+            **final,
+        )
+    finally:
+        if close_connection:
+            # The job thread ends here; do not leave its connection open
+            connection.close()
+    if interrupted is not None:
+        raise interrupted
+    return test_results
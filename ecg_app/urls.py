@@ -14,17 +14,24 @@ urlpatterns = [
     path('dashboard/', views.dashboard_view, name='dashboard'),
     path('profile/', views.profile_view, name='profile'),
     path('upload/', views.upload_ecg_view, name='upload'),
+    path('upload/batch/', views.batch_upload_ecg_view, name='batch_upload'),
     path('result/<int:ecg_id>/', views.ecg_result_view, name='ecg_result'),
     path('history/', views.ecg_history_view, name='history'),
     path('admin-dashboard/', views.admin_dashboard_view, name='admin_dashboard'),
     path('admin-login/', views.admin_login_view, name='admin_login'),
 
     # In urls.py, add this to urlpatterns:
-    path('export-csv/', views.export_history_csv_view, name='export_history_csv_view'),
+    path('export/', views.export_history_view, name='export_history'),
+    path('export-csv/', views.export_history_view, name='export_history_csv_view'),
 
     # API URLs (User actions only)
     path('api/train/', views.api_train_model, name='api_train'),
+    path('api/train/<str:session_id>/status/', views.api_training_status, name='api_training_status'),
     path('api/user-stats/', views.api_user_stats, name='api_user_stats'),
+    path('api/ready/', views.api_readiness, name='api_readiness'),
+    path('api/ecg/<int:ecg_id>/status/', views.api_ecg_status, name='api_ecg_status'),
+    path('api/history/', views.api_history, name='api_history'),
+    path('api/prediction-cache/stats/', views.api_prediction_cache_stats, name='api_prediction_cache_stats'),
 
     # Password management (keep these for user convenience)
     path('password-reset/', 
@@ -1,26 +1,28 @@
-import numpy as np
-import cv2
-import tensorflow as tf
-from tensorflow import keras
 import joblib
 from django.conf import settings
 
+from .inference_backends import load_backend
+from .predictions import PredictionBatch, label_table
+from .preprocessing import preprocessor, preprocessor_for
+
 class ECGClassifier:
     def __init__(self):
         self.model = None
         self.label_encoder = None
         self.class_names = []
-        self.load_model()
+        self.preprocessor = preprocessor
+        # The model is loaded on first use, not at import time
         
     def load_model(self):
         """Load the trained model and artifacts"""
         try:
-            # Load model
-            self.model = keras.models.load_model(str(settings.ML_CONFIG['MODEL_PATH']))
+            # Load model with the configured inference backend
+            self.model = load_backend(settings.ML_CONFIG['MODEL_PATH'])
+            self.preprocessor = preprocessor_for(self.model.input_shape)
             
             # Load label encoder
             self.label_encoder = joblib.load(str(settings.ML_CONFIG['LABEL_ENCODER_PATH']))
-            self.class_names = list(self.label_encoder.classes_)
+            self.class_names = label_table(self.label_encoder)
             
             print(f"ECG Classifier loaded successfully.")
             print(f"Classes: {self.class_names}")
@@ -33,28 +35,8 @@ class ECGClassifier:
     
     def preprocess_image(self, image):
         """Preprocess image for prediction"""
-        # If image is file path
-        if isinstance(image, str):
-            img = cv2.imread(image)
-            if img is None:
-                raise ValueError(f"Could not read image from {image}")
-        else:
-            # Assume image is numpy array or file object
-            img = image
-        
-        # Convert to RGB
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # Resize
-        img = cv2.resize(img, (224, 224))
-        
-        # Normalize
-        img = img / 255.0
-        
-        # Add batch dimension
-        img = np.expand_dims(img, axis=0)
-        
-        return img
+        # Accepts a file path, raw bytes, file object or BGR numpy array
+        return self.preprocessor.preprocess(image)
     
     def predict(self, image):
         """Make prediction on ECG image"""
@@ -66,64 +48,31 @@ class ECGClassifier:
         preprocessed_img = self.preprocess_image(image)
         
         # Make prediction
-        predictions = self.model.predict(preprocessed_img, verbose=0)
-        predicted_class_idx = np.argmax(predictions, axis=1)[0]
-        confidence = float(np.max(predictions))
-        
-        # Get class name
-        predicted_class = self.label_encoder.inverse_transform([predicted_class_idx])[0]
-        
-        # Get all probabilities
-        all_probs = {}
-        for idx, prob in enumerate(predictions[0]):
-            class_name = self.label_encoder.inverse_transform([idx])[0]
-            all_probs[class_name] = float(prob)
-        
-        return {
-            'predicted_class': predicted_class,
-            'confidence': confidence,
-            'all_probabilities': all_probs,
-            'predicted_class_idx': predicted_class_idx
-        }
+        predictions = self.model.predict(preprocessed_img)
+        return PredictionBatch(predictions, self.class_names)[0]
     
-    def batch_predict(self, images):
-        """Make predictions on multiple images"""
+    def batch_predict(self, images, skip_errors=False):
+        """Make predictions on multiple images
+        
+        Returns a PredictionBatch: a sequence of result dicts (built on
+        access) backed by NumPy arrays of class indices, confidences and
+        probabilities. With skip_errors, unreadable images get None in the
+        result instead of failing the whole batch.
+        """
         if self.model is None:
             if not self.load_model():
                 raise ValueError("Model could not be loaded")
         
-        # Preprocess all images
-        preprocessed_images = []
-        for image in images:
-            preprocessed_img = self.preprocess_image(image)
-            preprocessed_images.append(preprocessed_img[0])  # Remove batch dimension
-        
-        if not preprocessed_images:
-            return []
+        if not images:
+            return PredictionBatch([], self.class_names)
         
-        X = np.array(preprocessed_images)
+        # Preprocess all images into one float32 batch
+        X, failed = self.preprocessor.preprocess_batch(images, skip_errors=skip_errors)
         
         # Make predictions
-        predictions = self.model.predict(X, verbose=0)
-        
-        results = []
-        for pred in predictions:
-            predicted_class_idx = np.argmax(pred)
-            confidence = float(pred[predicted_class_idx])
-            predicted_class = self.label_encoder.inverse_transform([predicted_class_idx])[0]
-            
-            all_probs = {}
-            for idx, prob in enumerate(pred):
-                class_name = self.label_encoder.inverse_transform([idx])[0]
-                all_probs[class_name] = float(prob)
-            
-            results.append({
-                'predicted_class': predicted_class,
-                'confidence': confidence,
-                'all_probabilities': all_probs
-            })
+        predictions = self.model.predict(X) if len(X) else []
         
-        return results
+        return PredictionBatch(predictions, self.class_names, failed)
 
 # Singleton instance
 ecg_classifier = ECGClassifier()
\ No newline at end of file
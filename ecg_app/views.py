@@ -1,22 +1,33 @@
 # views.py - CORRECTED VERSION
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.core.paginator import Paginator
-from django.db.models import Count, Avg, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.db.models import Count, Q
 from django.contrib.admin.views.decorators import staff_member_required
 import json
+from urllib.parse import urlencode
 from datetime import datetime, timedelta
 from django.contrib.auth.models import User
 
-from .forms import UserRegisterForm, UserLoginForm, UserUpdateForm, ECGUploadForm
-from .models import UserProfile, ECGRecord
+from django.conf import settings
+from .forms import UserRegisterForm, UserLoginForm, UserUpdateForm, ECGUploadForm, ECGBatchUploadForm
+from .models import UserProfile, ECGRecord, TrainingSession
 from .ml_model import ecg_model
+from .inference_queue import inference_queue, apply_prediction
+from .prediction_cache import prediction_cache, hash_upload
+from .batch_upload import process_batch_upload, summarize_outcomes
+from .training_jobs import TrainingInProgress, start_training_job
+from .stats import day_start, get_user_stats
+from .history import (
+    HISTORY_PAGE_SIZE, MAX_HISTORY_PAGE_SIZE, InvalidCursor, active_filters, filter_history, history_page,
+    history_stats, record_json
+)
+from .exports import EXPORT_FORMATS, parquet_available, stream_export
 from django.views.decorators.csrf import csrf_exempt
-import csv
-from django.http import HttpResponse
 
 # ========== AUTHENTICATION VIEWS ==========
 
@@ -93,68 +104,27 @@ def dashboard_view(request):
     """Main dashboard view"""
     user = request.user
     
-    # Get user's ECG stats
-    user_ecgs = ECGRecord.objects.filter(user=user)
-    total_ecgs = user_ecgs.count()
+    # Counts from the counters row, activity in one GROUP BY
+    stats = get_user_stats(user)
+    completed_by_category = stats['completed_by_category']
     
-    # Get counts by status
-    completed_ecgs = user_ecgs.filter(status='completed').count()
-    processing_ecgs = user_ecgs.filter(status='processing').count()
-    failed_ecgs = user_ecgs.filter(status='failed').count()
-    
-    # Get counts by category
-    normal_ecgs = user_ecgs.filter(predicted_category='normal', status='completed').count()
-    abnormal_ecgs = user_ecgs.filter(predicted_category='abnormal', status='completed').count()
-    mi_ecgs = user_ecgs.filter(predicted_category='mi', status='completed').count()
-    post_mi_ecgs = user_ecgs.filter(predicted_category='post_mi', status='completed').count()
-    
-    # Calculate average confidence for completed analyses
-    avg_confidence = user_ecgs.filter(status='completed').aggregate(
-        avg_conf=Avg('confidence')
-    )['avg_conf'] or 0
-    
-    # Get latest ECG ID for "View Last Result" button
-    latest_ecg = user_ecgs.order_by('-upload_date').first()
-    latest_ecg_id = latest_ecg.id if latest_ecg else None
-    
-    # Get recent ECGs (last 10)
-    recent_ecgs = user_ecgs.order_by('-upload_date')[:10]
-    
-    # Get recent activity (last 7 days)
-    today = datetime.now().date()
-    recent_activity = []
-    
-    for i in range(6, -1, -1):  # Last 7 days including today
-        date = today - timedelta(days=i)
-        count = user_ecgs.filter(
-            upload_date__date=date
-        ).count()
-        
-        # Calculate height for chart visualization
-        max_count = max(1, user_ecgs.filter(
-            upload_date__date__gte=today - timedelta(days=6)
-        ).count())
-        height = int((count / max(1, max_count)) * 100) + 20  # 20-120px
-        
-        recent_activity.append({
-            'date': date.strftime('%a'),  # Short day name
-            'count': count,
-            'height': min(height, 120)  # Cap at 120px
-        })
+    # Get recent ECGs (last 10); the first one backs the "View Last Result" button
+    recent_ecgs = list(ECGRecord.objects.filter(user=user).order_by('-upload_date')[:10])
+    latest_ecg_id = recent_ecgs[0].id if recent_ecgs else None
     
     context = {
-        'total_ecgs': total_ecgs,
-        'completed_ecgs': completed_ecgs,
-        'processing_ecgs': processing_ecgs,
-        'failed_ecgs': failed_ecgs,
-        'normal_ecgs': normal_ecgs,
-        'abnormal_ecgs': abnormal_ecgs,
-        'mi_ecgs': mi_ecgs,
-        'post_mi_ecgs': post_mi_ecgs,
-        'avg_confidence': avg_confidence,
+        'total_ecgs': stats['total'],
+        'completed_ecgs': stats['by_status']['completed'],
+        'processing_ecgs': stats['by_status']['processing'],
+        'failed_ecgs': stats['by_status']['failed'],
+        'normal_ecgs': completed_by_category['normal'],
+        'abnormal_ecgs': completed_by_category['abnormal'],
+        'mi_ecgs': completed_by_category['mi'],
+        'post_mi_ecgs': completed_by_category['post_mi'],
+        'avg_confidence': stats['avg_confidence'],
         'latest_ecg_id': latest_ecg_id,
         'recent_ecgs': recent_ecgs,
-        'recent_activity': recent_activity,
+        'recent_activity': stats['activity'],
         'user': user,
     }
     
@@ -166,12 +136,12 @@ def profile_view(request):
     user = request.user
     
     # Get user statistics
-    user_ecgs = ECGRecord.objects.filter(user=user)
-    total_ecgs = user_ecgs.count()
+    stats = get_user_stats(user, recent=False)
+    total_ecgs = stats['total']
     
     # Get category counts
-    normal_ecgs = user_ecgs.filter(predicted_category='normal', status='completed').count()
-    abnormal_ecgs = user_ecgs.filter(status='completed').exclude(predicted_category='normal').count()
+    normal_ecgs = stats['completed_by_category']['normal']
+    abnormal_ecgs = stats['by_status']['completed'] - normal_ecgs
     
     # Calculate success rate (percentage of normal results)
     if total_ecgs > 0:
@@ -180,7 +150,7 @@ def profile_view(request):
         success_rate = 0
     
     # Get recent ECGs for activity timeline
-    recent_ecgs = user_ecgs.order_by('-upload_date')[:5]
+    recent_ecgs = ECGRecord.objects.filter(user=user).order_by('-upload_date')[:5]
     
     if request.method == 'POST':
         user_form = UserUpdateForm(request.POST, instance=request.user)
@@ -214,40 +184,36 @@ def upload_ecg_view(request):
         if form.is_valid():
             ecg_record = form.save(commit=False)
             ecg_record.user = request.user
-            ecg_record.status = 'processing'
+            ecg_record.content_hash = hash_upload(form.cleaned_data['image'])
             
+            # Re-uploads of an already analysed scan are answered from the cache
+            cached_result = prediction_cache.get(ecg_record.content_hash, ecg_model.model_version)
+            if cached_result:
+                apply_prediction(ecg_record, cached_result)
+                ecg_record.save()
+                messages.success(request, f'Analysis completed with {ecg_record.confidence:.1f}% confidence')
+                return redirect('ecg_result', ecg_id=ecg_record.id)
+            
+            ecg_record.status = 'pending'
             ecg_record.save()
             
-            try:
-                # Make prediction using the model
-                result = ecg_model.predict(ecg_record.ecg_file.path)
-                
-                if result:
-                    # Update record with prediction
-                    ecg_record.predicted_category = result['predicted_class']
-                    ecg_record.confidence = result['confidence'] * 100
-                    ecg_record.status = 'completed'
-                    
-                    # Store probabilities as JSON
-                    all_probs = result.get('all_probabilities', {})
-                    ecg_record.probabilities = json.dumps(all_probs)
-                    
-                    ecg_record.save()
-                    
-                    messages.success(request, f'Analysis completed with {ecg_record.confidence:.1f}% confidence')
-                    return redirect('ecg_result', ecg_id=ecg_record.id)
-                else:
-                    ecg_record.status = 'failed'
-                    ecg_record.save()
-                    messages.error(request, 'Failed to analyze ECG. Please try again.')
-                    return redirect('upload')
-                
-            except Exception as e:
+            # Hand the record to the inference workers; the response does not wait for the model
+            if not inference_queue.submit(ecg_record.id):
                 ecg_record.status = 'failed'
-                ecg_record.error_message = str(e)
-                ecg_record.save()
-                messages.error(request, f'Error processing image: {str(e)}')
+                ecg_record.save(update_fields=['status'])
+                messages.error(request, 'The analysis queue is full. Please try again in a moment.')
                 return redirect('upload')
+            
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse({
+                    'record_id': ecg_record.id,
+                    'status': ecg_record.status,
+                    'status_url': reverse('api_ecg_status', args=[ecg_record.id]),
+                    'result_url': reverse('ecg_result', args=[ecg_record.id]),
+                }, status=202)
+            
+            messages.info(request, 'ECG uploaded. Analysis is running in the background.')
+            return redirect('ecg_result', ecg_id=ecg_record.id)
         else:
             # Form is invalid, show errors
             for field, errors in form.errors.items():
@@ -261,6 +227,48 @@ def upload_ecg_view(request):
         'recent_ecgs': recent_ecgs
     })
 
+@login_required
+def batch_upload_ecg_view(request):
+    """Upload many ECGs at once and analyse them in batches"""
+    max_files = settings.ML_CONFIG.get('BATCH_UPLOAD_MAX_FILES', 500)
+    is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+    outcomes = None
+    summary = None
+    
+    if request.method == 'POST':
+        form = ECGBatchUploadForm(request.POST, request.FILES, max_files=max_files)
+        if form.is_valid():
+            outcomes = process_batch_upload(
+                request.user,
+                form.cleaned_data['images'],
+                notes=form.cleaned_data['notes'],
+            )
+            summary = summarize_outcomes(outcomes)
+            
+            if is_ajax:
+                return JsonResponse({'summary': summary, 'results': outcomes})
+            
+            messages.success(
+                request,
+                f"Processed {summary['total']} files: {summary['completed']} analysed, "
+                f"{summary['pending']} queued, {summary['failed'] + summary['rejected']} failed."
+            )
+        else:
+            if is_ajax:
+                return JsonResponse({'errors': form.errors}, status=400)
+            for field, errors in form.errors.items():
+                for error in errors:
+                    messages.error(request, f'{field}: {error}')
+    else:
+        form = ECGBatchUploadForm(max_files=max_files)
+    
+    return render(request, 'ecg_app/batch_upload.html', {
+        'form': form,
+        'outcomes': outcomes,
+        'summary': summary,
+        'max_files': max_files,
+    })
+
 @login_required
 def ecg_result_view(request, ecg_id):
     """View ECG analysis result"""
@@ -268,22 +276,13 @@ def ecg_result_view(request, ecg_id):
     
     # Prepare data for visualization
     probabilities = {}
-    if ecg_record.probabilities:
-        try:
-            probs_dict = json.loads(ecg_record.probabilities)
-            probabilities = {
-                'Normal ECG': probs_dict.get('normal', 0) * 100,
-                'Abnormal Heartbeat': probs_dict.get('abnormal', 0) * 100,
-                'Myocardial Infarction': probs_dict.get('mi', 0) * 100,
-                'Post MI History': probs_dict.get('post_mi', 0) * 100,
-            }
-        except:
-            probabilities = {
-                'Normal ECG': ecg_record.confidence if ecg_record.predicted_category == 'normal' else 0,
-                'Abnormal Heartbeat': ecg_record.confidence if ecg_record.predicted_category == 'abnormal' else 0,
-                'Myocardial Infarction': ecg_record.confidence if ecg_record.predicted_category == 'mi' else 0,
-                'Post MI History': ecg_record.confidence if ecg_record.predicted_category == 'post_mi' else 0,
-            }
+    if ecg_record.status == 'completed':
+        probabilities = {
+            'Normal ECG': ecg_record.normal_prob * 100,
+            'Abnormal Heartbeat': ecg_record.abnormal_prob * 100,
+            'Myocardial Infarction': ecg_record.mi_prob * 100,
+            'Post MI History': ecg_record.post_mi_prob * 100,
+        }
     
     context = {
         'record': ecg_record,
@@ -293,82 +292,21 @@ def ecg_result_view(request, ecg_id):
 
 @login_required
 def ecg_history_view(request):
-    """View all ECG records"""
-    ecg_records = ECGRecord.objects.filter(user=request.user).order_by('-upload_date')
-    
-    # Apply filters
-    status_filter = request.GET.get('status', 'all')
-    if status_filter != 'all':
-        ecg_records = ecg_records.filter(status=status_filter)
-    
-    category_filter = request.GET.get('category', 'all')
-    if category_filter != 'all':
-        ecg_records = ecg_records.filter(predicted_category=category_filter)
-    
-    # Date range filter
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    if start_date:
-        ecg_records = ecg_records.filter(upload_date__date__gte=start_date)
-    if end_date:
-        ecg_records = ecg_records.filter(upload_date__date__lte=end_date)
-    
-    # Calculate statistics
-    total_records = ecg_records.count()
-    completed_count = ECGRecord.objects.filter(user=request.user, status='completed').count()
-    processing_count = ECGRecord.objects.filter(user=request.user, status='processing').count()
-    failed_count = ECGRecord.objects.filter(user=request.user, status='failed').count()
-    
-    # Calculate average confidence
-    avg_confidence = ECGRecord.objects.filter(
-        user=request.user, 
-        status='completed',
-        confidence__isnull=False
-    ).aggregate(avg_conf=Avg('confidence'))['avg_conf'] or 0
+    """View all ECG records, newest first, one cursor page at a time"""
+    ecg_records = filter_history(request.user, request.GET)
     
-    # Get category counts
-    category_counts = {}
-    category_data = ECGRecord.objects.filter(
-        user=request.user, 
-        predicted_category__isnull=False
-    ).values('predicted_category').annotate(count=Count('predicted_category'))
-    
-    for item in category_data:
-        category_counts[item['predicted_category']] = item['count']
-    
-    # Get most common category
-    most_common = ECGRecord.objects.filter(
-        user=request.user, 
-        predicted_category__isnull=False
-    ).values('predicted_category').annotate(
-        count=Count('predicted_category')
-    ).order_by('-count').first()
-    
-    most_common_category = most_common['predicted_category'] if most_common else None
-    
-    # This month count
-    this_month = datetime.now().replace(day=1)
-    this_month_count = ECGRecord.objects.filter(
-        user=request.user,
-        upload_date__gte=this_month
-    ).count()
-    
-    # Pagination
-    paginator = Paginator(ecg_records, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Keyset pagination; further pages are loaded from api_history as the user scrolls
+    try:
+        records, next_cursor = history_page(ecg_records, request.GET.get('cursor'))
+    except InvalidCursor:
+        records, next_cursor = history_page(ecg_records)
     
     context = {
-        'page_obj': page_obj,
-        'total_records': total_records,
-        'completed_count': completed_count,
-        'processing_count': processing_count,
-        'failed_count': failed_count,
-        'avg_confidence': avg_confidence,
+        'records': records,
+        'next_cursor': next_cursor,
+        'filter_query': urlencode(active_filters(request.GET)),
         'categories': ECGRecord.CATEGORY_CHOICES,
-        'category_counts': category_counts,
-        'most_common_category': most_common_category,
-        'this_month_count': this_month_count,
+        **history_stats(request.user, ecg_records),
     }
     return render(request, 'ecg_app/history.html', context)
 
@@ -377,43 +315,133 @@ def ecg_history_view(request):
 @login_required
 @csrf_exempt
 def api_train_model(request):
-    """Simple training endpoint"""
+    """Start a background training job; poll its status_url for progress"""
     if request.method == 'POST':
         try:
-            success = ecg_model.train_model()
-            if success:
-                return JsonResponse({
-                    'status': 'success',
-                    'message': 'Model trained successfully',
-                    'model_info': ecg_model.get_model_info()
-                })
-            else:
-                return JsonResponse({
-                    'status': 'error',
-                    'message': 'Training failed'
-                }, status=500)
-        except Exception as e:
+            epochs = int(request.POST.get('epochs', 30))
+            batch_size = int(request.POST.get('batch_size', 16))
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'epochs and batch_size must be integers'}, status=400)
+        
+        try:
+            session = start_training_job(
+                request.user,
+                epochs=epochs,
+                batch_size=batch_size,
+                head_only=request.POST.get('head_only') in ('1', 'true', 'on'),
+            )
+        except TrainingInProgress as e:
             return JsonResponse({
                 'status': 'error',
-                'message': str(e)
-            }, status=500)
+                'message': 'A training job is already running',
+                'session_id': e.session.session_id,
+                'status_url': reverse('api_training_status', args=[e.session.session_id]),
+            }, status=409)
+        
+        return JsonResponse({
+            'status': 'accepted',
+            'session_id': session.session_id,
+            'status_url': reverse('api_training_status', args=[session.session_id]),
+        }, status=202)
     return JsonResponse({'error': 'Only POST allowed'}, status=405)
 
+@login_required
+def api_training_status(request, session_id):
+    """Poll the progress of a training job; staff can poll every user's jobs"""
+    sessions = TrainingSession.objects.all()
+    if not request.user.is_staff:
+        sessions = sessions.filter(user=request.user)
+    session = get_object_or_404(sessions, session_id=session_id)
+    return JsonResponse({
+        'session_id': session.session_id,
+        'status': session.status,
+        'epochs': session.epochs,
+        'batch_size': session.batch_size,
+        'current_epoch': session.current_epoch,
+        'progress': session.progress,
+        'history': session.history,
+        'accuracy': session.accuracy,
+        'loss': session.loss,
+        'precision': session.precision,
+        'recall': session.recall,
+        'f1_score': session.f1_score,
+        'training_time': session.training_time,
+        'started_at': session.started_at.isoformat() if session.started_at else None,
+        'completed_at': session.completed_at.isoformat() if session.completed_at else None,
+        'last_heartbeat': session.updated_at.isoformat(),
+        'error_message': session.error_message,
+        'stop_reason': session.stop_reason,
+        'resumed_from_epoch': session.resumed_from_epoch,
+        'head_only': session.head_only,
+    })
+
+@login_required
+def api_ecg_status(request, ecg_id):
+    """Poll the analysis status of an uploaded ECG"""
+    ecg_record = get_object_or_404(ECGRecord, id=ecg_id, user=request.user)
+    data = {
+        'record_id': ecg_record.id,
+        'status': ecg_record.status,
+    }
+    if ecg_record.status == 'completed':
+        data.update({
+            'predicted_category': ecg_record.predicted_category,
+            'confidence': ecg_record.confidence,
+            'result_url': reverse('ecg_result', args=[ecg_record.id]),
+        })
+    elif ecg_record.status == 'failed':
+        data['error_message'] = ecg_record.error_message
+    return JsonResponse(data)
+
+@login_required
+def api_history(request):
+    """One page of the user's ECG history for infinite scroll.
+
+    Takes the history page filters plus ``cursor`` (the ``next_cursor`` of
+    the previous page) and ``limit``. Header statistics are only computed
+    for the first page, so later pages cost a single indexed query.
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), 1), MAX_HISTORY_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'limit must be an integer'}, status=400)
+    
+    cursor = request.GET.get('cursor')
+    ecg_records = filter_history(request.user, request.GET)
+    try:
+        records, next_cursor = history_page(ecg_records, cursor, size=limit)
+    except InvalidCursor as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    data = {
+        'records': [record_json(record) for record in records],
+        'html': render_to_string('ecg_app/partials/history_rows.html', {'records': records}, request=request),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+    }
+    if not cursor:
+        data['stats'] = history_stats(request.user, ecg_records)
+    return JsonResponse(data)
+
+def api_readiness(request):
+    """Readiness probe: 503 until the model has been loaded and warmed up"""
+    data = {
+        'ready': ecg_model.is_ready,
+        'warmup_seconds': ecg_model.warmup_seconds,
+        'warmup_error': ecg_model.warmup_error,
+    }
+    return JsonResponse(data, status=200 if ecg_model.is_ready else 503)
+
 @login_required
 def api_user_stats(request):
     """Get user statistics"""
-    user_ecgs = ECGRecord.objects.filter(user=request.user)
-    total_ecgs = user_ecgs.count()
+    stats = get_user_stats(request.user, recent=False)
+    total_ecgs = stats['total']
     
     # Get category distribution
-    category_distribution = {}
-    category_data = user_ecgs.filter(
-        status='completed', 
-        predicted_category__isnull=False
-    ).values('predicted_category').annotate(count=Count('predicted_category'))
-    
-    for item in category_data:
-        category_distribution[item['predicted_category']] = item['count']
+    category_distribution = {
+        category: count for category, count in stats['completed_by_category'].items() if count
+    }
     
     # Calculate normal and abnormal counts
     normal_ecgs = category_distribution.get('normal', 0)
@@ -436,6 +464,11 @@ def api_user_stats(request):
 
 # ========== ADMIN VIEWS ==========
 
+@staff_member_required
+def api_prediction_cache_stats(request):
+    """Hit/miss counters of this process's prediction cache"""
+    return JsonResponse(prediction_cache.stats())
+
 @staff_member_required
 def admin_dashboard_view(request):
     """Admin dashboard - staff only"""
@@ -468,7 +501,9 @@ def admin_dashboard_view(request):
     growth_rate = 15
     
     # ECGs today and new users today
-    ecgs_today = ECGRecord.objects.filter(upload_date__date=today).count()
+    ecgs_today = ECGRecord.objects.filter(
+        upload_date__gte=day_start(today), upload_date__lt=day_start(today + timedelta(days=1))
+    ).count()
     new_users_today = User.objects.filter(date_joined__date=today).count()
     
     context = {
@@ -508,27 +543,24 @@ def admin_login_view(request):
     
     return render(request, 'ecg_app/auth/admin_login.html')
 
-# In views.py, add this function:
 @login_required
-def export_history_csv_view(request):
-    """Export ECG history as CSV"""
-    ecg_records = ECGRecord.objects.filter(user=request.user).order_by('-upload_date')
-    
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="ecg_history.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['ID', 'Date', 'Filename', 'Prediction', 'Confidence', 'Status', 'Notes'])
-    
-    for ecg in ecg_records:
-        writer.writerow([
-            ecg.id,
-            ecg.upload_date.strftime('%Y-%m-%d %H:%M:%S'),
-            ecg.original_filename,
-            ecg.predicted_category,
-            f"{ecg.confidence}%" if ecg.confidence else "",
-            ecg.status,
-            ecg.notes or ""
-        ])
-    
-    return response
\ No newline at end of file
+def export_history_view(request):
+    """Stream the user's ECG history as CSV, NDJSON or Parquet, optionally gzipped.
+
+    Takes the history page filters, plus ``format`` and ``gzip``.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        messages.error(request, f'Unknown export format: {export_format}')
+        return redirect('history')
+    if export_format == 'parquet' and not parquet_available():
+        messages.error(request, 'Parquet export is not available: pyarrow is not installed on the server.')
+        return redirect('history')
+    
+    ecg_records = filter_history(request.user, request.GET).order_by('-upload_date', '-id')
+    chunks, content_type, filename = stream_export(
+        ecg_records, export_format, compress=request.GET.get('gzip') in ('1', 'true')
+    )
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
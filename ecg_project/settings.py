@@ -119,9 +119,98 @@ ML_CONFIG = {
     
     # Class labels (used for prediction)
     'CLASS_LABELS': ['normal', 'abnormal', 'mi', 'post_mi'],
+
+    # Training data: stratified split fractions and the file-path shuffle buffer
+    'VALIDATION_SPLIT': 0.15,
+    'TEST_SPLIT': 0.15,
+    'SHUFFLE_BUFFER': 10000,
+
+    # Decoded training images kept in memory-mapped shards (build_dataset_cache)
+    'DATASET_CACHE_ENABLED': False,
+    'DATASET_CACHE_DIR': BASE_DIR / 'dataset_cache',
+    'DATASET_CACHE_SHARD_SIZE': 1024,
+
+    # Per-file integrity index of DATASET_PATH (index_dataset). When present,
+    # training and evaluation take their file lists from it; re-run
+    # index_dataset after changing the dataset. Other dataset directories
+    # get a manifest.json inside them.
+    'DATASET_MANIFEST_PATH': BASE_DIR / 'dataset_manifest.json',
+
+    # Background training jobs: heartbeat period, and how long without one
+    # before an active session is considered abandoned
+    'TRAINING_HEARTBEAT_INTERVAL': 30,
+    'TRAINING_HEARTBEAT_TIMEOUT': 600,
+
+    # Checkpointing, early stopping and learning-rate schedule
+    'CHECKPOINT_DIR': BASE_DIR / 'checkpoints',
+    'CHECKPOINT_EVERY': 1,
+    'EARLY_STOPPING_PATIENCE': 5,
+    'EARLY_STOPPING_MIN_DELTA': 1e-3,
+    'REDUCE_LR_PATIENCE': 2,
+    'REDUCE_LR_FACTOR': 0.5,
+    'MIN_LEARNING_RATE': 1e-6,
+
+    # Frozen-backbone features for head-only retraining (train_ecg_model --head-only)
+    'EMBEDDING_CACHE_DIR': BASE_DIR / 'embedding_cache',
+
+    # Hyperparameter sweeps (sweep_ecg_model): default search space, trial
+    # output directory and math-library threads per trial process
+    'SWEEP_SPACE': {
+        'learning_rate': [1e-3, 3e-4],
+        'batch_size': [16, 32],
+        'image_size': [160, 224],
+        'architecture': ['small', 'base'],
+    },
+    'SWEEP_DIR': BASE_DIR / 'sweeps',
+    'SWEEP_THREADS_PER_TRIAL': 4,
+
+    # Evaluation reports (evaluate_ecg_model): output directory, figure
+    # resolution and number of sample predictions shown
+    'REPORT_DIR': BASE_DIR / 'reports',
+    'REPORT_DPI': 100,
+    'REPORT_SAMPLES': 12,
+
+    # Background inference workers used by the upload view
+    'INFERENCE_WORKERS': 2,
+    'INFERENCE_QUEUE_SIZE': 256,
+
+    # Micro-batching of concurrent predictions (each inference worker takes
+    # up to BATCH_MAX_SIZE queued records at once and submits them together)
+    'BATCHING_ENABLED': True,
+    'BATCH_MAX_SIZE': 16,
+    'BATCH_MAX_WAIT_MS': 10,
+
+    # In-process LRU entries of the prediction cache (the DB tier is unbounded)
+    'PREDICTION_CACHE_SIZE': 1024,
+
+    # Load the model and run a dummy forward pass when a WSGI/ASGI worker starts
+    'WARMUP_ON_STARTUP': True,
+
+    # Serving runtime: 'keras', or a lightweight export created with
+    # `manage.py export_ecg_model` ('tflite' or 'onnx')
+    'INFERENCE_BACKEND': 'keras',
+    'INFERENCE_THREADS': None,  # None uses every core
+
+    # 'thread' runs the model inside the web process; 'process' runs it in a
+    # pool of worker processes fed through shared memory
+    'INFERENCE_MODE': 'thread',
+    'INFERENCE_PROCESSES': None,  # None uses one process per core
+
+    # Multi-file uploads: files per submission, and files per prediction batch
+    'BATCH_UPLOAD_MAX_FILES': 500,
+    'BATCH_UPLOAD_CHUNK_SIZE': 32,
 }
 
+# Allow batch uploads of up to ML_CONFIG['BATCH_UPLOAD_MAX_FILES'] files
+DATA_UPLOAD_MAX_NUMBER_FILES = ML_CONFIG['BATCH_UPLOAD_MAX_FILES']
+
 # Authentication URLs
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
-LOGOUT_REDIRECT_URL = 'home'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'home'
+
+# Import-time budget of the web process, enforced by `check_import_budget`
+WEB_IMPORT_BUDGET = {
+    'MAX_SECONDS': 2.0,
+    'FORBIDDEN_MODULES': ['tensorflow', 'keras', 'sklearn', 'matplotlib', 'seaborn'],
+}
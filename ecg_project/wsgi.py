@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecg_project.settings')
 
 application = get_wsgi_application()
+
+# Warm the ECG model up and start the inference workers before traffic arrives.
+# The worker reports not-ready on /api/ready/ until the warm-up has finished.
+from ecg_app.inference_queue import inference_queue  # noqa: E402
+from ecg_app.ml_model import ecg_model  # noqa: E402
+
+ecg_model.start_warm_up()
+inference_queue.start()
@@ -17,6 +17,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecg_project.settings')
 import django
 django.setup()
 
+from ecg_app.dataset_manifest import dataset_manifest
 from ecg_app.ml_model import ecg_model
 
 def startup_check():
@@ -27,31 +28,38 @@ def startup_check():
     
     # Check model status
     print("\n🔍 Checking model status...")
-    model_info = model_manager.get_model_info()
+    model_info = ecg_model.get_model_info()
     
-    if model_info['model_exists']:
+    if model_info['is_trained']:
         print(f"✅ Model already exists and is loaded")
         print(f"   Classes: {model_info.get('class_names', [])}")
-        if 'accuracy' in model_info:
+        if model_info.get('accuracy') is not None:
             print(f"   Accuracy: {model_info['accuracy']:.4f}")
     else:
         print("⚠️  No trained model found")
         
         # Check dataset
         print("\n📁 Checking dataset...")
-        dataset_ready, issues = model_manager.check_dataset_ready()
+        if dataset_manifest.dataset_path.is_dir():
+            # Incremental: only new or changed files are inspected
+            stats = dataset_manifest.refresh()
+            print(f"   Indexed dataset: {stats['added']} new, {stats['updated']} changed, "
+                  f"{stats['removed']} removed, {stats['corrupt']} corrupt")
+        dataset_ready, issues = ecg_model.check_dataset_ready()
         
         if dataset_ready:
             print("✅ Dataset is ready for training")
+            for issue in issues:
+                print(f"   ⚠️  {issue}")
             print("\n🚀 Starting automatic model training...")
             
             # Train model automatically
-            success = model_manager.auto_train_if_needed()
+            success = ecg_model.auto_train_if_needed()
             
             if success:
                 print("\n🎉 Model trained successfully!")
-                model_info = model_manager.get_model_info()
-                print(f"   Accuracy: {model_info.get('accuracy', 0):.4f}")
+                model_info = ecg_model.get_model_info()
+                print(f"   Accuracy: {model_info.get('accuracy') or 0:.4f}")
             else:
                 print("\n❌ Failed to train model automatically")
                 print("   Please check your dataset and try manual training")